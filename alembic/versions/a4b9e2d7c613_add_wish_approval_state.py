@@ -0,0 +1,73 @@
+"""Add materialized wish approval state
+
+Revision ID: a4b9e2d7c613
+Revises: f2c8d61e9b37
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4b9e2d7c613'
+down_revision: Union[str, Sequence[str], None] = 'f2c8d61e9b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('wishes', sa.Column('approvals_required', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('wishes', sa.Column('approvals_received', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('wishes', sa.Column('has_conditional_approval', sa.Boolean(), server_default='false', nullable=False))
+    op.create_table('wish_pending_approvers',
+        sa.Column('wish_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['wish_id'], ['wishes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('wish_id', 'user_id')
+    )
+    op.create_index('ix_wish_pending_approvers_user_id', 'wish_pending_approvers', ['user_id'], unique=False)
+
+    # Meglévő kívánságok állapotának feltöltése a jóváhagyásokból
+    op.execute("""
+        UPDATE wishes w SET
+            approvals_received = a.received,
+            has_conditional_approval = a.conditional
+        FROM (
+            SELECT wish_id,
+                   count(*) FILTER (WHERE status IN ('approved', 'conditional')) AS received,
+                   bool_or(status = 'conditional') AS conditional
+            FROM wish_approvals GROUP BY wish_id
+        ) a
+        WHERE a.wish_id = w.id
+    """)
+    op.execute("""
+        UPDATE wishes w SET approvals_required = GREATEST(
+            (SELECT count(*) FROM users u
+             WHERE u.family_id = w.family_id AND u.role IN ('Családfő', 'Szülő') AND u.id <> w.owner_user_id),
+            CASE WHEN o.role IN ('Családfő', 'Szülő') THEN 1 ELSE 0 END
+        )
+        FROM users o
+        WHERE o.id = w.owner_user_id
+    """)
+    op.execute("""
+        INSERT INTO wish_pending_approvers (wish_id, user_id)
+        SELECT w.id, u.id
+        FROM wishes w
+        JOIN users u ON u.family_id = w.family_id AND u.role IN ('Családfő', 'Szülő') AND u.id <> w.owner_user_id
+        WHERE w.status = 'pending' AND w.deleted_at IS NULL
+          AND NOT EXISTS (SELECT 1 FROM wish_approvals a WHERE a.wish_id = w.id AND a.approver_user_id = u.id)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_wish_pending_approvers_user_id', table_name='wish_pending_approvers')
+    op.drop_table('wish_pending_approvers')
+    op.drop_column('wishes', 'has_conditional_approval')
+    op.drop_column('wishes', 'approvals_received')
+    op.drop_column('wishes', 'approvals_required')
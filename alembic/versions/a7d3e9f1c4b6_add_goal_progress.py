@@ -0,0 +1,81 @@
+"""Add goal progress
+
+Revision ID: a7d3e9f1c4b6
+Revises: f6c9d2e8a3b5
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9f1c4b6'
+down_revision: Union[str, Sequence[str], None] = 'f6c9d2e8a3b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('goal_progress',
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('contributed', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('withdrawn', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('contribution_count', sa.Integer(), nullable=False),
+    sa.Column('first_contribution_at', sa.DateTime(), nullable=True),
+    sa.Column('last_contribution_at', sa.DateTime(), nullable=True),
+    sa.Column('average_monthly', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('projected_completion_date', sa.Date(), nullable=True),
+    sa.Column('on_track', sa.Boolean(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('account_id')
+    )
+    # Egyszeri feltöltés a meglévő átutalásokból (ugyanaz a számítás, mint a goal_progress modulban)
+    op.execute("""
+        WITH sums AS (
+            SELECT t.account_id,
+                   COALESCE(SUM(t.amount) FILTER (WHERE t.type = 'bevétel'), 0) AS contributed,
+                   COALESCE(SUM(t.amount) FILTER (WHERE t.type = 'kiadás'), 0) AS withdrawn,
+                   COUNT(*) FILTER (WHERE t.type = 'bevétel') AS contribution_count,
+                   MIN(t.date) FILTER (WHERE t.type = 'bevétel')::timestamp AS first_contribution_at,
+                   MAX(t.date) FILTER (WHERE t.type = 'bevétel')::timestamp AS last_contribution_at
+            FROM transactions t
+            JOIN accounts a ON a.id = t.account_id
+            WHERE a.type = 'cél' AND t.transfer_id IS NOT NULL
+            GROUP BY t.account_id
+        ), rates AS (
+            SELECT s.*,
+                   CASE WHEN s.first_contribution_at IS NULL THEN NULL
+                        ELSE ROUND((s.contributed - s.withdrawn) / GREATEST(1.0,
+                             EXTRACT(EPOCH FROM (now()::timestamp - s.first_contribution_at)) / 86400 / 30.4375)::numeric, 2)
+                   END AS average_monthly
+            FROM sums s
+        ), projected AS (
+            SELECT r.*,
+                   CASE WHEN a.goal_amount IS NULL THEN NULL
+                        WHEN a.goal_amount - a.balance <= 0 THEN CURRENT_DATE
+                        WHEN r.average_monthly > 0
+                             THEN CURRENT_DATE + CEIL((a.goal_amount - a.balance) / r.average_monthly * 30.4375)::int
+                   END AS projected_completion_date,
+                   a.goal_amount, a.goal_date
+            FROM rates r
+            JOIN accounts a ON a.id = r.account_id
+        )
+        INSERT INTO goal_progress (account_id, contributed, withdrawn, contribution_count, first_contribution_at,
+                                   last_contribution_at, average_monthly, projected_completion_date, on_track)
+        SELECT account_id, contributed, withdrawn, contribution_count, first_contribution_at,
+               last_contribution_at, average_monthly, projected_completion_date,
+               CASE WHEN goal_date IS NULL OR goal_amount IS NULL THEN NULL
+                    ELSE COALESCE(projected_completion_date <= goal_date, false)
+               END
+        FROM projected
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('goal_progress')
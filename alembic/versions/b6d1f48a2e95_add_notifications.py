@@ -0,0 +1,58 @@
+"""Add notifications inbox
+
+Revision ID: b6d1f48a2e95
+Revises: a4b9e2d7c613
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d1f48a2e95'
+down_revision: Union[str, Sequence[str], None] = 'a4b9e2d7c613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('message', sa.String(length=500), nullable=False),
+        sa.Column('link', sa.String(length=255), nullable=True),
+        sa.Column('entity_type', sa.String(length=30), nullable=True),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('read_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notifications_user_id_id', 'notifications', ['user_id', 'id'], unique=False)
+    op.create_index('ix_notifications_user_unread', 'notifications', ['user_id'], unique=False,
+                    postgresql_where=sa.text('read_at IS NULL'))
+    op.create_index('ix_notifications_entity', 'notifications', ['entity_type', 'entity_id'], unique=False)
+
+    # A már jóváhagyásra váró kívánságokról a várakozó szülők postafiókjába
+    op.execute("""
+        INSERT INTO notifications (user_id, type, message, link, entity_type, entity_id)
+        SELECT p.user_id, 'wish_submitted', 'Jóváhagyásra vár: ' || w.name, '/wishes?tab=pending', 'wish', w.id
+        FROM wish_pending_approvers p JOIN wishes w ON w.id = p.wish_id
+    """)
+    # A "hány kívánság vár rám" számlálást a postafiók váltotta ki; a többi
+    # hozzáférés (wish_id, user_id) szerinti, azt az elsődleges kulcs fedi
+    op.drop_index('ix_wish_pending_approvers_user_id', table_name='wish_pending_approvers')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_wish_pending_approvers_user_id', 'wish_pending_approvers', ['user_id'], unique=False)
+    op.drop_index('ix_notifications_entity', table_name='notifications')
+    op.drop_index('ix_notifications_user_unread', table_name='notifications')
+    op.drop_index('ix_notifications_user_id_id', table_name='notifications')
+    op.drop_table('notifications')
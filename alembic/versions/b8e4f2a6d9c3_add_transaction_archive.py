@@ -0,0 +1,76 @@
+"""Add transaction archive
+
+Revision ID: b8e4f2a6d9c3
+Revises: a7d3e9f1c4b6
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4f2a6d9c3'
+down_revision: Union[str, Sequence[str], None] = 'a7d3e9f1c4b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_COLUMNS = "id, description, amount, type, date, account_id, user_id, category_id, transfer_id, is_family_expense"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('transactions_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('type', sa.String(), nullable=True),
+    sa.Column('date', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('account_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('transfer_id', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('is_family_expense', sa.Boolean(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_transactions_archive_account_id_date', 'transactions_archive', ['account_id', 'date'], unique=False)
+    op.create_table('transaction_monthly_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('is_transfer', sa.Boolean(), nullable=False),
+    sa.Column('is_family_expense', sa.Boolean(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_transaction_monthly_rollups_month_account_id', 'transaction_monthly_rollups', ['month', 'account_id'], unique=False)
+    # Az élő és az archivált sorok együtt (models.TransactionAll)
+    op.execute(f"""
+        CREATE VIEW transactions_all AS
+        SELECT {_COLUMNS}, false AS is_archived FROM transactions
+        UNION ALL
+        SELECT {_COLUMNS}, true AS is_archived FROM transactions_archive
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP VIEW IF EXISTS transactions_all")
+    # Az archivált sorok visszakerülnek az élő táblába, különben elvesznének
+    op.execute(f"INSERT INTO transactions ({_COLUMNS}) SELECT {_COLUMNS} FROM transactions_archive")
+    op.drop_index('ix_transaction_monthly_rollups_month_account_id', table_name='transaction_monthly_rollups')
+    op.drop_table('transaction_monthly_rollups')
+    op.drop_index('ix_transactions_archive_account_id_date', table_name='transactions_archive')
+    op.drop_table('transactions_archive')
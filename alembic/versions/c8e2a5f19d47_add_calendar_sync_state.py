@@ -0,0 +1,109 @@
+"""Add calendar sync state
+
+Revision ID: c8e2a5f19d47
+Revises: b6d1f48a2e95
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e2a5f19d47'
+down_revision: Union[str, Sequence[str], None] = 'b6d1f48a2e95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# A 080be5b3b1bb óta a tábla eltért a modelltől (provider / is_enabled /
+# sync_status / calendar_url, kötelező color), miközben a kód a type / status /
+# sync_enabled oszlopokat használja. Itt visszaállítjuk a modell szerinti
+# oszlopokat, a meglévő adatokat átmásolva.
+_LEGACY_COLUMNS = ('provider', 'is_enabled', 'sync_status', 'calendar_url',
+                   'client_id', 'client_secret', 'token_expires_at', 'color')
+
+
+def _reconcile_integrations() -> None:
+    op.add_column('calendar_integrations', sa.Column('type', sa.String(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('status', sa.String(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('sync_enabled', sa.Boolean(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('external_calendar_id', sa.String(), nullable=True))
+    op.execute("""
+        UPDATE calendar_integrations SET
+            type = coalesce(provider, 'school'),
+            status = CASE WHEN sync_status IN ('connected', 'pending', 'error') THEN sync_status
+                          WHEN sync_status IN ('synced', 'success', 'active') THEN 'connected'
+                          ELSE 'pending' END,
+            sync_enabled = coalesce(is_enabled, true),
+            url = coalesce(url, calendar_url)
+    """)
+    op.alter_column('calendar_integrations', 'type', nullable=False)
+    op.alter_column('calendar_integrations', 'status', nullable=False)
+    op.alter_column('calendar_integrations', 'sync_enabled', nullable=False)
+    for column in _LEGACY_COLUMNS:
+        op.drop_column('calendar_integrations', column)
+
+
+def _restore_legacy_integrations() -> None:
+    op.add_column('calendar_integrations', sa.Column('provider', sa.VARCHAR(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('is_enabled', sa.BOOLEAN(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('sync_status', sa.VARCHAR(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('calendar_url', sa.VARCHAR(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('client_id', sa.VARCHAR(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('client_secret', sa.VARCHAR(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('token_expires_at', sa.DateTime(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('color', sa.VARCHAR(), nullable=True))
+    op.execute("""
+        UPDATE calendar_integrations SET
+            provider = type, is_enabled = sync_enabled, sync_status = status,
+            calendar_url = url, color = '#3b82f6'
+    """)
+    op.alter_column('calendar_integrations', 'provider', nullable=False)
+    op.alter_column('calendar_integrations', 'is_enabled', nullable=False)
+    op.alter_column('calendar_integrations', 'sync_status', nullable=False)
+    op.alter_column('calendar_integrations', 'color', nullable=False)
+    op.drop_column('calendar_integrations', 'external_calendar_id')
+    op.drop_column('calendar_integrations', 'sync_enabled')
+    op.drop_column('calendar_integrations', 'status')
+    op.drop_column('calendar_integrations', 'type')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _reconcile_integrations()
+    op.add_column('calendar_integrations', sa.Column('etag', sa.String(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('last_modified', sa.String(), nullable=True))
+    op.add_column('calendar_integrations', sa.Column('sync_error', sa.Text(), nullable=True))
+
+    op.add_column('synced_events', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    # Esetleges duplikátumok a (integráció, külső azonosító) egyediség előtt
+    op.execute("""
+        DELETE FROM synced_events a USING synced_events b
+        WHERE a.calendar_integration_id = b.calendar_integration_id
+          AND a.external_event_id = b.external_event_id AND a.id < b.id
+    """)
+    op.create_unique_constraint('uq_synced_event_integration_external_id', 'synced_events',
+                                ['calendar_integration_id', 'external_event_id'])
+    op.create_index('ix_synced_events_integration_start', 'synced_events',
+                    ['calendar_integration_id', 'start_datetime'], unique=False)
+    # Az integráció törlése az eseményeit is viszi
+    op.drop_constraint('synced_events_calendar_integration_id_fkey', 'synced_events', type_='foreignkey')
+    op.create_foreign_key('synced_events_calendar_integration_id_fkey', 'synced_events', 'calendar_integrations',
+                          ['calendar_integration_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('synced_events_calendar_integration_id_fkey', 'synced_events', type_='foreignkey')
+    op.create_foreign_key('synced_events_calendar_integration_id_fkey', 'synced_events', 'calendar_integrations',
+                          ['calendar_integration_id'], ['id'])
+    op.drop_index('ix_synced_events_integration_start', table_name='synced_events')
+    op.drop_constraint('uq_synced_event_integration_external_id', 'synced_events', type_='unique')
+    op.drop_column('synced_events', 'content_hash')
+    op.drop_column('calendar_integrations', 'sync_error')
+    op.drop_column('calendar_integrations', 'last_modified')
+    op.drop_column('calendar_integrations', 'etag')
+    _restore_legacy_integrations()
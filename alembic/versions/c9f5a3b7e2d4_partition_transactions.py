@@ -0,0 +1,125 @@
+"""Partition transactions by month
+
+Revision ID: c9f5a3b7e2d4
+Revises: b8e4f2a6d9c3
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from datetime import date, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f5a3b7e2d4'
+down_revision: Union[str, Sequence[str], None] = 'b8e4f2a6d9c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_COLUMNS = "id, description, amount, type, date, account_id, user_id, category_id, transfer_id, is_family_expense"
+# A migráció ennyi hónapot hoz létre előre; a továbbiakat a partitions modul (ütemező) pótolja
+_MONTHS_AHEAD = 3
+_INDEXES = (
+    ('ix_transactions_id', ['id']),
+    ('ix_transactions_transfer_id', ['transfer_id']),
+    ('ix_transactions_account_id_date', ['account_id', 'date']),
+)
+
+
+def _next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _columns(date_nullable: bool):
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('transactions_id_seq'::regclass)"), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.Column('date', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=date_nullable),
+        sa.Column('account_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('transfer_id', sa.UUID(), nullable=True),
+        sa.Column('is_family_expense', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    ]
+
+
+def _set_aside(name: str):
+    """ A régi tábla félreállítása: a sorozat és az indexnevek felszabadítása az újnak. """
+    op.execute("DROP VIEW IF EXISTS transactions_all")
+    op.execute(f"ALTER TABLE transactions RENAME TO {name}")
+    op.execute(f"ALTER TABLE {name} RENAME CONSTRAINT transactions_pkey TO {name}_pkey")
+    op.execute(f"ALTER TABLE {name} ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY NONE")
+    for index, _ in _INDEXES:
+        op.drop_index(index, table_name=name)
+
+
+def _finish(old_name: str):
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+    op.drop_table(old_name)
+    for index, columns in _INDEXES:
+        op.create_index(index, 'transactions', columns, unique=False)
+    op.execute(f"""
+        CREATE VIEW transactions_all AS
+        SELECT {_COLUMNS}, false AS is_archived FROM transactions
+        UNION ALL
+        SELECT {_COLUMNS}, true AS is_archived FROM transactions_archive
+    """)
+    op.execute("ANALYZE transactions")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Particionált táblára nem hivatkozhat idegen kulcs csak az id-ra (az egyediségnek
+    # a date-et is tartalmaznia kell); a hivatkozást az alkalmazás tartja karban
+    op.drop_constraint('expected_expenses_transaction_id_fkey', 'expected_expenses', type_='foreignkey')
+    _set_aside('transactions_unpartitioned')
+
+    op.create_table('transactions',
+    *_columns(date_nullable=False),
+    sa.PrimaryKeyConstraint('id', 'date', name='transactions_pkey'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    # Havi partíciók a legrégebbi tranzakciótól néhány hónappal előre, a tartományon
+    # kívül eső (pl. távoli jövőbeli) soroknak default partíció
+    oldest = op.get_bind().execute(sa.text("SELECT min(date) FROM transactions_unpartitioned")).scalar()
+    last = date.today().replace(day=1)
+    for _ in range(_MONTHS_AHEAD):
+        last = _next_month(last)
+    month = oldest.date().replace(day=1) if oldest else date.today().replace(day=1)
+    while month <= last:
+        following = _next_month(month)
+        op.execute(f"CREATE TABLE transactions_p{month:%Y%m} PARTITION OF transactions "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')")
+        month = following
+    op.execute("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT")
+
+    op.execute(f"""
+        INSERT INTO transactions ({_COLUMNS})
+        SELECT id, description, amount, type, COALESCE(date, now()), account_id, user_id, category_id,
+               transfer_id, is_family_expense
+        FROM transactions_unpartitioned
+    """)
+    _finish('transactions_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _set_aside('transactions_partitioned')
+
+    op.create_table('transactions',
+    *_columns(date_nullable=True),
+    sa.PrimaryKeyConstraint('id', name='transactions_pkey')
+    )
+    op.execute(f"INSERT INTO transactions ({_COLUMNS}) SELECT {_COLUMNS} FROM transactions_partitioned")
+    # A partíciók a szülő táblával együtt törlődnek
+    _finish('transactions_partitioned')
+    op.create_foreign_key('expected_expenses_transaction_id_fkey', 'expected_expenses', 'transactions',
+                          ['transaction_id'], ['id'])
@@ -0,0 +1,42 @@
+"""Add account balance snapshots
+
+Revision ID: d1e5a0c7b2f4
+Revises: c3df56041a21
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1e5a0c7b2f4'
+down_revision: Union[str, Sequence[str], None] = 'c3df56041a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('account_balance_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.Date(), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_id', 'as_of', name='uq_account_balance_snapshot')
+    )
+    op.create_index(op.f('ix_account_balance_snapshots_id'), 'account_balance_snapshots', ['id'], unique=False)
+    # A "legutolsó pillanatkép az adott napig" és a delta-szkennelés indexei
+    op.create_index('ix_transactions_account_id_date', 'transactions', ['account_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_account_id_date', table_name='transactions')
+    op.drop_index(op.f('ix_account_balance_snapshots_id'), table_name='account_balance_snapshots')
+    op.drop_table('account_balance_snapshots')
@@ -0,0 +1,42 @@
+"""Add synced event recurrence
+
+Revision ID: d4a7f3b8c2e1
+Revises: c8e2a5f19d47
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7f3b8c2e1'
+down_revision: Union[str, Sequence[str], None] = 'c8e2a5f19d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('synced_events', sa.Column('rrule', sa.Text(), nullable=True))
+    op.add_column('synced_events', sa.Column('exdates', sa.Text(), nullable=True))
+    op.add_column('synced_events', sa.Column('recurrence_id', sa.DateTime(), nullable=True))
+    op.add_column('synced_events', sa.Column('recurrence_end', sa.DateTime(), nullable=True))
+    op.add_column('synced_events', sa.Column('tzid', sa.String(), nullable=True))
+    op.create_index('ix_synced_events_recurring', 'synced_events', ['calendar_integration_id'], unique=False,
+                    postgresql_where=sa.text('rrule IS NOT NULL'))
+    # A következő szinkron minden eseményt újraír, hogy az ismétlődési adatok is bekerüljenek
+    op.execute("UPDATE synced_events SET content_hash = NULL")
+    op.execute("UPDATE calendar_integrations SET etag = NULL, last_modified = NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_synced_events_recurring', table_name='synced_events')
+    op.drop_column('synced_events', 'tzid')
+    op.drop_column('synced_events', 'recurrence_end')
+    op.drop_column('synced_events', 'recurrence_id')
+    op.drop_column('synced_events', 'exdates')
+    op.drop_column('synced_events', 'rrule')
@@ -0,0 +1,32 @@
+"""Add account pending purge
+
+Revision ID: d6a2c8f4b1e9
+Revises: c9f5a3b7e2d4
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6a2c8f4b1e9'
+down_revision: Union[str, Sequence[str], None] = 'c9f5a3b7e2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('accounts', sa.Column('pending_purge_at', sa.DateTime(), nullable=True))
+    # Az ütemező csak a függő törléseket keresi: kis részleges index
+    op.create_index('ix_accounts_pending_purge_at', 'accounts', ['pending_purge_at'], unique=False,
+                    postgresql_where=sa.text('pending_purge_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_accounts_pending_purge_at', table_name='accounts')
+    op.drop_column('accounts', 'pending_purge_at')
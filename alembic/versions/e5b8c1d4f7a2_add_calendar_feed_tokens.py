@@ -0,0 +1,53 @@
+"""Add calendar feed tokens
+
+Revision ID: e5b8c1d4f7a2
+Revises: d4a7f3b8c2e1
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b8c1d4f7a2'
+down_revision: Union[str, Sequence[str], None] = 'd4a7f3b8c2e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('calendar_feed_tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('family_id', sa.Integer(), nullable=False),
+    sa.Column('scope', sa.String(length=10), nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['family_id'], ['families.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token_hash')
+    )
+    op.create_index(op.f('ix_calendar_feed_tokens_id'), 'calendar_feed_tokens', ['id'], unique=False)
+    op.create_index(op.f('ix_calendar_feed_tokens_user_id'), 'calendar_feed_tokens', ['user_id'], unique=False)
+    # A feed ujjlenyomat-lekérdezés (sorok száma + max(updated_at)) és a részek olvasása indexből
+    op.create_index('ix_family_events_family_id_start_time', 'family_events', ['family_id', 'start_time'], unique=False)
+    op.create_index('ix_shift_assignments_user_id_date', 'shift_assignments', ['user_id', 'date'], unique=False)
+    op.create_index('ix_shift_templates_user_id_updated_at', 'shift_templates', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_work_shifts_user_id_updated_at', 'work_shifts', ['user_id', 'updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_work_shifts_user_id_updated_at', table_name='work_shifts')
+    op.drop_index('ix_shift_templates_user_id_updated_at', table_name='shift_templates')
+    op.drop_index('ix_shift_assignments_user_id_date', table_name='shift_assignments')
+    op.drop_index('ix_family_events_family_id_start_time', table_name='family_events')
+    op.drop_index(op.f('ix_calendar_feed_tokens_user_id'), table_name='calendar_feed_tokens')
+    op.drop_index(op.f('ix_calendar_feed_tokens_id'), table_name='calendar_feed_tokens')
+    op.drop_table('calendar_feed_tokens')
@@ -0,0 +1,41 @@
+"""Add wish image metadata
+
+Revision ID: f2c8d61e9b37
+Revises: e7b3c94d5a10
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8d61e9b37'
+down_revision: Union[str, Sequence[str], None] = 'e7b3c94d5a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('wish_images', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('wish_images', sa.Column('byte_size', sa.Integer(), nullable=True))
+    op.add_column('wish_images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('wish_images', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('wish_images', sa.Column('thumbnail_url', sa.String(length=500), nullable=True))
+    op.create_index(op.f('ix_wish_images_content_hash'), 'wish_images', ['content_hash'], unique=False)
+    # A listák borítókép lekérdezése (DISTINCT ON wish_id ... ORDER BY image_order) ezt használja
+    op.create_index('ix_wish_images_wish_id_order', 'wish_images', ['wish_id', 'image_order'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_wish_images_wish_id_order', table_name='wish_images')
+    op.drop_index(op.f('ix_wish_images_content_hash'), table_name='wish_images')
+    op.drop_column('wish_images', 'thumbnail_url')
+    op.drop_column('wish_images', 'height')
+    op.drop_column('wish_images', 'width')
+    op.drop_column('wish_images', 'byte_size')
+    op.drop_column('wish_images', 'content_hash')
@@ -0,0 +1,35 @@
+"""Add updated_at to recurring rules and expected expenses
+
+Revision ID: f6c9d2e8a3b5
+Revises: e5b8c1d4f7a2
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c9d2e8a3b5'
+down_revision: Union[str, Sequence[str], None] = 'e5b8c1d4f7a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A várható pénzmozgások cache ujjlenyomata (sorok száma + max(updated_at)) tulajdonosonként
+    op.add_column('recurring_rules', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('expected_expenses', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.create_index('ix_recurring_rules_owner_id_updated_at', 'recurring_rules', ['owner_id', 'updated_at'], unique=False)
+    op.create_index('ix_expected_expenses_owner_id_updated_at', 'expected_expenses', ['owner_id', 'updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expected_expenses_owner_id_updated_at', table_name='expected_expenses')
+    op.drop_index('ix_recurring_rules_owner_id_updated_at', table_name='recurring_rules')
+    op.drop_column('expected_expenses', 'updated_at')
+    op.drop_column('recurring_rules', 'updated_at')
@@ -0,0 +1,139 @@
+# Kassza törlése a függőségeivel, halmazalapú utasításokkal. Az előnézet
+# darabszám-lekérdezés (egy körút), a kényszerített törlés néhány
+# DELETE/UPDATE ... WHERE account_id = :id utasítás egy tranzakcióban, ORM
+# objektumok betöltése nélkül. Nagyon nagy kasszánál a tranzakciók törlése a
+# háttérben, darabonként commitolva fut, hogy ne tartson hosszú zárat és ne
+# nőjön túl a WAL; a kassza addig archivált, így a listákban már nem látszik.
+# A függő törlést az accounts.pending_purge_at jelzi (minden adaggal frissül),
+# így ha a folyamat leáll, az ütemező a megakadt törlést újraindítja.
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import config, models, notifications
+from .database import SessionLocal
+
+logger = logging.getLogger("familyhub.accounts")
+
+
+def _rules_filter(account_id: int):
+    RecurringRule = models.RecurringRule
+    return or_(RecurringRule.from_account_id == account_id, RecurringRule.to_account_id == account_id)
+
+
+def dependency_counts(db: Session, account_id: int) -> Dict[str, int]:
+    """ A függő szabályok, az élő és az archivált tranzakciók száma egyetlen lekérdezéssel. """
+    row = db.execute(select(
+        select(func.count()).select_from(models.RecurringRule).where(_rules_filter(account_id)).scalar_subquery(),
+        select(func.count()).select_from(models.Transaction)
+        .where(models.Transaction.account_id == account_id).scalar_subquery(),
+        select(func.count()).select_from(models.TransactionArchive)
+        .where(models.TransactionArchive.account_id == account_id).scalar_subquery(),
+    )).one()
+    return {"recurring_rules": row[0], "transactions": row[1], "archived_transactions": row[2]}
+
+
+def transaction_total(dependencies: Dict[str, int]) -> int:
+    return dependencies["transactions"] + dependencies["archived_transactions"]
+
+
+def _execute(db: Session, statement) -> int:
+    # A munkamenetben betöltött objektumokat nem szinkronizáljuk: a hívó nem használja őket tovább
+    return db.execute(statement.execution_options(synchronize_session=False)).rowcount
+
+
+def delete_rules(db: Session, account_id: int) -> int:
+    return _execute(db, delete(models.RecurringRule).where(_rules_filter(account_id)))
+
+
+def _delete_transactions(db: Session, transaction_filter) -> int:
+    # A teljesített tervezett kiadások hivatkozása megszűnik, maga a tétel megmarad
+    ids = select(models.Transaction.id).where(transaction_filter)
+    _execute(db, update(models.ExpectedExpense).where(models.ExpectedExpense.transaction_id.in_(ids))
+             .values(transaction_id=None))
+    return _execute(db, delete(models.Transaction).where(transaction_filter))
+
+
+def _delete_archived(db: Session, archive_filter) -> int:
+    # Az archív sorokra nincs kaszkád: csak ez a kifejezett törlés viheti el őket
+    return _execute(db, delete(models.TransactionArchive).where(archive_filter))
+
+
+def delete_with_dependencies(db: Session, account_id: int) -> Dict[str, int]:
+    """
+    A kassza és minden hivatkozása (az archivált tranzakciók és a havi
+    összesítők is), commit nélkül. A pillanatképek és a célkassza statisztika
+    az ON DELETE CASCADE miatt az adatbázisban törlődik.
+    """
+    deleted = {
+        "recurring_rules": delete_rules(db, account_id),
+        "transactions": _delete_transactions(db, models.Transaction.account_id == account_id),
+        "archived_transactions": _delete_archived(db, models.TransactionArchive.account_id == account_id),
+    }
+    _execute(db, delete(models.TransactionMonthlyRollup).where(models.TransactionMonthlyRollup.account_id == account_id))
+    _execute(db, update(models.Wish).where(models.Wish.goal_account_id == account_id).values(goal_account_id=None))
+    _execute(db, delete(models.AccountHistory).where(models.AccountHistory.account_id == account_id))
+    _execute(db, delete(models.account_visibility_association)
+             .where(models.account_visibility_association.c.account_id == account_id))
+    _execute(db, delete(models.Account).where(models.Account.id == account_id))
+    notifications.goal_closed(db, account_id)
+    return deleted
+
+
+def mark_pending_purge(db: Session, account: models.Account):
+    """ A háttértörlés tartós jelzése az archivált kasszán, commit nélkül. """
+    account.status = 'archived'
+    account.pending_purge_at = datetime.now()
+
+
+def _touch(db: Session, account_id: int):
+    # Az adaggal együtt commitolódik: az ütemező ebből látja, hogy a törlés halad
+    _execute(db, update(models.Account).where(models.Account.id == account_id)
+             .values(pending_purge_at=datetime.now()))
+
+
+def purge_in_background(account_id: int, chunk_size: int = None) -> bool:
+    """
+    Háttérfeladat: a tranzakciók törlése `chunk_size` darabos, külön commitolt
+    adagokban, majd a kassza és a maradék függőségek egy tranzakcióban.
+    Hiba esetén a pending_purge_at megmarad, így az ütemező később folytatja.
+    """
+    chunk_size = chunk_size or config.ACCOUNT_DELETE_CHUNK_SIZE
+    db = SessionLocal()
+    try:
+        while True:
+            chunk = select(models.Transaction.id).where(
+                models.Transaction.account_id == account_id
+            ).order_by(models.Transaction.id).limit(chunk_size).scalar_subquery()
+            if not _delete_transactions(db, models.Transaction.id.in_(chunk)):
+                break
+            _touch(db, account_id)
+            db.commit()
+        Archive = models.TransactionArchive
+        while True:
+            chunk = select(Archive.id).where(Archive.account_id == account_id) \
+                .order_by(Archive.id).limit(chunk_size).scalar_subquery()
+            if not _delete_archived(db, Archive.id.in_(chunk)):
+                break
+            _touch(db, account_id)
+            db.commit()
+        delete_with_dependencies(db, account_id)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        logger.exception("A(z) %s kassza háttérben futó törlése megszakadt", account_id)
+        return False
+    finally:
+        db.close()
+
+
+def stalled_purges(db: Session, now: Optional[datetime] = None) -> List[int]:
+    """ A függő törlések, amelyek `ACCOUNT_PURGE_RESUME_MINUTES` perce nem haladtak (leállt vagy elbukott feladat). """
+    cutoff = (now or datetime.now()) - timedelta(minutes=config.ACCOUNT_PURGE_RESUME_MINUTES)
+    return db.execute(select(models.Account.id).where(
+        models.Account.pending_purge_at.isnot(None), models.Account.pending_purge_at < cutoff
+    ).order_by(models.Account.pending_purge_at)).scalars().all()
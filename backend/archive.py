@@ -0,0 +1,187 @@
+# Régi tranzakciók archiválása. A horizontnál (FAMILYHUB_TRANSACTION_ARCHIVE_MONTHS)
+# régebbi hónapok sorai havonta, egy-egy tranzakcióban kerülnek át a
+# transactions_archive táblába (DELETE ... RETURNING -> INSERT), és az adott
+# hónapra havi összesítők (transaction_monthly_rollups) készülnek. Egy sor
+# mindig pontosan az egyik táblában van, ezért az elemzések az élő sorok és
+# az összesítők összegeként pontosak maradnak; a hideg sorokat csak a
+# hónap közepén kezdődő/végződő időszakok széleinél kell olvasni.
+# Történeti listázáshoz a transactions_all nézet (models.TransactionAll) ad
+# átlátszó olvasási utat.
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Date, and_, case, cast, delete, func, insert, literal, not_, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from . import config, ledger, models
+
+_COLUMNS = ("id", "description", "amount", "type", "date", "account_id", "user_id", "category_id",
+            "transfer_id", "is_family_expense")
+_ROLLUP_COLUMNS = ("account_id", "month", "category_id", "type", "is_transfer", "is_family_expense",
+                   "amount", "transaction_count")
+
+
+def _month_bounds(month: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(month, time.min)
+    return start, start + relativedelta(months=1)
+
+
+def cutoff(db: Session, today: Optional[date] = None) -> Optional[date]:
+    """
+    Az archiválás határa (hónapkezdet, kizárólagos): a horizont, de legfeljebb
+    a legutolsó egyenleg-pillanatkép, hogy a főkönyvi egyeztetésnek ne kelljen a
+    hideg sorokat olvasnia. None: nincs mit archiválni.
+    """
+    if config.TRANSACTION_ARCHIVE_MONTHS <= 0:
+        return None
+    horizon = ledger.month_start(today or date.today()) - relativedelta(months=config.TRANSACTION_ARCHIVE_MONTHS)
+    latest_snapshot = db.query(func.max(models.AccountBalanceSnapshot.as_of)).scalar()
+    if latest_snapshot is None:
+        return None
+    return min(horizon, latest_snapshot)
+
+
+def _rebuild_rollups(db: Session, month: date):
+    """ A hónap összesítői újra, az archív sorokból (ismételt futtatásnál is ugyanazt adja). """
+    R, A = models.TransactionMonthlyRollup.__table__, models.TransactionArchive.__table__
+    start, end = _month_bounds(month)
+    db.execute(delete(R).where(R.c.month == month))
+    is_transfer = A.c.transfer_id.isnot(None)
+    is_family_expense = func.coalesce(A.c.is_family_expense, False)
+    grouped = select(
+        A.c.account_id, literal(month, Date), A.c.category_id, A.c.type, is_transfer, is_family_expense,
+        func.coalesce(func.sum(A.c.amount), 0), func.count(),
+    ).where(
+        A.c.date >= start, A.c.date < end, A.c.account_id.isnot(None), A.c.type.isnot(None)
+    ).group_by(A.c.account_id, A.c.category_id, A.c.type, is_transfer, is_family_expense)
+    db.execute(insert(R).from_select(list(_ROLLUP_COLUMNS), grouped))
+
+
+def archive_month(db: Session, month: date) -> int:
+    """
+    A hónap tranzakcióinak áthelyezése egyetlen utasítással, majd a havi
+    összesítők. A tervezett kiadásokhoz kötött sorok az élő táblában maradnak.
+    Commit nélkül; visszaadja az áthelyezett sorok számát.
+    """
+    T, A = models.Transaction.__table__, models.TransactionArchive.__table__
+    start, end = _month_bounds(month)
+    referenced = select(models.ExpectedExpense.transaction_id).where(
+        models.ExpectedExpense.transaction_id == T.c.id
+    ).exists()
+    moved = delete(T).where(T.c.date >= start, T.c.date < end, ~referenced) \
+        .returning(*[T.c[name] for name in _COLUMNS]).cte("moved")
+    count = db.execute(insert(A).from_select(list(_COLUMNS), select(*[moved.c[name] for name in _COLUMNS]))).rowcount
+    _rebuild_rollups(db, month)
+    return count
+
+
+def archive_old_transactions(db: Session, today: Optional[date] = None) -> List[Tuple[date, int]]:
+    """ Az ütemezett feladat: a határ előtti hónapok archiválása, hónaponként commitolva. """
+    limit = cutoff(db, today)
+    if limit is None:
+        return []
+    oldest = db.query(func.min(models.Transaction.date)).filter(
+        models.Transaction.date < datetime.combine(limit, time.min)
+    ).scalar()
+    if oldest is None:
+        return []
+    archived = []
+    month = ledger.month_start(oldest.date())
+    while month < limit:
+        moved = archive_month(db, month)
+        db.commit()
+        if moved:
+            archived.append((month, moved))
+        month += relativedelta(months=1)
+    return archived
+
+
+# --- Olvasás: élő sorok + havi összesítők ---
+
+def _flow_conditions(type_column, is_transfer, is_family_expense, family_view: bool):
+    """
+    Bevétel és kiadás feltétele. Szülői (családi) nézetben a belső átutalás
+    nem bevétel, és kiadásnak is csak a zsebpénz (is_family_expense) számít belőle.
+    """
+    income = type_column == 'bevétel'
+    expense = type_column == 'kiadás'
+    if family_view:
+        income = and_(income, not_(is_transfer))
+        expense = and_(expense, or_(not_(is_transfer), is_family_expense))
+    return income, expense
+
+
+def _row_conditions(model, family_view: bool):
+    return _flow_conditions(model.type, model.transfer_id.isnot(None), model.is_family_expense == True, family_view)
+
+
+def monthly_flows(db: Session, account_ids: Iterable[int], first_month: date, last_month: date,
+                  family_view: bool) -> Dict[date, Tuple[Decimal, Decimal]]:
+    """ Hónap -> (bevétel, kiadás) a [first_month, last_month] hónapokra, két csoportosított lekérdezéssel. """
+    T, R = models.Transaction, models.TransactionMonthlyRollup
+    account_ids = list(account_ids)
+    start = datetime.combine(first_month, time.min)
+    end = datetime.combine(last_month + relativedelta(months=1), time.min)
+
+    income, expense = _row_conditions(T, family_view)
+    month = cast(func.date_trunc('month', T.date), Date)
+    live = select(
+        month.label("month"),
+        func.sum(case((income, T.amount), else_=0)).label("income"),
+        func.sum(case((expense, T.amount), else_=0)).label("expense"),
+    ).where(T.account_id.in_(account_ids), T.date >= start, T.date < end).group_by(month)
+
+    income, expense = _flow_conditions(R.type, R.is_transfer, R.is_family_expense, family_view)
+    cold = select(
+        R.month.label("month"),
+        func.sum(case((income, R.amount), else_=0)).label("income"),
+        func.sum(case((expense, R.amount), else_=0)).label("expense"),
+    ).where(R.account_id.in_(account_ids), R.month >= first_month, R.month <= last_month).group_by(R.month)
+
+    totals: Dict[date, Tuple[Decimal, Decimal]] = {}
+    for row in db.execute(union_all(live, cold)):
+        previous_income, previous_expense = totals.get(row.month, (Decimal(0), Decimal(0)))
+        totals[row.month] = (previous_income + (row.income or 0), previous_expense + (row.expense or 0))
+    return totals
+
+
+def category_expenses(account_ids: Iterable[int], start: datetime, end: datetime, family_view: bool):
+    """
+    Kiadások kategóriánként a [start, end) időszakban, (category_id, amount,
+    transaction_count) allekérdezésként: élő sorok + a teljes hónapok
+    összesítői + a szélső, csonka hónapok archív sorai.
+    """
+    T, A, R = models.Transaction, models.TransactionArchive, models.TransactionMonthlyRollup
+    account_ids = list(account_ids)
+
+    def rows(model, *conditions):
+        _, expense = _row_conditions(model, family_view)
+        return select(
+            model.category_id.label("category_id"),
+            func.sum(model.amount).label("amount"),
+            func.count().label("transaction_count"),
+        ).where(model.account_id.in_(account_ids), expense, *conditions).group_by(model.category_id)
+
+    parts = [rows(T, T.date >= start, T.date < end)]
+
+    # Az időszakba teljesen beleeső hónapok [full_start, full_end)
+    full_start = ledger.month_start(start.date())
+    if datetime.combine(full_start, time.min) < start:
+        full_start += relativedelta(months=1)
+    full_end = ledger.month_start(end.date())
+    if full_start < full_end:
+        _, expense = _flow_conditions(R.type, R.is_transfer, R.is_family_expense, family_view)
+        parts.append(select(
+            R.category_id.label("category_id"),
+            func.sum(R.amount).label("amount"),
+            func.sum(R.transaction_count).label("transaction_count"),
+        ).where(
+            R.account_id.in_(account_ids), expense, R.month >= full_start, R.month < full_end
+        ).group_by(R.category_id))
+        full_range = and_(A.date >= datetime.combine(full_start, time.min), A.date < datetime.combine(full_end, time.min))
+        parts.append(rows(A, A.date >= start, A.date < end, not_(full_range)))
+    else:
+        parts.append(rows(A, A.date >= start, A.date < end))
+    return union_all(*parts).subquery("category_expenses")
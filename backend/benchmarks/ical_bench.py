@@ -0,0 +1,162 @@
+"""
+iCalendar olvasó és RRULE kibontás benchmark, adatbázis nélkül.
+
+Használat (a repo gyökeréből):
+
+    python -m backend.benchmarks.ical_bench --events 50000 --output ical.json
+
+Egy generált, `--events` eseményes feedet (minden `--recurring-every`-edik
+esemény heti ismétlődő sorozat) ideiglenes fájlba ír, majd méri:
+
+- a soronkénti (streaming) feldolgozást a teljes fájl memóriába olvasásával
+  szemben: idő, esemény/s és a tracemalloc szerinti csúcsmemória;
+- az ablakkal érintett ismétlődő sorozatok (ahogy a lekérdezés is szűri
+  őket) kibontását nap/hét/hónap ablakra a léptetett
+  kezdőpontú recurrence.occurrences-szel és a naiv, DTSTART-tól iteráló
+  változattal; a két eredménynek egyeznie kell (különben 1-es kilépési kód).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from dateutil.rrule import rrulestr
+
+from .. import ical, recurrence
+from .calendar_sync_check import build_feed
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FamilyHub iCalendar olvasó és RRULE kibontás benchmark")
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--recurring-every", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Ismétlések száma; a legjobb futás számít")
+    parser.add_argument("--window-offset-days", type=int, default=3650,
+                        help="A kibontási ablak kezdete a feed első eseményéhez képest")
+    parser.add_argument("--output", help="JSON eredmény fájl (alapértelmezés: stdout)")
+    return parser.parse_args(argv)
+
+
+def _measure(run, repeat):
+    """ (legjobb idő másodpercben, csúcsmemória bájtban, utolsó eredmény) """
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def _stream_count(path):
+    with open(path, encoding="utf-8", newline="") as handle:
+        return sum(1 for _ in ical.iter_events(handle))
+
+
+def _in_memory_count(path):
+    with open(path, encoding="utf-8", newline="") as handle:
+        lines = handle.read().splitlines()
+    return len(list(ical.iter_events(lines)))
+
+
+def _naive_occurrences(event, window_start, window_end):
+    # Léptetés nélkül, a DTSTART-tól iterálva (a kibontás zónája ugyanaz)
+    tz = recurrence.zone(event["tzid"])
+    dtstart = recurrence.to_zone(event["start_datetime"], tz)
+    duration = recurrence.to_zone(event["end_datetime"], tz) - dtstart
+    rule = rrulestr(event["rrule"], dtstart=dtstart)
+    excluded = recurrence.parse_exdates(event["exdates"])
+    found = []
+    for occurrence in rule.between(recurrence.to_zone(window_start, tz) - duration,
+                                   recurrence.to_zone(window_end, tz), inc=True):
+        start, end = recurrence.from_zone(occurrence), recurrence.from_zone(occurrence + duration)
+        if start < window_end and start not in excluded and (end > window_start or start >= window_start):
+            found.append((start, end))
+    return found
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    with tempfile.NamedTemporaryFile("w", suffix=".ics", encoding="utf-8", newline="", delete=False) as handle:
+        for line in build_feed(0, args.events, recurring_every=args.recurring_every):
+            handle.write(line + "\r\n")
+        path = handle.name
+    try:
+        size = os.path.getsize(path)
+        stream_s, stream_peak, parsed = _measure(lambda: _stream_count(path), args.repeat)
+        memory_s, memory_peak, _ = _measure(lambda: _in_memory_count(path), args.repeat)
+        with open(path, encoding="utf-8", newline="") as feed:
+            series = [event for event in ical.iter_events(feed) if event["rrule"]]
+    finally:
+        os.unlink(path)
+
+    failures = []
+    first_start = min(event["start_datetime"] for event in series)
+    window_base = first_start.replace(hour=0, minute=0) + timedelta(days=args.window_offset_days)
+    expansion = []
+    for event in series:
+        event["recurrence_end"] = recurrence.rule_end(event["start_datetime"], event["end_datetime"],
+                                                      event["rrule"], event["tzid"])
+    for name, length in (("nap", timedelta(days=1)), ("hét", timedelta(weeks=1)), ("hónap", timedelta(days=30))):
+        window_end = window_base + length
+        # Ahogy a lekérdezés is szűr: az ablak végéig elindult, és nem lezárult sorozatok
+        candidates = [
+            event for event in series
+            if event["start_datetime"] < window_end
+            and (event["recurrence_end"] is None or event["recurrence_end"] > window_base)
+        ]
+
+        def fast():
+            return [list(recurrence.occurrences(event["start_datetime"], event["end_datetime"], event["rrule"],
+                                                event["exdates"], window_base, window_end, tzid=event["tzid"]))
+                    for event in candidates]
+
+        def naive():
+            return [_naive_occurrences(event, window_base, window_end) for event in candidates]
+
+        fast_s, _, fast_result = _measure(fast, args.repeat)
+        naive_s, _, naive_result = _measure(naive, args.repeat)
+        if fast_result != naive_result:
+            failures.append(f"{name}: a léptetett és a naiv kibontás eltér")
+        expansion.append({
+            "window": name,
+            "series": len(candidates),
+            "occurrences": sum(len(items) for items in fast_result),
+            "fast_ms": round(fast_s * 1000, 2),
+            "naive_ms": round(naive_s * 1000, 2),
+            "speedup": round(naive_s / fast_s, 1) if fast_s else None,
+        })
+
+    report = {
+        "events": parsed,
+        "recurring_series": len(series),
+        "feed_bytes": size,
+        "parse": {
+            "stream_s": round(stream_s, 3),
+            "stream_events_per_s": round(parsed / stream_s),
+            "stream_peak_kib": stream_peak // 1024,
+            "in_memory_s": round(memory_s, 3),
+            "in_memory_peak_kib": memory_peak // 1024,
+        },
+        "expansion": expansion,
+        "failures": failures,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output)
+    print(output)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
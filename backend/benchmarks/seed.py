@@ -0,0 +1,290 @@
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..security import get_pin_hash
+
+BENCH_PIN = "1234"
+
+CATEGORY_TREE = {
+    "Élelmiszer": ["Bolt", "Piac", "Étterem"],
+    "Rezsi": ["Áram", "Gáz", "Internet"],
+    "Közlekedés": ["Üzemanyag", "Bérlet"],
+    "Szórakozás": ["Mozi", "Játék"],
+    "Egészség": ["Gyógyszer", "Orvos"],
+}
+PARENT_ROLES = ["Családfő", "Szülő"]
+CHILD_ROLES = ["Tizenéves", "Gyerek"]
+RULE_FREQUENCIES = ["napi", "heti", "havi", "havi", "éves"]
+WISH_STATUSES = ["draft", "pending", "pending", "approved", "conditional", "modifications_requested", "rejected", "completed"]
+EVENT_TYPES = ["family", "work", "school", "health", "transport"]
+SHIFT_TEMPLATES = [("Reggeli műszak", "06:00", "14:00"), ("Délutáni műszak", "14:00", "22:00"), ("Irodai nap", "08:00", "16:30")]
+
+
+class BenchmarkScale:
+    """ Egy szintetikus család méretezése. """
+
+    def __init__(self, families=1, members=4, accounts_per_member=2, years=2, transactions_per_month=40,
+                 rules_per_member=3, wishes_per_member=5, shift_days=60, seed=42):
+        self.families = families
+        self.members = max(members, 1)
+        self.accounts_per_member = max(accounts_per_member, 1)
+        self.years = years
+        self.transactions_per_month = transactions_per_month
+        self.rules_per_member = rules_per_member
+        self.wishes_per_member = wishes_per_member
+        self.shift_days = shift_days
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _bulk_insert(db: Session, model, rows: list[dict], batch_size: int = 5000):
+    # Core executemany: a nagy táblákhoz nem kell ORM objektum és visszaolvasott ID
+    for start in range(0, len(rows), batch_size):
+        db.execute(model.__table__.insert(), rows[start:start + batch_size])
+
+
+def _ensure_categories(db: Session) -> list[int]:
+    existing = db.query(models.Category.id).filter(models.Category.parent_id.isnot(None)).all()
+    if existing:
+        return [row.id for row in existing]
+
+    leaf_ids = []
+    rng = random.Random(0)
+    for parent_name, children in CATEGORY_TREE.items():
+        color = "#%06x" % rng.randint(0, 0xFFFFFF)
+        parent = models.Category(name=parent_name, color=color)
+        db.add(parent)
+        db.flush()
+        for child_name in children:
+            child = models.Category(name=child_name, parent_id=parent.id, color=color)
+            db.add(child)
+            db.flush()
+            leaf_ids.append(child.id)
+    return leaf_ids
+
+
+def _random_datetime_in_month(rng: random.Random, month_start: date, until: datetime) -> datetime:
+    month_end = month_start + relativedelta(months=1)
+    span_seconds = int((datetime.combine(month_end, datetime.min.time()) - datetime.combine(month_start, datetime.min.time())).total_seconds())
+    moment = datetime.combine(month_start, datetime.min.time()) + timedelta(seconds=rng.randrange(span_seconds))
+    return min(moment, until)
+
+
+def _seed_family(db: Session, rng: random.Random, index: int, scale: BenchmarkScale, pin_hash: str, category_ids: list[int]):
+    today = date.today()
+    now = datetime.now()
+
+    family = models.Family(name=f"Benchmark család {scale.seed}-{index}")
+    db.add(family)
+    db.flush()
+
+    # --- Családtagok ---
+    users = []
+    for member_index in range(scale.members):
+        if member_index < 2:
+            role = PARENT_ROLES[member_index]
+        else:
+            role = CHILD_ROLES[member_index % 2]
+        user = models.User(
+            name=f"bench_{scale.seed}_{index}_{member_index}",
+            display_name=f"Tag {member_index + 1}",
+            role=role,
+            pin_hash=pin_hash,
+            status="Online",
+            family_id=family.id,
+        )
+        users.append(user)
+    db.add_all(users)
+    db.flush()
+    parents = [u for u in users if u.role in PARENT_ROLES]
+    children = [u for u in users if u.role in CHILD_ROLES]
+
+    # --- Kasszák és láthatóság ---
+    accounts = [models.Account(name="Közös Kassza", type="közös", family_id=family.id, balance=0)]
+    for user in users:
+        accounts.append(models.Account(name=f"{user.display_name} kasszája", type="személyes",
+                                       family_id=family.id, owner_user_id=user.id, balance=0))
+        for goal_index in range(scale.accounts_per_member - 1):
+            accounts.append(models.Account(
+                name=f"Cél {goal_index + 1} ({user.display_name})", type="cél", family_id=family.id,
+                owner_user_id=user.id, balance=0, goal_amount=Decimal(rng.randrange(50, 500) * 1000),
+                goal_date=today + relativedelta(months=rng.randrange(2, 24)), show_on_dashboard=goal_index == 0,
+            ))
+    db.add_all(accounts)
+    db.flush()
+
+    visibility = set()
+    for account in accounts:
+        if account.owner_user_id:
+            visibility.add((account.owner_user_id, account.id))
+        for parent in parents:
+            visibility.add((parent.id, account.id))
+    db.execute(models.account_visibility_association.insert(),
+               [{"user_id": user_id, "account_id": account_id} for user_id, account_id in visibility])
+
+    # --- Tranzakciók (a kassza egyenlege a tranzakciók összege lesz) ---
+    balances = {account.id: Decimal(0) for account in accounts}
+    transactions = []
+    first_month = today.replace(day=1) - relativedelta(months=scale.years * 12 - 1)
+    personal_accounts = [a for a in accounts if a.type == "személyes"]
+    owner_by_account = {a.id: a.owner_user_id or parents[0].id for a in accounts}
+    month_start = first_month
+    while month_start <= today:
+        for _ in range(scale.transactions_per_month):
+            account = rng.choice(accounts)
+            moment = _random_datetime_in_month(rng, month_start, now)
+            if rng.random() < 0.15 and len(accounts) > 1:
+                # Átutalás két kassza között (kiadás + bevétel pár)
+                source = rng.choice(personal_accounts)
+                target = rng.choice([a for a in accounts if a.id != source.id])
+                amount = Decimal(rng.randrange(1, 50) * 500)
+                transfer_id = uuid.uuid4()
+                is_pocket_money = source.owner_user_id in {p.id for p in parents} and target.owner_user_id in {c.id for c in children}
+                transactions.append({
+                    "description": f"Átutalás -> {target.name}", "amount": amount, "type": "kiadás", "date": moment,
+                    "account_id": source.id, "user_id": owner_by_account[source.id], "transfer_id": transfer_id,
+                    "is_family_expense": is_pocket_money, "category_id": None,
+                })
+                transactions.append({
+                    "description": f"Átutalás <- {source.name}", "amount": amount, "type": "bevétel", "date": moment,
+                    "account_id": target.id, "user_id": owner_by_account[source.id], "transfer_id": transfer_id,
+                    "is_family_expense": False, "category_id": None,
+                })
+                balances[source.id] -= amount
+                balances[target.id] += amount
+            else:
+                is_income = rng.random() < 0.35
+                amount = Decimal(rng.randrange(1, 400) * 100) if not is_income else Decimal(rng.randrange(10, 80) * 5000)
+                transactions.append({
+                    "description": "Fizetés" if is_income else "Vásárlás", "amount": amount,
+                    "type": "bevétel" if is_income else "kiadás", "date": moment, "account_id": account.id,
+                    "user_id": owner_by_account[account.id], "transfer_id": None, "is_family_expense": False,
+                    "category_id": None if is_income else rng.choice(category_ids),
+                })
+                balances[account.id] += amount if is_income else -amount
+        month_start += relativedelta(months=1)
+    _bulk_insert(db, models.Transaction, transactions)
+    for account in accounts:
+        account.balance = balances[account.id]
+
+    # --- Ismétlődő szabályok és várható költségek ---
+    rules = []
+    expected = []
+    for user in users:
+        own_account = next(a for a in personal_accounts if a.owner_user_id == user.id)
+        for _ in range(scale.rules_per_member):
+            rule_type = rng.choice(["bevétel", "kiadás", "átutalás"])
+            start = today - timedelta(days=rng.randrange(0, 365))
+            rules.append({
+                "description": f"Rendszeres {rule_type}", "amount": Decimal(rng.randrange(1, 100) * 1000), "type": rule_type,
+                "from_account_id": own_account.id if rule_type == "átutalás" else None,
+                "to_account_id": rng.choice(accounts).id if rule_type == "átutalás" else own_account.id,
+                "category_id": rng.choice(category_ids) if rule_type == "kiadás" else None,
+                "owner_id": user.id, "frequency": rng.choice(RULE_FREQUENCIES), "start_date": start,
+                "next_run_date": today + timedelta(days=rng.randrange(0, 45)), "is_active": rng.random() < 0.9,
+            })
+        expected.append({
+            "description": "Tervezett kiadás", "estimated_amount": Decimal(rng.randrange(5, 200) * 1000),
+            "due_date": today + timedelta(days=rng.randrange(0, 60)), "status": "tervezett", "priority": "közepes",
+            "owner_id": user.id, "family_id": family.id, "category_id": rng.choice(category_ids),
+            "is_recurring": False,
+        })
+    _bulk_insert(db, models.RecurringRule, rules)
+    _bulk_insert(db, models.ExpectedExpense, expected)
+
+    # --- Kívánságok jóváhagyásokkal, képekkel, linkekkel és előzményekkel ---
+    for user in users:
+        for wish_index in range(scale.wishes_per_member):
+            status = rng.choice(WISH_STATUSES)
+            wish = models.Wish(
+                name=f"Kívánság {wish_index + 1}", description="Benchmark kívánság",
+                estimated_price=Decimal(rng.randrange(5, 300) * 1000), priority=rng.choice(["low", "medium", "high"]),
+                status=status, owner_user_id=user.id, family_id=family.id, category_id=rng.choice(category_ids),
+                submitted_at=now if status != "draft" else None,
+            )
+            db.add(wish)
+            db.flush()
+            for image_order in range(rng.randrange(0, 4)):
+                db.add(models.WishImage(wish_id=wish.id, image_url=f"/uploads/wish_images/bench_{wish.id}_{image_order}.jpg", image_order=image_order))
+            for link_order in range(rng.randrange(0, 3)):
+                db.add(models.WishLink(wish_id=wish.id, url=f"https://example.com/{wish.id}/{link_order}", link_order=link_order))
+            db.add(models.WishHistory(wish_id=wish.id, user_id=user.id, action="created", new_values={"name": wish.name}))
+            if status not in ("draft", "pending"):
+                for parent in parents:
+                    if parent.id == user.id:
+                        continue
+                    approval_status = status if status in ("approved", "conditional", "rejected", "modifications_requested") else "approved"
+                    db.add(models.WishApproval(wish_id=wish.id, approver_user_id=parent.id, status=approval_status))
+
+    # --- Időbeosztás: műszak sablonok, beosztások, fix műszakok, események ---
+    for user in parents + children[:1]:
+        templates = []
+        for name, start_time, end_time in SHIFT_TEMPLATES:
+            templates.append(models.ShiftTemplate(user_id=user.id, name=name, start_time=start_time, end_time=end_time))
+        db.add_all(templates)
+        db.flush()
+        assignments = []
+        for day_offset in range(-scale.shift_days // 2, scale.shift_days // 2):
+            if rng.random() < 0.7:
+                assignments.append({
+                    "user_id": user.id, "template_id": rng.choice(templates).id,
+                    "date": today + timedelta(days=day_offset), "status": "scheduled",
+                    "created_at": now, "updated_at": now,
+                })
+        _bulk_insert(db, models.ShiftAssignment, assignments)
+        db.add(models.WorkShift(user_id=user.id, name="Hétköznap", start_time="08:00", end_time="16:00", days_of_week="1,2,3,4,5"))
+
+    events = []
+    user_events = []
+    for day_offset in range(-scale.shift_days // 2, scale.shift_days // 2):
+        day = datetime.combine(today + timedelta(days=day_offset), datetime.min.time())
+        if rng.random() < 0.5:
+            start = day + timedelta(hours=rng.randrange(7, 20))
+            events.append({
+                "family_id": family.id, "creator_id": parents[0].id, "title": "Családi program",
+                "event_type": rng.choice(EVENT_TYPES), "start_time": start, "end_time": start + timedelta(hours=1),
+                "is_recurring": False, "created_at": now, "updated_at": now,
+            })
+        for user in users:
+            if rng.random() < 0.3:
+                start = day + timedelta(hours=rng.randrange(7, 20))
+                user_events.append({
+                    "user_id": user.id, "title": "Program", "event_type": "personal", "start_time": start,
+                    "end_time": start + timedelta(minutes=45), "source": "manual", "is_recurring": False,
+                    "created_at": now, "updated_at": now,
+                })
+    _bulk_insert(db, models.FamilyEvent, events)
+    _bulk_insert(db, models.UserEvent, user_events)
+
+    db.flush()
+    return {
+        "family_id": family.id,
+        "parent_user_id": parents[0].id,
+        "child_user_id": children[0].id if children else None,
+        "transactions": len(transactions),
+    }
+
+
+def seed_families(db: Session, scale: BenchmarkScale) -> list[dict]:
+    """
+    Létrehozza a megadott méretű szintetikus családokat. Ugyanazzal a seed-del
+    futtatva ugyanazt az adatszerkezetet kapjuk (a dátumok a mai naphoz igazodnak).
+    """
+    rng = random.Random(scale.seed)
+    pin_hash = get_pin_hash(BENCH_PIN)
+    category_ids = _ensure_categories(db)
+
+    seeded = []
+    for index in range(scale.families):
+        seeded.append(_seed_family(db, rng, index, scale, pin_hash, category_ids))
+        db.commit()
+        print(f"Család #{index + 1} kész: {seeded[-1]['transactions']} tranzakció")
+    return seeded
@@ -0,0 +1,245 @@
+# Csak olvasható iCalendar (.ics) export tokennel, személyenként vagy családonként.
+# A feed részekből áll (családi események; tagonként a beosztott műszakok és a
+# heti műszakok). Minden részhez egy olcsó ujjlenyomat tartozik
+# (fingerprints.collect, egyetlen lekérdezéssel). Változatlan ujjlenyomatnál a
+# naptár alkalmazás 304-et kap; ha csak egy rész változott, csak az generálódik újra.
+import hashlib
+import secrets
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from . import config, fingerprints, models, recurrence
+from .static_files import etag_matches
+
+FEED_VERSION = 1
+PRODID = "-//FamilyHub//Naptár export//HU"
+SCOPES = ("user", "family")
+_WEEKDAYS = {"1": "MO", "2": "TU", "3": "WE", "4": "TH", "5": "FR", "6": "SA", "7": "SU"}
+_YIELD_PER = 500
+
+
+# --- Tokenek ---
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def create_token(db: Session, user: models.User, scope: str) -> Tuple[models.CalendarFeedToken, str]:
+    """ Új feed token; a nyers token csak itt látható, a DB-ben csak a hash-e marad. """
+    if scope not in SCOPES:
+        raise HTTPException(status_code=400, detail="Érvénytelen feed típus.")
+    token = secrets.token_urlsafe(32)
+    feed_token = models.CalendarFeedToken(user_id=user.id, family_id=user.family_id, scope=scope,
+                                          token_hash=_hash_token(token))
+    db.add(feed_token)
+    db.commit()
+    db.refresh(feed_token)
+    return feed_token, token
+
+
+def list_tokens(db: Session, user_id: int) -> List[models.CalendarFeedToken]:
+    return db.query(models.CalendarFeedToken).filter(
+        models.CalendarFeedToken.user_id == user_id,
+        models.CalendarFeedToken.revoked_at.is_(None)
+    ).order_by(models.CalendarFeedToken.created_at).all()
+
+
+def revoke_token(db: Session, token_id: int, user_id: int) -> bool:
+    revoked = db.query(models.CalendarFeedToken).filter(
+        models.CalendarFeedToken.id == token_id,
+        models.CalendarFeedToken.user_id == user_id,
+        models.CalendarFeedToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(revoked)
+
+
+def resolve_token(db: Session, token: str) -> Optional[models.CalendarFeedToken]:
+    return db.query(models.CalendarFeedToken).filter(
+        models.CalendarFeedToken.token_hash == _hash_token(token),
+        models.CalendarFeedToken.revoked_at.is_(None)
+    ).first()
+
+
+# --- iCalendar írás ---
+
+def escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    """ 75 oktetnél hosszabb sor tördelése (UTF-8 karakterhatáron). """
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    pieces, current, size, limit = [], [], 0, 75
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > limit:
+            pieces.append("".join(current))
+            # A folytatósor szóközzel kezdődik, ami maga is egy oktet
+            current, size, limit = [], 0, 74
+        current.append(char)
+        size += width
+    pieces.append("".join(current))
+    return "\r\n ".join(pieces)
+
+
+def _local(value: datetime) -> str:
+    # Lebegő (zóna nélküli) idő: a telefon a saját helyi idejében mutatja, ahogy a DB-ben is helyi idő van
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _stamp(value: Optional[datetime]) -> str:
+    value = value or datetime(2000, 1, 1)
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _vevent(uid: str, stamp: Optional[datetime], start: datetime, end: Optional[datetime], summary: str,
+            description: Optional[str] = None, location: Optional[str] = None,
+            rrule: Optional[str] = None) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:{uid}"
+    yield f"DTSTAMP:{_stamp(stamp)}"
+    yield f"DTSTART:{_local(start)}"
+    if end is not None and end > start:
+        yield f"DTEND:{_local(end)}"
+    if rrule:
+        yield f"RRULE:{rrule}"
+    yield fold(f"SUMMARY:{escape(summary)}")
+    if description:
+        yield fold(f"DESCRIPTION:{escape(description)}")
+    if location:
+        yield fold(f"LOCATION:{escape(location)}")
+    yield "END:VEVENT"
+
+
+def _encode(lines: Iterable[str]) -> bytes:
+    return "".join(f"{line}\r\n" for line in lines).encode("utf-8")
+
+
+# --- Feed részek ---
+
+def _involves(event: models.FamilyEvent, user_id: int) -> bool:
+    if not event.involves_members:
+        return True
+    return event.creator_id == user_id or str(user_id) in event.involves_members.split(",")
+
+
+def _family_events_part(db: Session, family_id: int, user_id: Optional[int], since: date) -> Iterator[str]:
+    query = db.query(models.FamilyEvent).filter(
+        models.FamilyEvent.family_id == family_id,
+        (models.FamilyEvent.start_time >= since) | (models.FamilyEvent.is_recurring == True)
+    ).order_by(models.FamilyEvent.start_time)
+    for event in query.yield_per(_YIELD_PER):
+        if user_id is not None and not _involves(event, user_id):
+            continue
+        rrule = recurrence.PATTERN_RRULE.get(event.recurrence_pattern or "") if event.is_recurring else None
+        yield from _vevent(
+            f"family-event-{event.id}@familyhub", event.updated_at, event.start_time, event.end_time,
+            event.title, event.description, event.location, rrule,
+        )
+
+
+def _assignments_part(db: Session, user_id: int, prefix: str, since: date) -> Iterator[str]:
+    query = db.query(models.ShiftAssignment, models.ShiftTemplate).join(
+        models.ShiftTemplate, models.ShiftAssignment.template_id == models.ShiftTemplate.id
+    ).filter(
+        models.ShiftAssignment.user_id == user_id,
+        models.ShiftAssignment.date >= since,
+        models.ShiftAssignment.status != "cancelled"
+    ).order_by(models.ShiftAssignment.date)
+    for assignment, template in query.yield_per(_YIELD_PER):
+        start, end = recurrence.shift_span(assignment.date, template.start_time, template.end_time)
+        stamp = max(filter(None, (assignment.updated_at, template.updated_at)), default=None)
+        yield from _vevent(
+            f"shift-assignment-{assignment.id}@familyhub", stamp, start, end, prefix + template.name,
+            assignment.notes or template.description, template.location_details or template.location,
+        )
+
+
+def _work_shifts_part(db: Session, user_id: int, prefix: str) -> Iterator[str]:
+    for shift in db.query(models.WorkShift).filter(
+        models.WorkShift.user_id == user_id,
+        models.WorkShift.is_active == True
+    ).order_by(models.WorkShift.id):
+        days = [_WEEKDAYS[day.strip()] for day in shift.days_of_week.split(",") if day.strip() in _WEEKDAYS]
+        if not days:
+            continue
+        # A sorozat a létrehozás hetében indul, az első megfelelő napon
+        first_day = (shift.created_at or datetime.now()).date()
+        first_day -= timedelta(days=first_day.weekday())
+        first_day += timedelta(days=min(list(_WEEKDAYS.values()).index(day) for day in days))
+        start, end = recurrence.shift_span(first_day, shift.start_time, shift.end_time)
+        yield from _vevent(
+            f"work-shift-{shift.id}@familyhub", shift.updated_at, start, end, prefix + shift.name,
+            rrule=f"FREQ=WEEKLY;BYDAY={','.join(days)}",
+        )
+
+
+# A feed részei ezeknek a tábláknak a változásától függenek
+_TABLES = ("family_events", "shift_assignments", "assigned_shift_templates", "work_shifts")
+
+cache = fingerprints.FingerprintCache(config.CALENDAR_FEED_CACHE_PARTS)
+
+
+def feed_response(db: Session, feed_token: models.CalendarFeedToken, request_headers: Headers) -> Response:
+    """ A feed válasza: 304, ha a kliens ETag-je még érvényes; különben a (részben) cache-elt törzs. """
+    since = date.today() - timedelta(days=config.CALENDAR_FEED_PAST_DAYS)
+    family_scope = feed_token.scope == "family"
+    if family_scope:
+        members = db.query(models.User.id, models.User.display_name).filter(
+            models.User.family_id == feed_token.family_id
+        ).order_by(models.User.id).all()
+    else:
+        members = db.query(models.User.id, models.User.display_name).filter(
+            models.User.id == feed_token.user_id
+        ).all()
+    state = fingerprints.collect(db, feed_token.family_id, [member.id for member in members], _TABLES)
+
+    parts = [(
+        ("family_events", feed_token.family_id, None if family_scope else feed_token.user_id, since),
+        (state.get(("family_events", fingerprints.FAMILY_KEY)),),
+        lambda: _family_events_part(db, feed_token.family_id, None if family_scope else feed_token.user_id, since),
+    )]
+    for member in members:
+        prefix = f"{member.display_name}: " if family_scope else ""
+        parts.append((
+            ("shift_assignments", member.id, prefix, since),
+            (state.get(("shift_assignments", member.id)), state.get(("assigned_shift_templates", member.id))),
+            lambda member_id=member.id, prefix=prefix: _assignments_part(db, member_id, prefix, since),
+        ))
+        parts.append((
+            ("work_shifts", member.id, prefix),
+            (state.get(("work_shifts", member.id)),),
+            lambda member_id=member.id, prefix=prefix: _work_shifts_part(db, member_id, prefix),
+        ))
+
+    # Az ETag csak az ujjlenyomatokból számolódik: 304-hez egyetlen VEVENT-et sem kell előállítani
+    summary = repr((FEED_VERSION, feed_token.scope, [(key, fingerprint) for key, fingerprint, _ in parts]))
+    etag = '"' + hashlib.sha256(summary.encode("utf-8")).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={config.CALENDAR_FEED_REFRESH_MINUTES * 60}"}
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    name = "FamilyHub – család" if family_scope else "FamilyHub"
+    chunks = [_encode([
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH",
+        fold(f"X-WR-CALNAME:{escape(name)}"),
+        f"REFRESH-INTERVAL;VALUE=DURATION:PT{config.CALENDAR_FEED_REFRESH_MINUTES}M",
+        f"X-PUBLISHED-TTL:PT{config.CALENDAR_FEED_REFRESH_MINUTES}M",
+    ])]
+    for key, fingerprint, generate in parts:
+        body = cache.get(key, fingerprint)
+        if body is None:
+            body = _encode(generate())
+            cache.put(key, fingerprint, body)
+        chunks.append(body)
+    chunks.append(_encode(["END:VCALENDAR"]))
+    return Response(b"".join(chunks), media_type="text/calendar; charset=utf-8", headers=headers)
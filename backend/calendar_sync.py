@@ -0,0 +1,351 @@
+# Külső iCalendar feedek importja a synced_events táblába.
+# - feltételes letöltés (ETag / Last-Modified): változatlan feednél 304, nincs feldolgozás
+# - a feedet soronként, letöltés közben dolgozzuk fel (ical.iter_events)
+# - eseményenkénti content_hash: csak az új/módosult sorok íródnak, kötegelt upserttel
+# - az integrációk párhuzamosan, de korlátozott számban (CALENDAR_SYNC_CONCURRENCY) futnak
+# - a letöltés csak publikus címre kapcsolódhat (átirányítás után is), a hibaüzenet
+#   nem adja vissza a belső hálózat válaszát
+import asyncio
+import codecs
+import http.client
+import ipaddress
+import socket
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import config, ical, models, recurrence
+from .database import SessionLocal
+
+USER_AGENT = "FamilyHub-CalendarSync/1.0"
+UPSERT_BATCH_SIZE = 500
+_UPDATABLE_COLUMNS = ("title", "description", "start_datetime", "end_datetime", "is_all_day", "location",
+                      "rrule", "exdates", "recurrence_id", "recurrence_end", "tzid", "content_hash")
+
+
+@dataclass
+class SyncResult:
+    integration_id: int
+    status: str  # 'unchanged', 'synced', 'error'
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class _Feed:
+    lines: Optional[Iterable[str]]  # None: a forrás nem változott
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class BlockedAddressError(OSError):
+    """ A cím (vagy amire feloldódik) nem publikus, és nincs a kivételek között. """
+
+    def __init__(self):
+        super().__init__("A naptár cím belső hálózatra mutat, ez nem engedélyezett.")
+
+
+def is_allowed_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if any(ip in network for network in config.CALENDAR_SYNC_ALLOWED_NETWORKS):
+        return True
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # is_global: se loopback, se RFC1918, se link-local (169.254.x.x), se egyéb fenntartott tartomány
+    return ip.is_global and not ip.is_multicast
+
+
+def _check_literal_host(url: str):
+    # Mentéskor a nyilvánvaló eseteket azonnal elutasítjuk; a névfeloldást a kapcsolódás ellenőrzi
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    if not host:
+        raise ValueError("Hiányzó kiszolgáló a naptár címben.")
+    if host == "localhost" or host.endswith(".localhost"):
+        raise BlockedAddressError()
+    try:
+        literal = ipaddress.ip_address(host)
+    except ValueError:
+        return
+    if not is_allowed_address(str(literal)):
+        raise BlockedAddressError()
+
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, *args, **kwargs):
+    """
+    A socket.create_connection helyett: csak engedélyezett címre kapcsolódik,
+    a feloldott címek közül a tiltottakat ki sem próbálja (DNS rebinding ellen is).
+    """
+    host, port = address[:2]
+    error = None
+    for family, type_, proto, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        if not is_allowed_address(sockaddr[0]):
+            error = error or BlockedAddressError()
+            continue
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            sock.close()
+            error = exc
+    raise error or OSError(f"A(z) {host} cím nem oldható fel.")
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = 5
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # Minden átirányítás új kapcsolat a fenti kezelőkön át, így a cél címe is ellenőrzött
+        if urllib.parse.urlsplit(newurl).scheme.lower() not in ("http", "https"):
+            raise urllib.error.URLError("Nem http(s) átirányítás.")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_PublicHTTPHandler, _PublicHTTPSHandler, _RedirectHandler)
+
+
+def public_error(exc: BaseException) -> str:
+    """ A felhasználónak visszaadható hibaüzenet: a távoli/belső válasz tartalma nélkül. """
+    reason = exc.reason if isinstance(exc, urllib.error.URLError) and not isinstance(exc, urllib.error.HTTPError) else exc
+    if isinstance(reason, BlockedAddressError):
+        return str(reason)
+    if isinstance(exc, urllib.error.HTTPError):
+        return f"A naptár szerver hibával válaszolt (HTTP {exc.code})."
+    if isinstance(exc, (urllib.error.URLError, OSError)):
+        return "A naptár cím nem érhető el."
+    if isinstance(exc, ValueError):
+        return str(exc)[:500]
+    return "A naptár szinkron sikertelen."
+
+
+def resolve_source(url: str):
+    """
+    ("http", url) vagy ("file", Path). A webcal:// https-ként töltődik le;
+    helyi fájl csak a CALENDAR_FILE_ROOT könyvtáron belülről olvasható.
+    """
+    url = url.strip()
+    lowered = url.lower()
+    if lowered.startswith("webcal://"):
+        url = "https://" + url[len("webcal://"):]
+        _check_literal_host(url)
+        return "http", url
+    if lowered.startswith(("http://", "https://")):
+        _check_literal_host(url)
+        return "http", url
+    if config.CALENDAR_FILE_ROOT is None:
+        raise ValueError("Csak http(s):// vagy webcal:// naptár címet lehet megadni.")
+    root = config.CALENDAR_FILE_ROOT.resolve()
+    path = Path(url[len("file://"):] if lowered.startswith("file://") else url)
+    path = (root / path).resolve()
+    if root not in path.parents:
+        raise ValueError("A naptár fájl a megengedett könyvtáron kívül van.")
+    return "file", path
+
+
+def validate_source(url: Optional[str]):
+    if url:
+        try:
+            resolve_source(url)
+        except (ValueError, BlockedAddressError) as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+
+def _decoded_lines(binary, charset: str):
+    # Inkrementális dekódolás: a több bájtos karakter a darabhatáron sem törik el
+    decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    pending = ""
+    for chunk in iter(lambda: binary.read(64 * 1024), b""):
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        yield from complete
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+@contextmanager
+def open_feed(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+    kind, source = resolve_source(url)
+    if kind == "file":
+        stat_result = source.stat()
+        file_etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        if etag == file_etag:
+            yield _Feed(None, etag, last_modified)
+            return
+        with source.open("rb") as handle:
+            yield _Feed(_decoded_lines(handle, "utf-8"), file_etag, None)
+        return
+
+    headers = {"User-Agent": USER_AGENT, "Accept": "text/calendar, */*;q=0.5"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(source, headers=headers)
+    try:
+        response = _opener.open(request, timeout=config.CALENDAR_SYNC_TIMEOUT_SECONDS)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304:
+            yield _Feed(None, etag, last_modified)
+            return
+        raise
+    with response:
+        charset = response.headers.get_content_charset() or "utf-8"
+        yield _Feed(_decoded_lines(response, charset),
+                    response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+def _upsert(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    stmt = insert(models.SyncedEvent).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_synced_event_integration_external_id",
+        set_={**{column: stmt.excluded[column] for column in _UPDATABLE_COLUMNS}, "updated_at": func.now()},
+    )
+    db.execute(stmt)
+
+
+def _set_recurrence_end(event: dict):
+    # Csak az írandó soroknál számoljuk; érvénytelen szabállyal egyszeri eseményként tároljuk
+    event["recurrence_end"] = None
+    if event["rrule"]:
+        try:
+            event["recurrence_end"] = recurrence.rule_end(event["start_datetime"], event["end_datetime"],
+                                                           event["rrule"], event["tzid"])
+        except (ValueError, TypeError):
+            event["rrule"] = None
+
+
+def sync_integration(db: Session, integration: models.CalendarIntegration) -> SyncResult:
+    """ Egy integráció szinkronja; a végén commitol. Hiba esetén az integráció 'error' státuszt kap. """
+    result = SyncResult(integration_id=integration.id, status="synced")
+    try:
+        with open_feed(integration.url, integration.etag, integration.last_modified) as feed:
+            if feed.lines is not None:
+                existing = dict(db.query(models.SyncedEvent.external_event_id, models.SyncedEvent.content_hash).filter(
+                    models.SyncedEvent.calendar_integration_id == integration.id
+                ))
+                seen, batch = set(), []
+                for event in ical.iter_events(feed.lines):
+                    cancelled = event.pop("cancelled")
+                    external_id = event["external_event_id"]
+                    # Lemondott esemény = nincs a feedben (törlődik); ismételt UID-nál az első nyer
+                    if cancelled or external_id in seen:
+                        continue
+                    seen.add(external_id)
+                    content_hash = ical.event_hash(event)
+                    if existing.get(external_id) == content_hash:
+                        result.unchanged += 1
+                        continue
+                    if external_id in existing:
+                        result.updated += 1
+                    else:
+                        result.inserted += 1
+                    _set_recurrence_end(event)
+                    batch.append({**event, "content_hash": content_hash, "calendar_integration_id": integration.id})
+                    if len(batch) >= UPSERT_BATCH_SIZE:
+                        _upsert(db, batch)
+                        batch = []
+                _upsert(db, batch)
+
+                stale = list(existing.keys() - seen)
+                for start in range(0, len(stale), UPSERT_BATCH_SIZE):
+                    result.deleted += db.query(models.SyncedEvent).filter(
+                        models.SyncedEvent.calendar_integration_id == integration.id,
+                        models.SyncedEvent.external_event_id.in_(stale[start:start + UPSERT_BATCH_SIZE])
+                    ).delete(synchronize_session=False)
+            else:
+                result.status = "unchanged"
+
+            integration.etag, integration.last_modified = feed.etag, feed.last_modified
+        integration.last_sync = datetime.utcnow()
+        integration.status = "connected"
+        integration.sync_error = None
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        result = SyncResult(integration_id=integration.id, status="error", error=public_error(exc))
+        integration.status = "error"
+        integration.sync_error = result.error
+        db.commit()
+    return result
+
+
+def sync_integration_by_id(integration_id: int) -> SyncResult:
+    # Párhuzamos futtatáshoz: minden szál saját munkamenettel
+    db = SessionLocal()
+    try:
+        integration = db.get(models.CalendarIntegration, integration_id)
+        if integration is None:
+            return SyncResult(integration_id=integration_id, status="error", error="Az integráció nem található.")
+        return sync_integration(db, integration)
+    finally:
+        db.close()
+
+
+def _enabled_integration_ids() -> List[int]:
+    db = SessionLocal()
+    try:
+        return [row.id for row in db.query(models.CalendarIntegration.id).filter(
+            models.CalendarIntegration.sync_enabled == True,
+            models.CalendarIntegration.url.isnot(None)
+        )]
+    finally:
+        db.close()
+
+
+async def sync_all(integration_ids: Optional[Iterable[int]] = None) -> List[SyncResult]:
+    """ Az összes (vagy a megadott) integráció szinkronja, legfeljebb CALENDAR_SYNC_CONCURRENCY egyszerre. """
+    if integration_ids is None:
+        integration_ids = await run_in_threadpool(_enabled_integration_ids)
+    semaphore = asyncio.Semaphore(config.CALENDAR_SYNC_CONCURRENCY)
+
+    async def run(integration_id: int) -> SyncResult:
+        async with semaphore:
+            return await run_in_threadpool(sync_integration_by_id, integration_id)
+
+    return list(await asyncio.gather(*(run(integration_id) for integration_id in integration_ids)))
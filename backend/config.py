@@ -0,0 +1,105 @@
+import ipaddress
+import os
+from pathlib import Path
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Általános beállítások ---
+# Debug módban a válaszok X-DB-Queries / X-DB-Time fejléceket kapnak
+DEBUG = _env_bool("FAMILYHUB_DEBUG")
+
+# --- SQL lekérdezés profilozás ---
+# Ennél lassabb kérések a legdrágább lekérdezéseikkel együtt naplózásra kerülnek
+SLOW_REQUEST_MS = float(os.getenv("FAMILYHUB_SLOW_REQUEST_MS", "500"))
+# Hány lekérdezést írjunk ki egy lassú kérésnél
+SLOW_REQUEST_TOP_STATEMENTS = int(os.getenv("FAMILYHUB_SLOW_REQUEST_TOP_STATEMENTS", "5"))
+# Végpontonkénti összesítés mintavételi aránya (0 = kikapcsolva, 1 = minden kérés)
+QUERY_PROFILE_SAMPLE_RATE = float(os.getenv("FAMILYHUB_QUERY_PROFILE_SAMPLE_RATE", "0"))
+
+# --- Tranzakciók ---
+# Hányszor próbáljuk újra a sorosítási hibával / holtponttal megszakadt tranzakciót
+TRANSACTION_RETRY_ATTEMPTS = int(os.getenv("FAMILYHUB_TRANSACTION_RETRY_ATTEMPTS", "3"))
+# Meddig őrizzük meg az Idempotency-Key-hez tárolt választ
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("FAMILYHUB_IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+# --- Feltöltések ---
+# A feltöltött fájlok gyökérkönyvtára (alapértelmezés: a projekt gyökerében lévő uploads/)
+UPLOAD_ROOT = Path(os.getenv("FAMILYHUB_UPLOAD_ROOT", str(Path(__file__).resolve().parent.parent / "uploads")))
+# Profilkép maximális mérete megabájtban (a feltöltés közben ellenőrizve)
+MAX_AVATAR_UPLOAD_MB = float(os.getenv("FAMILYHUB_MAX_AVATAR_UPLOAD_MB", "5"))
+# Kívánság kép maximális mérete megabájtban
+MAX_WISH_IMAGE_UPLOAD_MB = float(os.getenv("FAMILYHUB_MAX_WISH_IMAGE_UPLOAD_MB", "10"))
+# A bélyegkép-generáló process pool mérete
+THUMBNAIL_WORKERS = int(os.getenv("FAMILYHUB_THUMBNAIL_WORKERS", "2"))
+
+# --- Élő események (SSE) ---
+# "memory": folyamaton belüli pub/sub (egy worker); "postgres": LISTEN/NOTIFY több workerhez
+EVENTS_BACKEND = os.getenv("FAMILYHUB_EVENTS_BACKEND", "memory").strip().lower()
+# Csendes kapcsolaton ilyen gyakran megy heartbeat komment (proxyk időtúllépése ellen)
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("FAMILYHUB_EVENTS_HEARTBEAT_SECONDS", "15"))
+# A böngésző ennyi ms után csatlakozzon újra megszakadt kapcsolatnál
+EVENTS_RETRY_MS = int(os.getenv("FAMILYHUB_EVENTS_RETRY_MS", "3000"))
+
+# --- Jelenlét ---
+# Ennyi másodperc inaktivitás után a tag automatikusan offline
+PRESENCE_TTL_SECONDS = int(os.getenv("FAMILYHUB_PRESENCE_TTL_SECONDS", "300"))
+# A státusztörténet és a users.last_active kötegelt kiírásának gyakorisága
+PRESENCE_FLUSH_SECONDS = float(os.getenv("FAMILYHUB_PRESENCE_FLUSH_SECONDS", "30"))
+
+# --- Naptár szinkron ---
+# Ennyi integráció szinkronizálódik egyszerre
+CALENDAR_SYNC_CONCURRENCY = int(os.getenv("FAMILYHUB_CALENDAR_SYNC_CONCURRENCY", "4"))
+CALENDAR_SYNC_INTERVAL_MINUTES = int(os.getenv("FAMILYHUB_CALENDAR_SYNC_INTERVAL_MINUTES", "30"))
+CALENDAR_SYNC_TIMEOUT_SECONDS = float(os.getenv("FAMILYHUB_CALENDAR_SYNC_TIMEOUT_SECONDS", "20"))
+# A naptár letöltés csak publikus címekre mehet (SSRF védelem); ezek a hálózatok
+# (vesszővel elválasztott CIDR-ek, pl. egy otthoni NAS: 192.168.1.10/32) kivételek
+CALENDAR_SYNC_ALLOWED_NETWORKS = tuple(
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.getenv("FAMILYHUB_CALENDAR_SYNC_ALLOWED_NETWORKS", "").split(",") if value.strip()
+)
+# Helyi .ics fájlok gyökere (pl. iskolai export egy megosztott mappában); üresen a fájl forrás tiltott
+CALENDAR_FILE_ROOT = Path(os.environ["FAMILYHUB_CALENDAR_FILE_ROOT"]) if os.getenv("FAMILYHUB_CALENDAR_FILE_ROOT") else None
+
+# --- Naptár export (.ics feed) ---
+# Ennyi napnál régebbi események és beosztások nem kerülnek a feedbe
+CALENDAR_FEED_PAST_DAYS = int(os.getenv("FAMILYHUB_CALENDAR_FEED_PAST_DAYS", "60"))
+# A naptár alkalmazásoknak javasolt frissítési gyakoriság (REFRESH-INTERVAL, Cache-Control)
+CALENDAR_FEED_REFRESH_MINUTES = int(os.getenv("FAMILYHUB_CALENDAR_FEED_REFRESH_MINUTES", "15"))
+# A memóriában tartott, előre legenerált feed részek maximális száma
+CALENDAR_FEED_CACHE_PARTS = int(os.getenv("FAMILYHUB_CALENDAR_FEED_CACHE_PARTS", "512"))
+
+# --- Idővonal ---
+# Családonként és időablakonként cache-elt idővonalak maximális száma
+TIMELINE_CACHE_ENTRIES = int(os.getenv("FAMILYHUB_TIMELINE_CACHE_ENTRIES", "256"))
+# Egy idővonal lekérdezés leghosszabb ablaka napokban
+TIMELINE_MAX_DAYS = int(os.getenv("FAMILYHUB_TIMELINE_MAX_DAYS", "62"))
+
+# --- Várható pénzmozgások ---
+# Alapértelmezett időablak napokban és a visszaadott tételek alapértelmezett száma
+UPCOMING_DAYS = int(os.getenv("FAMILYHUB_UPCOMING_DAYS", "30"))
+UPCOMING_LIMIT = int(os.getenv("FAMILYHUB_UPCOMING_LIMIT", "100"))
+# Családonként cache-elt listák maximális száma
+UPCOMING_CACHE_ENTRIES = int(os.getenv("FAMILYHUB_UPCOMING_CACHE_ENTRIES", "256"))
+
+# --- Kassza törlés ---
+# Ennél több tranzakciónál a kényszerített törlés a háttérben, adagonként fut
+ACCOUNT_DELETE_BACKGROUND_THRESHOLD = int(os.getenv("FAMILYHUB_ACCOUNT_DELETE_BACKGROUND_THRESHOLD", "50000"))
+# A háttérben futó törlés egy adagja (ennyi tranzakció commitonként)
+ACCOUNT_DELETE_CHUNK_SIZE = int(os.getenv("FAMILYHUB_ACCOUNT_DELETE_CHUNK_SIZE", "5000"))
+# Ennyi perce nem haladó háttértörlést az ütemező újraindít (pl. szerver újraindítás után)
+ACCOUNT_PURGE_RESUME_MINUTES = int(os.getenv("FAMILYHUB_ACCOUNT_PURGE_RESUME_MINUTES", "15"))
+
+# --- Tranzakció archiválás ---
+# Ennél (hónapban) régebbi tranzakciók átkerülnek a transactions_archive táblába,
+# havi összesítőkkel; 0 = kikapcsolva
+TRANSACTION_ARCHIVE_MONTHS = int(os.getenv("FAMILYHUB_TRANSACTION_ARCHIVE_MONTHS", "24"))
+
+# --- Tranzakció partíciók ---
+# Ennyi hónapra előre hozza létre a karbantartó feladat a havi partíciókat
+TRANSACTION_PARTITION_MONTHS_AHEAD = int(os.getenv("FAMILYHUB_TRANSACTION_PARTITION_MONTHS_AHEAD", "3"))
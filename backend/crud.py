@@ -1,9 +1,11 @@
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from sqlalchemy import func, extract, and_, or_,case
+from sqlalchemy import func, and_, or_,case, update
 import calendar
 from sqlalchemy.orm import Session, joinedload, selectinload, aliased
-from . import models, schemas
+from . import config, models, schemas, ledger, uploads, notifications, events, presence, calendar_sync, timeline, upcoming, goal_progress, account_deletion, archive
+from .locking import lock_accounts, run_in_transaction
+from sqlalchemy.exc import SQLAlchemyError
 from .security import get_pin_hash
 import uuid
 from fastapi import HTTPException,status
@@ -132,80 +134,98 @@ def delete_user(db: Session, user_id: int):
     return db_user
 
 # === EZ A FÜGGVÉNY MÓDOSUL ===
-def get_account(db: Session, account_id: int, user: models.User):
-    account = db.query(models.Account).options(
-        selectinload(models.Account.wishes).selectinload(models.Wish.owner),
-        selectinload(models.Account.wishes).selectinload(models.Wish.category),
-        selectinload(models.Account.history_entries).selectinload(models.AccountHistory.user)
-    ).filter(models.Account.id == account_id).first()
+ACCOUNT_EXPANSIONS = ("wishes", "history")
 
-    if not account:
-        raise HTTPException(status_code=404, detail="Kassza nem található.")
-
-    # A jogosultság ellenőrzéséhez lekérjük az ÖSSZES (aktív és archivált) kasszát, amihez hozzáfér
-    visible_accounts = get_accounts_by_family(db, user=user, status=None)
-    is_visible = any(acc.id == account.id for acc in visible_accounts)
+def account_loader_options(expand=()):
+    """
+    A kassza válaszhoz tartozó betöltési opciók: az összefoglaló mezők mindig,
+    a kívánságok és az előzmények csak akkor, ha kérték őket.
+    """
+    options = [joinedload(models.Account.owner_user), selectinload(models.Account.viewers)]
+    if "wishes" in expand:
+        wishes = selectinload(models.Account.wishes)
+        options += [
+            wishes.selectinload(models.Wish.owner),
+            wishes.selectinload(models.Wish.category),
+            wishes.selectinload(models.Wish.images),
+            wishes.selectinload(models.Wish.links),
+            wishes.selectinload(models.Wish.approvals).selectinload(models.WishApproval.approver),
+            wishes.selectinload(models.Wish.history).selectinload(models.WishHistory.user),
+        ]
+    if "history" in expand:
+        options.append(selectinload(models.Account.history_entries).selectinload(models.AccountHistory.user))
+    return options
 
-    if not is_visible:
+def ensure_account_visible(db: Session, account_id: int, user: models.User, visible_ids: Optional[set] = None):
+    """
+    404, ha a kassza nem létezik, 403, ha a felhasználó nem láthatja (aktív és archivált kasszák is).
+    Több kasszát ellenőrző műveletek egyszer kérdezik le a visible_ids halmazt, és azt adják át.
+    """
+    if visible_ids is None:
+        visible_ids = get_visible_account_ids(db, user=user, status=None)
+    if account_id not in visible_ids:
+        exists = db.query(models.Account.id).filter(models.Account.id == account_id).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Kassza nem található.")
         raise HTTPException(status_code=403, detail="Nincs jogosultságod megtekinteni ezt a kasszát.")
 
+def get_account(db: Session, account_id: int, user: models.User, expand=()):
+    # Előbb a jogosultság, csak azonosítókkal
+    ensure_account_visible(db, account_id, user)
+
+    account = db.query(models.Account).options(*account_loader_options(expand)) \
+        .filter(models.Account.id == account_id).first()
+    if not account:
+        raise HTTPException(status_code=404, detail="Kassza nem található.")
     return account
-def get_accounts_by_family(db: Session, user: models.User, account_type: Optional[str] = None, status: Optional[str] = 'active'):
-    """
-    Listázza a kasszákat jogosultság alapján. Képes szűrni típusra és státuszra.
-    Ha a status=None, akkor minden állapotú kasszát visszaad.
-    """
-    query_options = joinedload(models.Account.owner_user)
-    
-    base_query = db.query(models.Account).options(query_options)
-    # Csak akkor szűrünk státuszra, ha az meg van adva
-    if status:
-        base_query = base_query.filter(models.Account.status == status)
 
-    # ... a többi jogosultsági logika változatlan ...
+def _visible_account_filter(db: Session, user: models.User):
+    """A kassza láthatósági szabályai egyetlen SQL feltételként."""
+    shared_ids = db.query(models.account_visibility_association.c.account_id).filter(
+        models.account_visibility_association.c.user_id == user.id
+    )
     if user.role == "Családfő":
-        accounts_query = base_query.filter(models.Account.family_id == user.family_id)
-    elif user.role == "Szülő":
-        children_ids_query = db.query(models.User.id).filter(
+        return models.Account.family_id == user.family_id
+    if user.role == "Szülő":
+        children_ids = db.query(models.User.id).filter(
             models.User.family_id == user.family_id,
             models.User.role.in_(["Gyerek", "Tizenéves"])
         )
-        children_ids = [row[0] for row in children_ids_query.all()]
-        accounts_query = base_query.filter(
+        own_family = and_(
             models.Account.family_id == user.family_id,
-            (
-                (models.Account.type != 'személyes') |
-                (models.Account.owner_user_id == user.id) |
-                (models.Account.owner_user_id.in_(children_ids))
+            or_(
+                models.Account.type != 'személyes',
+                models.Account.owner_user_id == user.id,
+                models.Account.owner_user_id.in_(children_ids.scalar_subquery())
             )
         )
-    else:
-        account_ids = [acc.id for acc in user.visible_accounts]
-        accounts_query = base_query.filter(models.Account.id.in_(account_ids))
+        # A vele megosztott kasszák is látszanak
+        return or_(own_family, models.Account.id.in_(shared_ids.scalar_subquery()))
+    return models.Account.id.in_(shared_ids.scalar_subquery())
 
+def get_visible_account_ids(db: Session, user: models.User, account_type: Optional[str] = None, status: Optional[str] = 'active'):
+    """ Ugyanazok a szabályok, mint a get_accounts_by_family-ben, de csak azonosítókat tölt be. """
+    query = db.query(models.Account.id).filter(_visible_account_filter(db, user))
+    if status:
+        query = query.filter(models.Account.status == status)
     if account_type:
-        accounts_query = accounts_query.filter(models.Account.type == account_type)
-
-    accounts = accounts_query.all()
-
-    if user.role == "Szülő":
-        shared_query = db.query(models.Account).join(models.account_visibility_association).filter(
-            models.account_visibility_association.c.user_id == user.id
-        )
-        if status:
-            shared_query = shared_query.filter(models.Account.status == status)
-        
-        if account_type:
-            shared_query = shared_query.filter(models.Account.type == account_type)
-
-        shared_accounts = shared_query.options(query_options).all()
-
-        account_ids_set = {acc.id for acc in accounts}
-        for acc in shared_accounts:
-            if acc.id not in account_ids_set:
-                accounts.append(acc)
+        query = query.filter(models.Account.type == account_type)
+    return {row[0] for row in query}
 
-    return accounts
+def get_accounts_by_family(db: Session, user: models.User, account_type: Optional[str] = None, status: Optional[str] = 'active', expand=()):
+    """
+    Listázza a kasszákat jogosultság alapján. Képes szűrni típusra és státuszra.
+    Ha a status=None, akkor minden állapotú kasszát visszaad.
+    Az expand ("wishes", "history") a beágyazott adatok betöltését kéri.
+    """
+    query = db.query(models.Account).options(*account_loader_options(expand)) \
+        .filter(_visible_account_filter(db, user))
+    # Csak akkor szűrünk státuszra, ha az meg van adva
+    if status:
+        query = query.filter(models.Account.status == status)
+    if account_type:
+        query = query.filter(models.Account.type == account_type)
+    return query.order_by(models.Account.id).all()
 
 def create_family_account(db: Session, account: schemas.AccountCreate, family_id: int, owner_user: models.User):
     db_account = models.Account(
@@ -237,11 +257,26 @@ def create_family_account(db: Session, account: schemas.AccountCreate, family_id
     db.refresh(db_account)
     return db_account
 
-def create_account_transaction(db: Session, transaction: schemas.TransactionCreate, account_id: int, user: models.User, is_internal: bool = False):
-    # Lekérdezzük a kasszát, és a jogosultságot is ellenőrizzük a 'user' alapján
-    db_account = get_account(db=db, account_id=account_id, user=user)
+def _publish_balances(db: Session, accounts):
+    """ Élő esemény a megváltozott kassza egyenlegekről (a commit után megy ki). """
+    for account in accounts:
+        events.publish(db, account.family_id, "account.updated", {"id": account.id, "balance": account.balance})
+
+def _publish_transaction(db: Session, family_id: int, type: str, transaction: models.Transaction):
+    events.publish(db, family_id, type, {
+        "id": transaction.id, "account_id": transaction.account_id,
+        "type": transaction.type, "amount": transaction.amount, "description": transaction.description,
+    })
+
+def apply_account_transaction(db: Session, transaction: schemas.TransactionCreate, account_id: int, user: models.User, is_internal: bool = False):
+    """
+    Rögzíti a tranzakciót és módosítja a zárolt kassza egyenlegét, commit nélkül.
+    Több lépésből álló műveletek (pl. célkassza lezárás) ezt hívják egy tranzakción belül.
+    """
+    ensure_account_visible(db, account_id, user)
+    db_account = lock_accounts(db, [account_id]).get(account_id)
     if not db_account:
-        raise HTTPException(status_code=404, detail="Kassza nem található vagy nincs jogosultságod hozzá.")
+        raise HTTPException(status_code=404, detail="Kassza nem található.")
 
     # Védelmi szabályok
     if not is_internal and db_account.type in ['közös', 'cél']:
@@ -268,18 +303,23 @@ def create_account_transaction(db: Session, transaction: schemas.TransactionCrea
         creator=user
     )
 
-    # Egyenleg frissítése
+    # Egyenleg frissítése (a sor zárolva van, így nem írunk felül párhuzamos módosítást)
     if db_transaction.type == 'bevétel':
         db_account.balance += db_transaction.amount
     elif db_transaction.type == 'kiadás':
         db_account.balance -= db_transaction.amount
 
-    # Mentés az adatbázisba
     db.add(db_transaction)
-    db.add(db_account)
-    db.commit()
-    db.refresh(db_transaction)
+    db.flush()
+    _publish_balances(db, [db_account])
+    _publish_transaction(db, db_account.family_id, "transaction.created", db_transaction)
+    return db_transaction
 
+def create_account_transaction(db: Session, transaction: schemas.TransactionCreate, account_id: int, user: models.User, is_internal: bool = False):
+    db_transaction = run_in_transaction(
+        db, lambda: apply_account_transaction(db, transaction, account_id, user, is_internal=is_internal)
+    )
+    db.refresh(db_transaction)
     return db_transaction
 def get_categories(db: Session):
     """
@@ -299,6 +339,32 @@ def get_categories(db: Session):
     ]
 
 
+def _filter_transactions(query, visible_account_ids, account_id=None, transaction_type=None, search_term=None, sort_by='date_desc', T=models.Transaction):
+    """A tranzakció lista közös szűrése és rendezése; None, ha a kassza nem látható."""
+    query = query.filter(T.account_id.in_(visible_account_ids))
+
+    if account_id:
+        if account_id not in visible_account_ids:
+             return None
+        query = query.filter(T.account_id == account_id)
+
+    if transaction_type:
+        query = query.filter(T.type == transaction_type)
+
+    if search_term:
+        query = query.filter(T.description.ilike(f"%{search_term}%"))
+
+    # Rendezés
+    if sort_by == 'date_asc':
+        query = query.order_by(T.date.asc())
+    elif sort_by == 'amount_desc':
+        query = query.order_by(T.amount.desc())
+    elif sort_by == 'amount_asc':
+        query = query.order_by(T.amount.asc())
+    else: # Alapértelmezett: date_desc
+        query = query.order_by(T.date.desc())
+    return query
+
 def get_transactions(
     db: Session,
     user: models.User,
@@ -307,8 +373,7 @@ def get_transactions(
     search_term: str | None = None,
     sort_by: str | None = 'date_desc'
 ):
-    visible_accounts = get_accounts_by_family(db, user=user)
-    visible_account_ids = {acc.id for acc in visible_accounts}
+    visible_account_ids = get_visible_account_ids(db, user=user)
     if not visible_account_ids:
         return []
 
@@ -318,31 +383,67 @@ def get_transactions(
         joinedload(models.Transaction.creator),
         joinedload(models.Transaction.category)
     )
+    query = _filter_transactions(query, visible_account_ids, account_id, transaction_type, search_term, sort_by)
+    if query is None:
+        return []
+    return query.all()
 
-    query = query.filter(models.Transaction.account_id.in_(visible_account_ids))
-
-    if account_id:
-        if account_id not in visible_account_ids:
-             return []
-        query = query.filter(models.Transaction.account_id == account_id)
-
-    if transaction_type:
-        query = query.filter(models.Transaction.type == transaction_type)
-
-    if search_term:
-        query = query.filter(models.Transaction.description.ilike(f"%{search_term}%"))
+def get_transaction_rows(
+    db: Session,
+    user: models.User,
+    account_id: int | None = None,
+    transaction_type: str | None = None,
+    search_term: str | None = None,
+    sort_by: str | None = 'date_desc',
+    include_archived: bool = False
+):
+    """
+    A get_transactions könnyű változata a lista végponthoz: csak a válaszhoz
+    szükséges oszlopokat olvassa, és kész dict-eket ad vissza a schemas.Transaction
+    alakjában, ORM objektumok és Pydantic validáció nélkül. include_archived=True
+    esetén az archivált (régi) tranzakciók is benne vannak (transactions_all nézet).
+    """
+    visible_account_ids = get_visible_account_ids(db, user=user)
+    if not visible_account_ids:
+        return []
 
-    # Rendezés
-    if sort_by == 'date_asc':
-        query = query.order_by(models.Transaction.date.asc())
-    elif sort_by == 'amount_desc':
-        query = query.order_by(models.Transaction.amount.desc())
-    elif sort_by == 'amount_asc':
-        query = query.order_by(models.Transaction.amount.asc())
-    else: # Alapértelmezett: date_desc
-        query = query.order_by(models.Transaction.date.desc())
+    T, C, U = models.TransactionAll if include_archived else models.Transaction, models.Category, models.User
+    query = db.query(
+        T.id, T.description, T.amount, T.type, T.category_id, T.date, T.account_id, T.transfer_id, T.user_id,
+        C.name.label("category_name"), C.parent_id.label("category_parent_id"),
+        C.color.label("category_color"), C.icon.label("category_icon"),
+        U.display_name.label("creator_display_name"), U.avatar_url.label("creator_avatar_url"),
+    ).outerjoin(C, T.category_id == C.id).outerjoin(U, T.user_id == U.id)
+    query = _filter_transactions(query, visible_account_ids, account_id, transaction_type, search_term, sort_by, T=T)
+    if query is None:
+        return []
 
-    return query.all()
+    result = []
+    for row in query:
+        category = None
+        if row.category_id is not None and row.category_name is not None:
+            category = {
+                "name": row.category_name, "parent_id": row.category_parent_id,
+                "color": row.category_color, "icon": row.category_icon,
+                "id": row.category_id, "has_children": False,
+            }
+        creator = None
+        if row.user_id is not None and row.creator_display_name is not None:
+            creator = {"id": row.user_id, "display_name": row.creator_display_name, "avatar_url": row.creator_avatar_url}
+        result.append({
+            "description": row.description,
+            "amount": row.amount,
+            "type": row.type,
+            "category_id": row.category_id,
+            "creator_id": None,
+            "id": row.id,
+            "date": row.date,
+            "account_id": row.account_id,
+            "category": category,
+            "creator": creator,
+            "transfer_id": row.transfer_id,
+        })
+    return result
 def update_transaction(db: Session, transaction_id: int, transaction_data: schemas.TransactionCreate, user: models.User):
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
     if not db_transaction:
@@ -354,6 +455,7 @@ def update_transaction(db: Session, transaction_id: int, transaction_data: schem
 
     # Visszaállítjuk a kassza egyenlegét a régi tranzakció alapján
     old_amount = db_transaction.amount
+    old_effect = ledger.signed_value(db_transaction.type, old_amount)
     db_account = db_transaction.account
     if db_transaction.type == 'bevétel':
         db_account.balance -= old_amount
@@ -372,6 +474,14 @@ def update_transaction(db: Session, transaction_id: int, transaction_data: schem
     else: # kiadás
         db_account.balance -= db_transaction.amount
 
+    # A tranzakció dátuma utáni havi pillanatképek is a különbséggel módosulnak
+    ledger.shift_snapshots(db, db_account.id, db_transaction.date,
+                           ledger.signed_value(db_transaction.type, db_transaction.amount) - old_effect)
+    # Célkasszánál az átutalás-összegek és a becslés is a módosított tételből számolódnak
+    goal_progress.recalculate(db, [db_account])
+    _publish_balances(db, [db_account])
+    _publish_transaction(db, db_account.family_id, "transaction.updated", db_transaction)
+
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
@@ -403,8 +513,16 @@ def delete_transaction(db: Session, transaction_id: int, user: models.User):
     elif db_transaction.type == 'kiadás':
         account.balance += db_transaction.amount
     
+    ledger.shift_snapshots(db, account.id, db_transaction.date,
+                           -ledger.signed_value(db_transaction.type, db_transaction.amount))
+
+    _publish_balances(db, [account])
+    events.publish(db, account.family_id, "transaction.deleted", {"id": db_transaction.id, "account_id": account.id})
+
     # 3. Töröljük a tranzakciót
     db.delete(db_transaction)
+    # Célkasszánál a statisztika a törölt tétel nélkül számolódik újra (az autoflush után)
+    goal_progress.recalculate(db, [account])
     
     # 4. Mentsük a változásokat
     db.commit()
@@ -412,24 +530,16 @@ def delete_transaction(db: Session, transaction_id: int, user: models.User):
     # Mivel a kategória már be van töltve, a válasz visszaadása sikeres lesz
     return db_transaction
 # === ÚJ FUNKCIÓ AZ ÁTUTALÁSHOZ ===
-def create_transfer(db: Session, transfer_data: schemas.TransferCreate, user: models.User):
-    if transfer_data.from_account_id == transfer_data.to_account_id:
-        raise HTTPException(status_code=400, detail="A forrás és cél kassza nem lehet ugyanaz.")
-
-    # JAVÍTÁS: Átadjuk a 'user' objektumot a jogosultság-ellenőrzéshez mindkét hívásnál
-    from_account = get_account(db, transfer_data.from_account_id, user=user)
-    to_account = get_account(db, transfer_data.to_account_id, user=user)
-
-    if not from_account or not to_account:
-        raise HTTPException(status_code=404, detail="Egyik vagy mindkét kassza nem található.")
+def _build_transfer(from_account: models.Account, to_account: models.Account, transfer_data: schemas.TransferCreate, user: models.User):
+    """
+    Ellenőrzi és végrehajtja egy átutalás egyenlegmozgását a már zárolt
+    kasszákon, és visszaadja a két (még nem hozzáadott) tranzakciót.
+    """
     if to_account.status == 'archived':
         raise HTTPException(status_code=400, detail="Lezárt kasszába nem lehet utalni.")
 
-    can_transfer = False
-    if user.role in ["Családfő", "Szülő"] or from_account.owner_user_id == user.id:
-        can_transfer = True
-
-    if not can_transfer:
+    # Utalhatsz, ha szülő vagy, VAGY ha a tiéd a kassza (legyen az személyes vagy cél).
+    if not (user.role in ["Családfő", "Szülő"] or from_account.owner_user_id == user.id):
         raise HTTPException(status_code=403, detail="Nincs jogosultságod ebből a kasszából utalni.")
 
     if from_account.balance < transfer_data.amount:
@@ -441,84 +551,117 @@ def create_transfer(db: Session, transfer_data: schemas.TransferCreate, user: mo
         if from_account.owner_user.role in ["Családfő", "Szülő"] and to_account.owner_user.role in ["Gyerek", "Tizenéves"]:
             is_pocket_money = True
 
-    try:
-        db_expense = models.Transaction(
-            description=f"Átutalás -> {to_account.name}: {transfer_data.description}",
-            amount=transfer_data.amount,
-            type='kiadás',
-            account_id=from_account.id,
-            creator=user,
-            transfer_id=transfer_id,
-            is_family_expense=is_pocket_money
-        )
-        from_account.balance -= transfer_data.amount
-
-        db_income = models.Transaction(
-            description=f"Átutalás <- {from_account.name}: {transfer_data.description}",
-            amount=transfer_data.amount,
-            type='bevétel',
-            account_id=to_account.id,
-            creator=user,
-            transfer_id=transfer_id
-        )
-        to_account.balance += transfer_data.amount
-
-        db.add_all([db_expense, db_income, from_account, to_account])
-        db.commit()
+    db_expense = models.Transaction(
+        description=f"Átutalás -> {to_account.name}: {transfer_data.description}",
+        amount=transfer_data.amount,
+        type='kiadás',
+        account_id=from_account.id,
+        creator=user,
+        transfer_id=transfer_id,
+        is_family_expense=is_pocket_money
+    )
+    from_account.balance -= transfer_data.amount
+
+    db_income = models.Transaction(
+        description=f"Átutalás <- {from_account.name}: {transfer_data.description}",
+        amount=transfer_data.amount,
+        type='bevétel',
+        account_id=to_account.id,
+        creator=user,
+        transfer_id=transfer_id
+    )
+    to_account.balance += transfer_data.amount
+    return transfer_id, [db_expense, db_income]
 
-        return {"status": "siker", "transfer_id": transfer_id}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Adatbázis hiba történt: {e}")
-    # === JAVÍTOTT JOGOSULTSÁGI SZABÁLY ===
-    can_transfer = False
-    is_owner = from_account.owner_user_id == user.id
-    is_parent = user.role in ["Családfő", "Szülő"]
+def apply_transfer(db: Session, transfer_data: schemas.TransferCreate, user: models.User):
+    """
+    Átutalás két kassza között commit nélkül. Mindkét kasszát id sorrendben
+    zároljuk, és a fedezetet már a zárolt egyenlegen ellenőrizzük.
+    """
+    if transfer_data.from_account_id == transfer_data.to_account_id:
+        raise HTTPException(status_code=400, detail="A forrás és cél kassza nem lehet ugyanaz.")
 
-    # Utalhatsz, ha szülő vagy, VAGY ha a tiéd a kassza (legyen az személyes vagy cél).
-    if is_parent or is_owner:
-        can_transfer = True
+    # JAVÍTÁS: Átadjuk a 'user' objektumot a jogosultság-ellenőrzéshez mindkét kasszánál
+    ensure_account_visible(db, transfer_data.from_account_id, user)
+    ensure_account_visible(db, transfer_data.to_account_id, user)
+    locked = lock_accounts(db, [transfer_data.from_account_id, transfer_data.to_account_id])
+    from_account = locked.get(transfer_data.from_account_id)
+    to_account = locked.get(transfer_data.to_account_id)
+    if not from_account or not to_account:
+        raise HTTPException(status_code=404, detail="Egyik vagy mindkét kassza nem található.")
 
-    if not can_transfer:
-        raise HTTPException(status_code=403, detail="Nincs jogosultságod ebből a kasszából utalni.")
+    previous_balance = to_account.balance
+    transfer_id, rows = _build_transfer(from_account, to_account, transfer_data, user)
+    db.add_all(rows)
+    goal_progress.record_transfers(db, [(from_account, to_account, transfer_data.amount)])
+    db.flush()
+    notifications.goals_reached(db, [to_account], {to_account.id: previous_balance})
+    _publish_balances(db, [from_account, to_account])
+    return {"status": "siker", "transfer_id": transfer_id}
 
-    if from_account.balance < transfer_data.amount:
-        raise HTTPException(status_code=400, detail="Nincs elég fedezet a forrás kasszán.")
+def apply_transfer_batch(db: Session, transfers: List[schemas.TransferCreate], user: models.User):
+    """
+    Több átutalás egy tranzakcióban (pl. zsebpénz kifizetés több gyereknek):
+    egyetlen láthatósági lekérdezés, az összes érintett kassza egyszeri
+    zárolása, és egyetlen flush az összes tranzakció-párral. Commit nélkül;
+    bármelyik tétel hibája az egész köteget visszavonja.
+    """
+    involved_ids = set()
+    for index, transfer_data in enumerate(transfers, start=1):
+        if transfer_data.from_account_id == transfer_data.to_account_id:
+            raise HTTPException(status_code=400, detail=f"{index}. tétel: a forrás és cél kassza nem lehet ugyanaz.")
+        involved_ids.update((transfer_data.from_account_id, transfer_data.to_account_id))
+
+    visible_ids = get_visible_account_ids(db, user=user, status=None)
+    hidden_ids = involved_ids - visible_ids
+    if hidden_ids:
+        existing = {row[0] for row in db.query(models.Account.id).filter(models.Account.id.in_(hidden_ids))}
+        if existing != hidden_ids:
+            raise HTTPException(status_code=404, detail="Kassza nem található.")
+        raise HTTPException(status_code=403, detail="Nincs jogosultságod megtekinteni ezt a kasszát.")
 
-    transfer_id = uuid.uuid4()
-    is_pocket_money = False
-    if from_account.owner_user and to_account.owner_user:
-        if from_account.owner_user.role in ["Családfő", "Szülő"] and to_account.owner_user.role in ["Gyerek", "Tizenéves"]:
-            is_pocket_money = True
+    locked = lock_accounts(db, involved_ids)
+    if len(locked) != len(involved_ids):
+        raise HTTPException(status_code=404, detail="Kassza nem található.")
 
-    try:
-        db_expense = models.Transaction(
-            description=f"Átutalás -> {to_account.name}: {transfer_data.description}",
-            amount=transfer_data.amount,
-            type='kiadás',
-            account_id=from_account.id,
-            creator=user,
-            transfer_id=transfer_id,
-            is_family_expense=is_pocket_money
-        )
-        from_account.balance -= transfer_data.amount
-
-        db_income = models.Transaction(
-            description=f"Átutalás <- {from_account.name}: {transfer_data.description}",
-            amount=transfer_data.amount,
-            type='bevétel',
-            account_id=to_account.id,
-            creator=user,
-            transfer_id=transfer_id
-        )
-        to_account.balance += transfer_data.amount
+    # A tulajdonosokat egy lekérdezéssel töltjük be, az owner_user így már az identity map-ből jön
+    owner_ids = {account.owner_user_id for account in locked.values() if account.owner_user_id}
+    if owner_ids:
+        db.query(models.User).filter(models.User.id.in_(owner_ids)).all()
+
+    previous_balances = {account_id: account.balance for account_id, account in locked.items()}
+    results, rows = [], []
+    for index, transfer_data in enumerate(transfers, start=1):
+        try:
+            # A fedezetet a köteg korábbi tételei után megmaradt egyenlegen nézzük
+            transfer_id, pair = _build_transfer(
+                locked[transfer_data.from_account_id], locked[transfer_data.to_account_id], transfer_data, user
+            )
+        except HTTPException as exc:
+            raise HTTPException(status_code=exc.status_code, detail=f"{index}. tétel: {exc.detail}")
+        rows.extend(pair)
+        results.append({
+            "transfer_id": transfer_id,
+            "from_account_id": transfer_data.from_account_id,
+            "to_account_id": transfer_data.to_account_id,
+            "amount": transfer_data.amount,
+        })
 
-        db.add_all([db_expense, db_income, from_account, to_account])
-        db.commit()
+    db.add_all(rows)
+    goal_progress.record_transfers(db, [
+        (locked[transfer_data.from_account_id], locked[transfer_data.to_account_id], transfer_data.amount)
+        for transfer_data in transfers
+    ])
+    db.flush()
+    notifications.goals_reached(db, locked.values(), previous_balances)
+    _publish_balances(db, locked.values())
+    return {"status": "siker", "transfers": results}
 
-        return {"status": "siker", "transfer_id": transfer_id}
-    except Exception as e:
-        db.rollback()
+def create_transfer(db: Session, transfer_data: schemas.TransferCreate, user: models.User):
+    try:
+        # Sorosítási hiba / holtpont esetén a run_in_transaction újrapróbálja
+        return run_in_transaction(db, lambda: apply_transfer(db, transfer_data, user))
+    except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Adatbázis hiba történt: {e}")
 
 def get_all_personal_accounts(db: Session, family_id: int):
@@ -534,8 +677,9 @@ def get_next_month_forecast(db: Session, user: models.User):
     """
     today = date.today()
     next_month_date = today + relativedelta(months=1)
-    next_month = next_month_date.month
-    next_month_year = next_month_date.year
+    # Dátum-tartomány (nem extract): indexelhető, és a particionált táblákon is szűkít
+    next_month_start = next_month_date.replace(day=1)
+    next_month_end = next_month_start + relativedelta(months=1)
 
     # --- Segédfüggvény a számításokhoz ---
     def calculate_forecast_for_owners(owner_ids: list[int], is_family_forecast: bool = False):
@@ -548,8 +692,8 @@ def get_next_month_forecast(db: Session, user: models.User):
         ).filter(
             models.RecurringRule.is_active == True,
             models.RecurringRule.type == 'bevétel',
-            extract('year', models.RecurringRule.next_run_date) == next_month_year,
-            extract('month', models.RecurringRule.next_run_date) == next_month
+            models.RecurringRule.next_run_date >= next_month_start,
+            models.RecurringRule.next_run_date < next_month_end
         )
 
         # Családi nézetben a szülők és a közös kasszák is számítanak
@@ -571,8 +715,8 @@ def get_next_month_forecast(db: Session, user: models.User):
         ).filter(
             models.RecurringRule.is_active == True,
             models.RecurringRule.type == 'kiadás',
-            extract('year', models.RecurringRule.next_run_date) == next_month_year,
-            extract('month', models.RecurringRule.next_run_date) == next_month
+            models.RecurringRule.next_run_date >= next_month_start,
+            models.RecurringRule.next_run_date < next_month_end
         )
 
         if is_family_forecast:
@@ -591,8 +735,8 @@ def get_next_month_forecast(db: Session, user: models.User):
         expected_expenses = db.query(func.sum(models.ExpectedExpense.estimated_amount)).filter(
             models.ExpectedExpense.owner_id.in_(owner_ids),
             models.ExpectedExpense.status == 'tervezett',
-            extract('year', models.ExpectedExpense.due_date) == next_month_year,
-            extract('month', models.ExpectedExpense.due_date) == next_month
+            models.ExpectedExpense.due_date >= next_month_start,
+            models.ExpectedExpense.due_date < next_month_end
         ).scalar() or Decimal(0)
 
         total_income = recurring_income
@@ -641,8 +785,9 @@ def get_financial_summary(db: Session, user: models.User):
     """
     Kiszámolja a pénzügyi összegzést a Dashboard kártya számára a helyes, új logika alapján.
     """
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+    # Az aktuális hónap dátum-tartományként: a tranzakció tábla havi partícióiból csak egyet olvas
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_end = month_start + relativedelta(months=1)
 
     # A várható költségek lekérdezésének alapja
     expected_expenses_query = db.query(func.sum(models.ExpectedExpense.estimated_amount)).filter(
@@ -675,8 +820,8 @@ def get_financial_summary(db: Session, user: models.User):
             models.Transaction.account_id.in_(db.query(models.Account.id).filter(models.Account.owner_user_id.in_(parent_ids))),
             models.Transaction.type == 'bevétel',
             models.Transaction.transfer_id.is_(None), # Helyesebb IS NULL ellenőrzés
-            extract('year', models.Transaction.date) == current_year,
-            extract('month', models.Transaction.date) == current_month
+            models.Transaction.date >= month_start,
+            models.Transaction.date < month_end
         ).scalar() or Decimal(0)
 
         # Havi kiadás: külső kiadás VAGY zsebpénz
@@ -687,8 +832,8 @@ def get_financial_summary(db: Session, user: models.User):
                 models.Transaction.transfer_id.is_(None),
                 models.Transaction.is_family_expense == True
             ),
-            extract('year', models.Transaction.date) == current_year,
-            extract('month', models.Transaction.date) == current_month
+            models.Transaction.date >= month_start,
+            models.Transaction.date < month_end
         ).scalar() or Decimal(0)
 
         # A szülők az egész család várható költségeit látják
@@ -725,16 +870,16 @@ def get_financial_summary(db: Session, user: models.User):
         monthly_income = db.query(func.sum(models.Transaction.amount)).filter(
             models.Transaction.account_id == personal_account.id,
             models.Transaction.type == 'bevétel',
-            extract('year', models.Transaction.date) == current_year,
-            extract('month', models.Transaction.date) == current_month
+            models.Transaction.date >= month_start,
+            models.Transaction.date < month_end
         ).scalar() or Decimal(0)
 
         # Havi kiadás: minden, ami kimegy
         monthly_expense = db.query(func.sum(models.Transaction.amount)).filter(
             models.Transaction.account_id == personal_account.id,
             models.Transaction.type == 'kiadás',
-            extract('year', models.Transaction.date) == current_year,
-            extract('month', models.Transaction.date) == current_month
+            models.Transaction.date >= month_start,
+            models.Transaction.date < month_end
         ).scalar() or Decimal(0)
 
         return {
@@ -761,6 +906,7 @@ def update_account(db: Session, account_id: int, account_data: schemas.AccountCr
     db_account.goal_amount = account_data.goal_amount
     db_account.goal_date = account_data.goal_date
     db_account.show_on_dashboard = account_data.show_on_dashboard
+    goal_progress.refresh(db, db_account)
 
     db_account.viewers = [viewer for viewer in db_account.viewers if viewer.id == db_account.owner_user_id]
     if account_data.viewer_ids:
@@ -790,26 +936,24 @@ def delete_account(db: Session, account_id: int, user: models.User):
 
     # ✅ ÚJ: ELLENŐRIZZÜK A FÜGGŐSÉGEKET
 
-    # 1. Recurring Rules ellenőrzése
-    dependent_rules = db.query(models.RecurringRule).filter(
-        (models.RecurringRule.from_account_id == account_id) |
-        (models.RecurringRule.to_account_id == account_id)
-    ).all()
-
-    if dependent_rules:
-        rule_descriptions = [rule.description for rule in dependent_rules[:3]]  # Max 3 példa
-        if len(dependent_rules) > 3:
-            rule_descriptions.append(f"... és még {len(dependent_rules) - 3} szabály")
+    # Darabszámok egy lekérdezéssel; szabály leírásból csak a példáknak kellő 3 sor
+    dependencies = account_deletion.dependency_counts(db, account_id)
+    rule_count = dependencies["recurring_rules"]
+    if rule_count:
+        rule_descriptions = [row.description for row in db.query(models.RecurringRule.description).filter(
+            (models.RecurringRule.from_account_id == account_id) |
+            (models.RecurringRule.to_account_id == account_id)
+        ).order_by(models.RecurringRule.id).limit(3)]  # Max 3 példa
+        if rule_count > 3:
+            rule_descriptions.append(f"... és még {rule_count - 3} szabály")
 
         raise HTTPException(
             status_code=400,
-            detail=f"A kassza nem törölhető, mert {len(dependent_rules)} ismétlődő szabály használja: {', '.join(rule_descriptions)}"
+            detail=f"A kassza nem törölhető, mert {rule_count} ismétlődő szabály használja: {', '.join(rule_descriptions)}"
         )
 
-    # 2. Transactions ellenőrzése (ha vannak)
-    transaction_count = db.query(models.Transaction).filter(
-        models.Transaction.account_id == account_id
-    ).count()
+    # 2. Transactions ellenőrzése (ha vannak) - az archivált történet is védett
+    transaction_count = account_deletion.transaction_total(dependencies)
 
     if transaction_count > 0:
         raise HTTPException(
@@ -819,6 +963,7 @@ def delete_account(db: Session, account_id: int, user: models.User):
 
     # ✅ HA MINDEN OK, TÖRÖLJÜK
     try:
+        notifications.goal_closed(db, account_id)
         db.delete(db_account)
         db.commit()
         return db_account
@@ -945,13 +1090,14 @@ def toggle_rule_status(db: Session, rule_id: int, user: models.User):
     return db_rule
 def get_dashboard_goals(db: Session, user: models.User):
 
-    family_goals = db.query(models.Account).filter(
+    # A haladás a goal_progress sorból jön (egy kötegelt lekérdezés), tranzakciók nélkül
+    family_goals = db.query(models.Account).options(selectinload(models.Account.goal_progress)).filter(
         models.Account.family_id == user.family_id,
         models.Account.type == 'cél',
         models.Account.show_on_dashboard == True
     ).all()
 
-    personal_goals = db.query(models.Account).filter(
+    personal_goals = db.query(models.Account).options(selectinload(models.Account.goal_progress)).filter(
         models.Account.type == 'cél',
         models.Account.owner_user_id == user.id,
         models.Account.show_on_dashboard == False
@@ -962,9 +1108,15 @@ def get_dashboard_goals(db: Session, user: models.User):
         "personal_goals": personal_goals
     }
 
-def delete_account_with_dependencies(db: Session, account_id: int, user: models.User, force: bool = False):
+def delete_account_with_dependencies(db: Session, account_id: int, user: models.User, force: bool = False,
+                                     background: bool = False):
     """
-    Kassza törlése a függőségekkel együtt (OPCIONÁLIS)
+    Kassza törlése a függőségekkel együtt (OPCIONÁLIS).
+    force=False: csak előnézet darabszámokkal, nem töröl semmit.
+    force=True: halmazalapú törlés egy tranzakcióban; nagyon nagy kasszánál
+    (vagy background=True esetén) a kassza archiválódik és függő törlésként
+    jelölődik, a tranzakciók törlése pedig a háttérben fut ("status": "pending"
+    a válaszban; leállás után az ütemező folytatja).
     """
     db_account = get_account_by_id_simple(db, account_id)
     if not db_account:
@@ -978,60 +1130,59 @@ def delete_account_with_dependencies(db: Session, account_id: int, user: models.
     if db_account.balance != 0:
         raise HTTPException(status_code=400, detail="A kassza csak akkor törölhető, ha az egyenlege 0 Ft.")
 
-    # Ha force=False, csak ellenőrzés
+    # Ha force=False, csak ellenőrzés (darabszám-lekérdezés, ORM objektumok nélkül)
     if not force:
-        # Számoljuk meg a függőségeket
-        dependent_rules = db.query(models.RecurringRule).filter(
-            (models.RecurringRule.from_account_id == account_id) |
-            (models.RecurringRule.to_account_id == account_id)
-        ).all()
-
-        transaction_count = db.query(models.Transaction).filter(
-            models.Transaction.account_id == account_id
-        ).count()
-
-        if dependent_rules or transaction_count > 0:
+        dependencies = account_deletion.dependency_counts(db, account_id)
+        rule_count, transaction_count = dependencies["recurring_rules"], account_deletion.transaction_total(dependencies)
+        if rule_count or transaction_count:
             return {
                 "can_delete": False,
-                "dependencies": {
-                    "recurring_rules": len(dependent_rules),
-                    "transactions": transaction_count
-                },
-                "message": f"A kassza törléséhez előbb {len(dependent_rules)} ismétlődő szabály és {transaction_count} tranzakció törlése szükséges."
+                "dependencies": dependencies,
+                "message": f"A kassza törléséhez előbb {rule_count} ismétlődő szabály és {transaction_count} tranzakció törlése szükséges."
             }
+        return {"can_delete": True, "dependencies": dependencies}
 
     # Ha force=True, töröljük a függőségeket is
     try:
-        # 1. Recurring rules törlése
-        dependent_rules = db.query(models.RecurringRule).filter(
-            (models.RecurringRule.from_account_id == account_id) |
-            (models.RecurringRule.to_account_id == account_id)
-        ).all()
-
-        for rule in dependent_rules:
-            db.delete(rule)
-
-        # 2. Transactions törlése (csak ha szükséges)
-        transactions = db.query(models.Transaction).filter(
-            models.Transaction.account_id == account_id
-        ).all()
-
-        for trans in transactions:
-            db.delete(trans)
+        # A zárolás alatt nem érkezhet új tranzakció a kasszára
+        db_account = lock_accounts(db, [account_id]).get(account_id)
+        if not db_account or db_account.balance != 0:
+            raise HTTPException(status_code=400, detail="A kassza csak akkor törölhető, ha az egyenlege 0 Ft.")
+        family_id = db_account.family_id
+
+        transaction_count = account_deletion.transaction_total(account_deletion.dependency_counts(db, account_id))
+        if background or transaction_count > config.ACCOUNT_DELETE_BACKGROUND_THRESHOLD:
+            # A szabályok azonnal törlődnek (az ütemező ne fusson rájuk), a kassza archiválódik
+            rule_count = account_deletion.delete_rules(db, account_id)
+            account_deletion.mark_pending_purge(db, db_account)
+            events.publish(db, family_id, "account.deleted", {"id": account_id})
+            db.commit()
+            return {
+                "can_delete": True,
+                "background": True,
+                "status": "pending",
+                "deleted": {"recurring_rules": rule_count, "transactions": 0, "account": False},
+                "pending": {"transactions": transaction_count, "account": True},
+            }
 
-        # 3. Account törlése
-        db.delete(db_account)
+        deleted = account_deletion.delete_with_dependencies(db, account_id)
+        db.expunge(db_account)
+        events.publish(db, family_id, "account.deleted", {"id": account_id})
         db.commit()
 
         return {
             "can_delete": True,
             "deleted": {
-                "recurring_rules": len(dependent_rules),
-                "transactions": len(transactions),
+                "recurring_rules": deleted["recurring_rules"],
+                "transactions": deleted["transactions"],
+                "archived_transactions": deleted["archived_transactions"],
                 "account": True
             }
         }
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -1066,28 +1217,26 @@ def get_category_spending_analytics(
 
         ParentCategory = aliased(models.Category, name="parent_category")
 
-        # A véglegesen javított lekérdezés
+        # Élő sorok + az archivált hónapok összesítői (a hideg sorokat nem olvassuk)
+        month_start = datetime(year, month, 1)
+        expenses = archive.category_expenses(visible_account_ids, month_start, month_start + relativedelta(months=1),
+                                             family_view=False)
         category_stats = db.query(
             func.coalesce(ParentCategory.name, models.Category.name).label("name"),
             func.coalesce(ParentCategory.color, models.Category.color).label("color"),
-            func.sum(models.Transaction.amount).label("amount"),
-            func.count(models.Transaction.id).label("transactionCount"),
-        ).select_from(models.Transaction).join(
-            models.Category, models.Transaction.category_id == models.Category.id
+            func.sum(expenses.c.amount).label("amount"),
+            func.sum(expenses.c.transaction_count).label("transactionCount"),
+        ).select_from(expenses).join(
+            models.Category, expenses.c.category_id == models.Category.id
         ).outerjoin(
             ParentCategory, models.Category.parent_id == ParentCategory.id
-        ).filter(
-            models.Transaction.account_id.in_(visible_account_ids),
-            models.Transaction.type == 'kiadás',
-            extract('month', models.Transaction.date) == month,
-            extract('year', models.Transaction.date) == year
         ).group_by(
             # --- Itt van a javítás ---
             func.coalesce(ParentCategory.name, models.Category.name),
             func.coalesce(ParentCategory.color, models.Category.color)
             # --- Javítás vége ---
         ).order_by(
-            func.sum(models.Transaction.amount).desc()
+            func.sum(expenses.c.amount).desc()
         ).limit(10).all()
 
         return [
@@ -1095,7 +1244,7 @@ def get_category_spending_analytics(
                 "name": stat.name,
                 "color": stat.color or '#cccccc',
                 "amount": float(stat.amount),
-                "transactionCount": stat.transactionCount
+                "transactionCount": int(stat.transactionCount)
             }
             for stat in category_stats
         ]
@@ -1123,30 +1272,13 @@ def get_savings_trend_analytics(db: Session, user: models.User, year: int = None
         visible_account_ids = _get_analytics_account_ids(db, user)
         if not visible_account_ids: return []
 
+        # Az összes hónap egy csoportosított lekérdezéssel (élő sorok + archív összesítők)
+        flows = archive.monthly_flows(db, visible_account_ids, date(year, 1, 1), date(year, end_month, 1),
+                                      family_view=user.role in ["Családfő", "Szülő"])
         months = []
         # A ciklus már csak a releváns hónapokig fut
         for month in range(1, end_month + 1):
-            if user.role in ["Családfő", "Szülő"]:
-                income_filter = and_(models.Transaction.type == 'bevétel', models.Transaction.transfer_id == None)
-                expense_filter = and_(models.Transaction.type == 'kiadás', or_(models.Transaction.transfer_id == None, models.Transaction.is_family_expense == True))
-            else:
-                income_filter = and_(models.Transaction.type == 'bevétel')
-                expense_filter = and_(models.Transaction.type == 'kiadás')
-
-            monthly_income = db.query(func.sum(models.Transaction.amount)).filter(
-                models.Transaction.account_id.in_(visible_account_ids),
-                extract('month', models.Transaction.date) == month,
-                extract('year', models.Transaction.date) == year,
-                income_filter
-            ).scalar() or 0
-
-            monthly_expense = db.query(func.sum(models.Transaction.amount)).filter(
-                models.Transaction.account_id.in_(visible_account_ids),
-                extract('month', models.Transaction.date) == month,
-                extract('year', models.Transaction.date) == year,
-                expense_filter
-            ).scalar() or 0
-
+            monthly_income, monthly_expense = flows.get(date(year, month, 1), (0, 0))
             savings = float(monthly_income) - float(monthly_expense)
             months.append({"month": f"{year}.{month:02d}", "savings": savings, "income": float(monthly_income), "expenses": float(monthly_expense)})
 
@@ -1168,26 +1300,20 @@ def get_detailed_category_analytics(
         if not visible_account_ids:
             return {"categories": [], "subcategories": []}
 
-        base_filter = and_(
-            models.Transaction.account_id.in_(visible_account_ids),
-            models.Transaction.type == 'kiadás',
-            models.Transaction.date >= start_date,
-            models.Transaction.date <= end_date,
-        )
-        if user.role in ["Családfő", "Szülő"]:
-             base_filter = and_(base_filter, or_(
-                models.Transaction.transfer_id == None,
-                models.Transaction.is_family_expense == True
-            ))
+        # A záró nap teljes egészében beletartozik; az archivált időszakot a havi összesítők adják
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        expenses = archive.category_expenses(visible_account_ids, start, end,
+                                             family_view=user.role in ["Családfő", "Szülő"])
 
         query = db.query(
             models.Category.name.label('name'),
             models.Category.color.label('color'),
-            func.sum(models.Transaction.amount).label('amount'),
-            func.count(models.Transaction.id).label('transactionCount')
+            func.sum(expenses.c.amount).label('amount'),
+            func.sum(expenses.c.transaction_count).label('transactionCount')
         ).join(
-            models.Transaction, models.Transaction.category_id == models.Category.id
-        ).filter(base_filter)
+            expenses, expenses.c.category_id == models.Category.id
+        )
 
         if category_ids:
             query = query.filter(models.Category.id.in_(category_ids))
@@ -1197,7 +1323,7 @@ def get_detailed_category_analytics(
         ).group_by(
             models.Category.id, models.Category.name, models.Category.color
         ).order_by(
-            func.sum(models.Transaction.amount).desc()
+            func.sum(expenses.c.amount).desc()
         ).all()
 
 
@@ -1206,7 +1332,7 @@ def get_detailed_category_analytics(
         ).group_by(
             models.Category.id, models.Category.name, models.Category.color
         ).order_by(
-            func.sum(models.Transaction.amount).desc()
+            func.sum(expenses.c.amount).desc()
         ).all()
 
         return {
@@ -1215,7 +1341,7 @@ def get_detailed_category_analytics(
                     "name": stat.name,
                     "color": stat.color or '#cccccc',
                     "amount": float(stat.amount),
-                    "transactionCount": stat.transactionCount
+                    "transactionCount": int(stat.transactionCount)
                 }
                 for stat in category_stats
             ],
@@ -1224,7 +1350,7 @@ def get_detailed_category_analytics(
                     "name": stat.name,
                     "color": stat.color or '#cccccc',
                     "amount": float(stat.amount),
-                    "transactionCount": stat.transactionCount
+                    "transactionCount": int(stat.transactionCount)
                 }
                 for stat in subcategory_stats
             ]
@@ -1249,30 +1375,12 @@ def get_detailed_savings_analytics(
 
         results = []
         current = start.replace(day=1)
+        # Szerepkör-specifikus szűrők; minden hónap egy lekérdezésből (élő sorok + archív összesítők)
+        flows = archive.monthly_flows(db, visible_account_ids, current.date(), end.replace(day=1).date(),
+                                      family_view=user.role in ["Családfő", "Szülő"])
 
         while current <= end:
-            # Szerepkör-specifikus szűrők
-            if user.role in ["Családfő", "Szülő"]:
-                income_filter = and_(models.Transaction.type == 'bevétel', models.Transaction.transfer_id == None)
-                expense_filter = and_(models.Transaction.type == 'kiadás', or_(models.Transaction.transfer_id == None, models.Transaction.is_family_expense == True))
-            else:
-                income_filter = and_(models.Transaction.type == 'bevétel')
-                expense_filter = and_(models.Transaction.type == 'kiadás')
-
-            monthly_income = db.query(func.sum(models.Transaction.amount)).filter(
-                models.Transaction.account_id.in_(visible_account_ids),
-                extract('month', models.Transaction.date) == current.month,
-                extract('year', models.Transaction.date) == current.year,
-                income_filter
-            ).scalar() or 0
-
-            monthly_expense = db.query(func.sum(models.Transaction.amount)).filter(
-                models.Transaction.account_id.in_(visible_account_ids),
-                extract('month', models.Transaction.date) == current.month,
-                extract('year', models.Transaction.date) == current.year,
-                expense_filter
-            ).scalar() or 0
-
+            monthly_income, monthly_expense = flows.get(current.date(), (0, 0))
             savings = float(monthly_income) - float(monthly_expense)
             results.append({"month": current.strftime('%Y.%m'), "savings": savings, "income": float(monthly_income), "expenses": float(monthly_expense)})
 
@@ -1469,38 +1577,9 @@ def complete_expected_expense(db: Session, expense_id: int, completion_data: sch
 
     return db_expense
 
-def get_upcoming_events(db: Session, user: models.User):
-    today = date.today()
-    thirty_days_later = today + timedelta(days=30)
-    events = []
-
-    user_ids = [user.id]
-    if user.role in ["Családfő", "Szülő"]:
-        user_ids = [m.id for m in user.family.members]
-
-    recurring_rules = db.query(models.RecurringRule).options(joinedload(models.RecurringRule.owner_user)).filter(
-        models.RecurringRule.owner_id.in_(user_ids),
-        models.RecurringRule.is_active == True,
-        models.RecurringRule.next_run_date.between(today, thirty_days_later)
-    ).all()
-    for rule in recurring_rules:
-        events.append({
-            "date": rule.next_run_date, "description": rule.description, "amount": rule.amount,
-            "type": rule.type, "owner_name": rule.owner_user.display_name, "is_recurring": True
-        })
-
-    expected_expenses = db.query(models.ExpectedExpense).options(joinedload(models.ExpectedExpense.owner)).filter(
-        models.ExpectedExpense.owner_id.in_(user_ids),
-        models.ExpectedExpense.status == 'tervezett',
-        models.ExpectedExpense.due_date.between(today, thirty_days_later)
-    ).all()
-    for expense in expected_expenses:
-        events.append({
-            "date": expense.due_date, "description": expense.description, "amount": expense.estimated_amount,
-            "type": 'tervezett kiadás', "owner_name": expense.owner.display_name, "is_recurring": expense.is_recurring
-        })
-
-    return sorted(events, key=lambda e: e['date'])
+def get_upcoming_events(db: Session, user: models.User, limit: int = None, days: int = None):
+    """ A következő napok várható pénzmozgásai időrendben (lásd upcoming.py). """
+    return upcoming.upcoming_events(db, user, limit=limit, days=days)
 
 # --- Category CRUD ---
 def get_category(db: Session, category_id: int):
@@ -1618,6 +1697,138 @@ def get_wishes_by_family(db: Session, user: models.User,
 
     return base_query.order_by(models.Wish.created_at.desc()).offset(skip).limit(limit).all()
 
+def _group_rows_by_wish(query, build):
+    grouped = {}
+    for row in query:
+        grouped.setdefault(row.wish_id, []).append(build(row))
+    return grouped
+
+def get_wish_rows_by_family(db: Session, user: models.User,
+                            statuses: Optional[List[str]] = None,
+                            owner_ids: Optional[List[int]] = None,
+                            category_ids: Optional[List[int]] = None,
+                            skip: int = 0, limit: int = 100):
+    """
+    A get_wishes_by_family könnyű változata a lista végponthoz: a fő sorokat
+    egy oszlop-projekcióval, a képeket, linkeket, jóváhagyásokat és előzményeket
+    egy-egy kötegelt lekérdezéssel olvassa, és kész dict-eket ad vissza.
+    """
+    W, U, C, A = models.Wish, models.User, models.Category, models.Account
+    query = db.query(
+        W.id, W.name, W.description, W.estimated_price, W.priority, W.category_id, W.deadline,
+        W.status, W.owner_user_id, W.family_id, W.goal_account_id,
+        W.approvals_required, W.approvals_received,
+        U.display_name.label("owner_display_name"), U.avatar_url.label("owner_avatar_url"),
+        C.name.label("category_name"), C.parent_id.label("category_parent_id"),
+        C.color.label("category_color"), C.icon.label("category_icon"),
+        A.name.label("goal_name"), A.type.label("goal_type"), A.goal_amount.label("goal_goal_amount"),
+        A.goal_date.label("goal_goal_date"), A.balance.label("goal_balance"),
+        A.family_id.label("goal_family_id"), A.owner_user_id.label("goal_owner_user_id"),
+    ).join(U, W.owner_user_id == U.id) \
+     .outerjoin(C, W.category_id == C.id) \
+     .outerjoin(A, W.goal_account_id == A.id) \
+     .filter(W.family_id == user.family_id)
+
+    # Jogosultsági szűrés: a gyerekek nem látják mások vázlatait
+    if user.role not in ["Családfő", "Szülő"]:
+        query = query.filter(or_(W.status != 'draft', W.owner_user_id == user.id))
+
+    if statuses:
+        query = query.filter(W.status.in_(statuses))
+    if owner_ids:
+        query = query.filter(W.owner_user_id.in_(owner_ids))
+    if category_ids:
+        query = query.filter(W.category_id.in_(category_ids))
+
+    rows = query.order_by(W.created_at.desc()).offset(skip).limit(limit).all()
+    if not rows:
+        return []
+    wish_ids = [row.id for row in rows]
+
+    # Listában csak a borítókép (az első a galériából) és a képek száma; a teljes galéria a részletek nézetben
+    I = models.WishImage
+    covers = _group_rows_by_wish(
+        db.query(
+            I.id, I.wish_id, I.image_url, I.image_order, I.thumbnail_url, I.width, I.height,
+            func.count().over(partition_by=I.wish_id).label("image_count"),
+        ).filter(I.wish_id.in_(wish_ids))
+        .distinct(I.wish_id).order_by(I.wish_id, I.image_order, I.id),
+        lambda r: ({
+            "image_url": r.image_url, "image_order": r.image_order, "id": r.id, "wish_id": r.wish_id,
+            "thumbnail_url": r.thumbnail_url, "width": r.width, "height": r.height,
+        }, r.image_count),
+    )
+    links = _group_rows_by_wish(
+        db.query(models.WishLink.id, models.WishLink.wish_id, models.WishLink.url, models.WishLink.title)
+        .filter(models.WishLink.wish_id.in_(wish_ids)).order_by(models.WishLink.id),
+        lambda r: {"url": r.url, "title": r.title, "id": r.id, "wish_id": r.wish_id},
+    )
+    approvals = _group_rows_by_wish(
+        db.query(
+            models.WishApproval.id, models.WishApproval.wish_id, models.WishApproval.approver_user_id,
+            models.WishApproval.status, models.WishApproval.feedback, models.WishApproval.conditional_note,
+            U.display_name, U.avatar_url,
+        ).join(U, models.WishApproval.approver_user_id == U.id)
+        .filter(models.WishApproval.wish_id.in_(wish_ids)).order_by(models.WishApproval.id),
+        lambda r: {
+            "id": r.id, "wish_id": r.wish_id, "approver_user_id": r.approver_user_id, "status": r.status,
+            "feedback": r.feedback, "conditional_note": r.conditional_note,
+            "approver": {"id": r.approver_user_id, "display_name": r.display_name, "avatar_url": r.avatar_url},
+        },
+    )
+    history = _group_rows_by_wish(
+        db.query(
+            models.WishHistory.id, models.WishHistory.wish_id, models.WishHistory.user_id,
+            models.WishHistory.action, models.WishHistory.notes, models.WishHistory.created_at,
+            U.display_name, U.avatar_url,
+        ).join(U, models.WishHistory.user_id == U.id)
+        .filter(models.WishHistory.wish_id.in_(wish_ids)).order_by(models.WishHistory.id),
+        lambda r: {
+            "id": r.id, "action": r.action, "notes": r.notes, "created_at": r.created_at,
+            "user": {"id": r.user_id, "display_name": r.display_name, "avatar_url": r.avatar_url},
+        },
+    )
+
+    result = []
+    for row in rows:
+        category = None
+        if row.category_id is not None and row.category_name is not None:
+            category = {
+                "name": row.category_name, "parent_id": row.category_parent_id,
+                "color": row.category_color, "icon": row.category_icon, "id": row.category_id,
+            }
+        goal_account = None
+        if row.goal_account_id is not None and row.goal_name is not None:
+            goal_account = {
+                "name": row.goal_name, "type": row.goal_type, "goal_amount": row.goal_goal_amount,
+                "goal_date": row.goal_goal_date, "id": row.goal_account_id, "balance": row.goal_balance,
+                "family_id": row.goal_family_id, "owner_user_id": row.goal_owner_user_id,
+            }
+        result.append({
+            "name": row.name,
+            "description": row.description,
+            "estimated_price": row.estimated_price,
+            "priority": row.priority,
+            "category_id": row.category_id,
+            "deadline": row.deadline,
+            "id": row.id,
+            "status": row.status,
+            "owner_user_id": row.owner_user_id,
+            "family_id": row.family_id,
+            "goal_account_id": row.goal_account_id,
+            "owner": {"id": row.owner_user_id, "display_name": row.owner_display_name, "avatar_url": row.owner_avatar_url},
+            "category": category,
+            "images": [covers[row.id][0][0]] if row.id in covers else [],
+            "links": links.get(row.id, []),
+            "approvals": approvals.get(row.id, []),
+            "goal_account": goal_account,
+            "history": history.get(row.id, []),
+            "image_count": covers[row.id][0][1] if row.id in covers else 0,
+            "approvals_required": row.approvals_required,
+            "approvals_received": row.approvals_received,
+        })
+    return result
+
 def create_wish(db: Session, wish: schemas.WishCreate, user: models.User):
     """
     Létrehoz egy új kívánságot a hozzá tartozó képekkel és linkekkel.
@@ -1645,6 +1856,9 @@ def create_wish(db: Session, wish: schemas.WishCreate, user: models.User):
     # hogy a 'db_wish' objektum megkapja az adatbázis által generált ID-ját,
     # amit a képek, linkek és előzmények mentéséhez használni tudunk.
     db.flush()
+    if db_wish.status == 'pending':
+        _open_approval_round(db, db_wish)
+        notifications.wish_submitted(db, db_wish, user)
 
     # 4. Linkek feldolgozása és hozzáadása a kívánsághoz.
     if wish.links:
@@ -1652,35 +1866,19 @@ def create_wish(db: Session, wish: schemas.WishCreate, user: models.User):
             db_link = models.WishLink(**link_data.model_dump(), wish_id=db_wish.id, link_order=i)
             db.add(db_link)
 
-    # 5. Képfeltöltés kezelése.
-    # Éles környezetben itt egy felhő tárhelyre (pl. AWS S3, Firebase Storage) történne a feltöltés.
-    # Most a fájl elérési útját mentjük el.
+    # 5. Képfeltöltés kezelése: base64 képek a tartalom-címzett tárba (azonos kép egyszer kerül lemezre).
+    # A bélyegképet és a méreteket a végpont háttérfeladata állítja elő.
     if wish.images:
-        upload_dir = "uploads/wish_images"
-        os.makedirs(upload_dir, exist_ok=True)
-
         for i, img_base64 in enumerate(wish.images):
             try:
                 header, encoded = img_base64.split(",", 1)
-                image_data = base64.b64decode(encoded)
-
-                file_extension = header.split("/")[1].split(";")[0]
-                # Egyedi fájlnév generálása a félreértések elkerülése végett
-                filename = f"{db_wish.id}_{user.id}_{datetime.utcnow().timestamp()}_{i}.{file_extension}"
-                filepath = os.path.join(upload_dir, filename)
-
-                # A fájl mentése a szerverre (a kikommentezett rész)
-                # with open(filepath, "wb") as f:
-                #     f.write(image_data)
-
-                image_url = f"/{filepath}" # Relatív URL-ként mentjük
-
-                db_image = models.WishImage(
-                    wish_id=db_wish.id,
-                    image_url=image_url,
-                    image_order=i
-                )
-                db.add(db_image)
+                content_type = header.split(":", 1)[-1].split(";")[0]
+                extension = uploads.IMAGE_EXTENSIONS.get(content_type)
+                if extension is None:
+                    print(f"Nem támogatott képtípus: {content_type}")
+                    continue
+                content_hash, path, byte_size = uploads.store_wish_image_bytes(base64.b64decode(encoded), extension)
+                db.add(_new_wish_image(db, db_wish.id, i, content_hash, uploads.upload_url(path), byte_size))
             except Exception as e:
                 print(f"Hiba a képfeldolgozás során: {e}")
                 continue
@@ -1698,6 +1896,59 @@ def create_wish(db: Session, wish: schemas.WishCreate, user: models.User):
 
     return db_wish
 
+def _new_wish_image(db: Session, wish_id: int, image_order: int, content_hash: str, image_url: str, byte_size: int):
+    """ Új WishImage sor; ha ez a tartalom már fel van dolgozva, a metaadatot átvesszük. """
+    known = db.query(models.WishImage.width, models.WishImage.height, models.WishImage.thumbnail_url).filter(
+        models.WishImage.content_hash == content_hash,
+        models.WishImage.thumbnail_url.isnot(None)
+    ).first()
+    return models.WishImage(
+        wish_id=wish_id, image_url=image_url, image_order=image_order,
+        content_hash=content_hash, byte_size=byte_size,
+        width=known.width if known else None,
+        height=known.height if known else None,
+        thumbnail_url=known.thumbnail_url if known else None,
+    )
+
+def get_image_editable_wish(db: Session, wish_id: int, user: models.User):
+    """ A kívánság, ha a felhasználó képet tölthet fel hozzá; különben 404/403. """
+    db_wish = get_wish(db, wish_id, user)
+    if not db_wish:
+        raise HTTPException(status_code=404, detail="Kívánság nem található.")
+    if user.id != db_wish.owner_user_id or db_wish.status not in ['draft', 'modifications_requested']:
+        raise HTTPException(status_code=403, detail="Nincs jogosultságod a kívánság módosításához ebben az állapotban.")
+    return db_wish
+
+def add_wish_image(db: Session, wish_id: int, user: models.User, content_hash: str, image_url: str, byte_size: int):
+    """
+    Feltöltött kép hozzáadása a galéria végére. Ugyanaz a tartalom egy
+    kívánsághoz csak egyszer kerül fel: ilyenkor a meglévő sort adjuk vissza.
+    """
+    get_image_editable_wish(db, wish_id, user)
+
+    existing = db.query(models.WishImage).filter(
+        models.WishImage.wish_id == wish_id, models.WishImage.content_hash == content_hash
+    ).first()
+    if existing:
+        return existing
+
+    next_order = db.query(func.coalesce(func.max(models.WishImage.image_order) + 1, 0)).filter(
+        models.WishImage.wish_id == wish_id
+    ).scalar()
+    db_image = _new_wish_image(db, wish_id, next_order, content_hash, image_url, byte_size)
+    db.add(db_image)
+    db.commit()
+    db.refresh(db_image)
+    return db_image
+
+def update_wish_image_metadata(db: Session, content_hash: str, width: int, height: int, thumbnail_url: str):
+    """ A háttérben elkészült bélyegkép adatai minden azonos tartalmú képsorra. """
+    updated = db.query(models.WishImage).filter(models.WishImage.content_hash == content_hash).update(
+        {"width": width, "height": height, "thumbnail_url": thumbnail_url}, synchronize_session=False
+    )
+    db.commit()
+    return updated
+
 def update_wish(db: Session, wish_id: int, wish_data: schemas.WishCreate, user: models.User):
     """Frissít egy meglévő kívánságot, és naplózza a változást."""
     db_wish = get_wish(db, wish_id, user)
@@ -1725,6 +1976,7 @@ def update_wish(db: Session, wish_id: int, wish_data: schemas.WishCreate, user:
     # Ha módosítás után visszakerül vázlatba, újra be kell küldeni
     if db_wish.status == 'modifications_requested':
         db_wish.status = 'draft'
+        notifications.wish_owner_acted(db, db_wish)
 
     db.add(db_wish)
     db.commit()
@@ -1747,9 +1999,45 @@ def delete_wish(db: Session, wish_id: int, user: models.User):
          raise HTTPException(status_code=403, detail="Nincs jogosultságod a kívánság törléséhez.")
 
     db_wish.deleted_at = datetime.utcnow()
+    _close_approval_round(db, db_wish.id)
+    notifications.wish_removed(db, db_wish)
     db.commit()
     return {"detail": "Kívánság sikeresen törölve"}
 
+def _publish_wish_state(db: Session, db_wish: models.Wish):
+    events.publish(db, db_wish.family_id, "wish.updated", {
+        "id": db_wish.id, "status": db_wish.status,
+        "approvals_required": db_wish.approvals_required, "approvals_received": db_wish.approvals_received,
+    })
+
+def _open_approval_round(db: Session, db_wish: models.Wish):
+    """
+    Új jóváhagyási kör: a szükséges döntések száma és a várakozó szülők
+    halmaza a beküldés pillanatában rögzül. Commit nélkül.
+    """
+    approver_ids = [row.id for row in db.query(models.User.id).filter(
+        models.User.family_id == db_wish.family_id,
+        models.User.role.in_(['Családfő', 'Szülő']),
+        models.User.id != db_wish.owner_user_id
+    )]
+    required_approvals = len(approver_ids)
+    if required_approvals == 0 and db_wish.owner.role in ['Szülő', 'Családfő']:
+        required_approvals = 1
+
+    db_wish.approvals_required = required_approvals
+    db_wish.approvals_received = 0
+    db_wish.has_conditional_approval = False
+    _close_approval_round(db, db_wish.id)
+    if approver_ids:
+        db.execute(insert(models.WishPendingApprover), [
+            {"wish_id": db_wish.id, "user_id": approver_id} for approver_id in approver_ids
+        ])
+
+def _close_approval_round(db: Session, wish_id: int):
+    db.query(models.WishPendingApprover).filter(
+        models.WishPendingApprover.wish_id == wish_id
+    ).delete(synchronize_session=False)
+
 def submit_wish_for_approval(db: Session, wish_id: int, user: models.User):
     """Beküldi a vázlat vagy módosításra visszaküldött kívánságot jóváhagyásra."""
     db_wish = get_wish(db, wish_id, user)
@@ -1769,6 +2057,10 @@ def submit_wish_for_approval(db: Session, wish_id: int, user: models.User):
     # --- JAVÍTÁS VÉGE ---
 
     db_wish.status = 'pending'
+    _open_approval_round(db, db_wish)
+    notifications.wish_owner_acted(db, db_wish)
+    notifications.wish_submitted(db, db_wish, user)
+    _publish_wish_state(db, db_wish)
 
     create_history_entry(db, wish_id=wish_id, user_id=user.id, action="submitted")
     db.commit()
@@ -1788,6 +2080,8 @@ def process_wish_approval(db: Session, wish_id: int, approval_data: schemas.Wish
     db_wish = get_wish(db, wish_id, approver)
     if not db_wish:
         raise HTTPException(status_code=404, detail="Kívánság nem található.")
+    # A wish sor zárolása: a párhuzamos döntések sorban frissítik a számlálókat
+    db_wish = db.query(models.Wish).filter(models.Wish.id == wish_id).with_for_update(of=models.Wish).populate_existing().one()
     if db_wish.status != 'pending':
         raise HTTPException(status_code=400, detail="Ez a kívánság jelenleg nem hagyható jóvá.")
     if db_wish.owner_user_id == approver.id:
@@ -1816,35 +2110,24 @@ def process_wish_approval(db: Session, wish_id: int, approval_data: schemas.Wish
     )
     db.add(new_approval)
 
-    # Döntés alapján a kívánság státuszának frissítése
+    # Döntés alapján a kívánság státuszának frissítése (a számlálók a zárolt soron)
+    db.query(models.WishPendingApprover).filter(
+        models.WishPendingApprover.wish_id == wish_id,
+        models.WishPendingApprover.user_id == approver.id
+    ).delete(synchronize_session=False)
+
     if approval_data.status in ['rejected', 'modifications_requested']:
         db_wish.status = approval_data.status
+        _close_approval_round(db, wish_id)
     elif approval_data.status in ['approved', 'conditional']:
-        parents = db.query(models.User).filter(
-            models.User.family_id == db_wish.family_id,
-            models.User.role.in_(['Családfő', 'Szülő'])
-        ).all()
-        
-        approving_parents = [p for p in parents if p.id != db_wish.owner_user_id]
-        required_approvals = len(approving_parents)
-        if required_approvals == 0 and db_wish.owner.role in ['Szülő', 'Családfő']:
-             required_approvals = 1
-
-        current_approvals_count = db.query(models.WishApproval).filter(
-            models.WishApproval.wish_id == wish_id,
-            models.WishApproval.status.in_(['approved', 'conditional'])
-        ).count() + 1
-
-        is_fully_supported = current_approvals_count >= required_approvals
-
-        if is_fully_supported:
-            has_conditional = db.query(models.WishApproval).filter(
-                models.WishApproval.wish_id == wish_id,
-                models.WishApproval.status == 'conditional'
-            ).count() > 0 or approval_data.status == 'conditional'
+        db_wish.approvals_received += 1
+        if approval_data.status == 'conditional':
+            db_wish.has_conditional_approval = True
 
-            db_wish.status = 'conditional' if has_conditional else 'approved'
+        if db_wish.approvals_received >= db_wish.approvals_required:
+            db_wish.status = 'conditional' if db_wish.has_conditional_approval else 'approved'
             db_wish.approved_at = datetime.utcnow()
+            _close_approval_round(db, wish_id)
             
             # === A LÉNYEG: Itt már NINCS automatikus kassza létrehozás ===
 
@@ -1853,6 +2136,8 @@ def process_wish_approval(db: Session, wish_id: int, approval_data: schemas.Wish
     if approval_data.feedback:
         notes += f" Visszajelzés: {approval_data.feedback}"
     create_history_entry(db, wish_id=wish_id, user_id=approver.id, action=approval_data.status, notes=notes)
+    notifications.wish_decided(db, db_wish, approver, approval_data.status)
+    _publish_wish_state(db, db_wish)
 
     db.commit()
     db.refresh(db_wish)
@@ -1860,42 +2145,12 @@ def process_wish_approval(db: Session, wish_id: int, approval_data: schemas.Wish
 
 # A backend/crud.py fájlban, a többi CRUD függvény mellé
 
-def get_dashboard_notifications(db: Session, user: models.User):
-    """Összegyűjti a dashboardon megjelenítendő értesítéseket a felhasználó számára."""
-    notifications = []
-
-    # 1. Jóváhagyásra váró kívánságok (csak szülőknek)
-    if user.role in ["Családfő", "Szülő"]:
-        pending_wishes_count = db.query(models.Wish).filter(
-            models.Wish.family_id == user.family_id,
-            models.Wish.status == 'pending',
-            # Olyan kívánság, amihez ennek a szülőnek még nincs jóváhagyása
-            ~models.Wish.approvals.any(models.WishApproval.approver_user_id == user.id)
-        ).count()
-
-        if pending_wishes_count > 0:
-            notifications.append({
-                "type": "pending_approvals",
-                "message": f"{pending_wishes_count} kívánság vár a jóváhagyásodra.",
-                "link": "/wishes?tab=pending"
-            })
-
-    # 2. Módosításra visszaküldött kívánságok (csak a tulajdonosnak)
-    mod_requested_count = db.query(models.Wish).filter(
-        models.Wish.owner_user_id == user.id,
-        models.Wish.status == 'modifications_requested'
-    ).count()
-
-    if mod_requested_count > 0:
-        notifications.append({
-            "type": "modifications_requested",
-            "message": f"{mod_requested_count} kívánságod módosításra vár.",
-            "link": "/wishes?tab=my-wishes"
-        })
-
-    # TODO: Később itt lehetne még több értesítés, pl. "Elérte a célját a kassza"
-
-    return notifications
+def get_dashboard_notifications(db: Session, user: models.User, limit: int = 10):
+    """A dashboard sávja: a felhasználó legfrissebb olvasatlan értesítései a postafiókból."""
+    return db.query(models.Notification).filter(
+        models.Notification.user_id == user.id,
+        models.Notification.read_at.is_(None)
+    ).order_by(models.Notification.id.desc()).limit(limit).all()
 
 def create_history_entry(db: Session, wish_id: int, user_id: int, action: str, notes: str = None, old_values: dict = None, new_values: dict = None):
     """Létrehoz egy új bejegyzést a WishHistory táblában."""
@@ -1968,6 +2223,7 @@ def activate_wish(db: Session, wish_id: int, user: models.User, goal_account_id:
         # Dinamikusan növeljük a célkassza célösszegét a kívánság becsült árával
         if db_wish.estimated_price and target_account.goal_amount is not None:
             target_account.goal_amount += db_wish.estimated_price
+            goal_progress.refresh(db, target_account)
 
         notes = f"Gyűjtés hozzárendelve a(z) '{target_account.name}' kasszához."
 
@@ -2001,108 +2257,131 @@ def activate_wish(db: Session, wish_id: int, user: models.User, goal_account_id:
 
     return db_wish
 
-def close_goal_account(db: Session, account_id: int, user: models.User, request_data: schemas.GoalCloseRequest):
+def apply_close_goal_account(db: Session, account_id: int, user: models.User, request_data: schemas.GoalCloseRequest):
     """
     Lezár egy célkasszát: rögzíti a vásárlást, kezeli a maradványt vagy
-    a túlköltekezést, és archiválja a kasszát. (VÉGLEGES, LOGIKAI HIBÁKTÓL MENTES VERZIÓ)
+    a túlköltekezést, és archiválja a kasszát. Commit nélkül, egyetlen
+    munkaegységként: egy láthatósági lekérdezés, az érintett kasszák egyszeri
+    zárolása (hiánynál a személyes kasszáé utólag), minden ellenőrzés a
+    módosítások előtt, egy flush. A hívó egyszer commitol; bármely hiba az
+    egészet visszavonja.
     """
     if user.role not in ["Családfő", "Szülő"]:
         raise HTTPException(status_code=403, detail="Nincs jogosultságod a kassza lezárásához.")
 
-    db_account = get_account(db, account_id, user)
+    visible_ids = get_visible_account_ids(db, user=user, status=None)
+    ensure_account_visible(db, account_id, user, visible_ids)
+    remainder_account_id = request_data.remainder_destination_account_id
+
+    # A célkasszát és a maradvány célját egyszerre, id sorrendben zároljuk
+    locked = lock_accounts(db, [acc_id for acc_id in (account_id, remainder_account_id) if acc_id])
+    db_account = locked.get(account_id)
     if not db_account or db_account.type != 'cél' or db_account.status == 'archived':
         raise HTTPException(status_code=404, detail="Aktív célkassza nem található.")
 
     final_amount = request_data.final_amount
-    initial_balance = db_account.balance
-
+    previous_balances = {acc_id: account.balance for acc_id, account in locked.items()}
     # Különbözet számítása a VÁSÁRLÁS ELŐTT
-    difference = initial_balance - final_amount
-
-    # 1. A vásárlás rögzítése kiadási tranzakcióként
-    # Ez a lépés csökkenteni fogja a db_account.balance értékét
-    create_account_transaction(
-        db=db,
-        transaction=schemas.TransactionCreate(
-            description=request_data.description or f"Vásárlás: {db_account.name}",
-            amount=final_amount,
-            type='kiadás',
-            category_id=request_data.category_id,
-        ),
-        account_id=account_id,
-        user=user,
-        is_internal=True
-    )
+    difference = db_account.balance - final_amount
 
-    # 2. Maradvány vagy hiány kezelése a KORÁBBAN KISZÁMOLT KÜLÖNBSÉG ALAPJÁN
-    if difference > 0:  # ESET 1: Olcsóbb volt a vásárlás -> MARADVÁNY
-        if not request_data.remainder_destination_account_id:
-            db.rollback()
+    # 1. Ellenőrzések, még minden módosítás előtt
+    transfer = None
+    if difference > 0:  # Olcsóbb volt a vásárlás -> MARADVÁNY
+        if not remainder_account_id:
             raise HTTPException(status_code=400, detail="A maradványösszeg átutalásához meg kell adni egy célkasszát.")
-        
-        # A maradványt (difference) utaljuk, ami a helyes, vásárlás utáni egyenleg
-        create_transfer(
-            db=db,
-            transfer_data=schemas.TransferCreate(
-                from_account_id=account_id,
-                to_account_id=request_data.remainder_destination_account_id,
-                amount=difference,
-                description=f"Maradvány átvezetése: {db_account.name}"
-            ),
-            user=user
-        )
-    elif difference < 0:  # ESET 2: Drágább volt a vásárlás -> HIÁNY
+        if remainder_account_id == account_id:
+            raise HTTPException(status_code=400, detail="A forrás és cél kassza nem lehet ugyanaz.")
+        ensure_account_visible(db, remainder_account_id, user, visible_ids)
+        transfer = (db_account, locked[remainder_account_id], schemas.TransferCreate(
+            from_account_id=account_id, to_account_id=remainder_account_id, amount=difference,
+            description=f"Maradvány átvezetése: {db_account.name}"
+        ))
+    elif difference < 0:  # Drágább volt a vásárlás -> HIÁNY
         deficit = abs(difference)
         owner = db_account.owner_user
         if not owner:
-            db.rollback()
             raise HTTPException(status_code=400, detail="A túlköltekezés nem fedezhető, mert a célkasszának nincs tulajdonosa.")
-
-        owner_personal_account = db.query(models.Account).filter(
+        # Csak hiánynál kell a tulajdonos személyes kasszája; ha több is van, a legrégebbi aktív
+        owner_personal_account_id = db.query(models.Account.id).filter(
             models.Account.owner_user_id == owner.id,
-            models.Account.type == 'személyes'
-        ).first()
-
+            models.Account.type == 'személyes',
+            models.Account.status != 'archived'
+        ).order_by(models.Account.id).limit(1).scalar()
+        # Utólagos zárolás: az esetleges holtpontot a run_in_transaction újrapróbálja
+        locked.update(lock_accounts(db, [owner_personal_account_id] if owner_personal_account_id else []))
+        owner_personal_account = locked.get(owner_personal_account_id)
         if not owner_personal_account or owner_personal_account.balance < deficit:
-            db.rollback()
             raise HTTPException(status_code=400, detail=f"Sikertelen lezárás. A {deficit:,.0f} Ft túlköltekezést nem lehet fedezni a tulajdonos ({owner.display_name}) személyes kasszájából.".replace(",", " "))
+        ensure_account_visible(db, owner_personal_account.id, user, visible_ids)
+        transfer = (owner_personal_account, db_account, schemas.TransferCreate(
+            from_account_id=owner_personal_account.id, to_account_id=account_id, amount=deficit,
+            description=f"Túlköltekezés fedezése: {db_account.name}"
+        ))
 
-        # A hiányt (deficit) pótoljuk a személyes kasszából
-        create_transfer(
-            db=db,
-            transfer_data=schemas.TransferCreate(
-                from_account_id=owner_personal_account.id,
-                to_account_id=account_id,
-                amount=deficit,
-                description=f"Túlköltekezés fedezése: {db_account.name}"
-            ),
-            user=user
-        )
-
-    # 3. Kassza archiválása és naplózás
+    # 2. A vásárlás kiadásként (belső tranzakció: a célkasszán is megengedett)
+    purchase = models.Transaction(
+        description=request_data.description or f"Vásárlás: {db_account.name}",
+        amount=final_amount,
+        type='kiadás',
+        category_id=request_data.category_id,
+        account_id=account_id,
+        creator=user
+    )
+    db_account.balance -= final_amount
+    rows = [purchase]
+
+    # 3. Maradvány vagy hiány átvezetése a már zárolt kasszákon
+    if transfer:
+        from_account, to_account, transfer_data = transfer
+        _, pair = _build_transfer(from_account, to_account, transfer_data, user)
+        rows.extend(pair)
+        goal_progress.record_transfers(db, [(from_account, to_account, transfer_data.amount)])
+    # A vásárlás (nem átutalás) is módosította az egyenleget: a becslés ehhez igazodik
+    goal_progress.refresh(db, db_account)
+
+    # 4. Kassza archiválása és naplózás
     db_account.status = 'archived'
     if not db_account.name.startswith("[Teljesítve]"):
         db_account.name = f"[Teljesítve] {db_account.name}"
-
-    account_history_entry = models.AccountHistory(
+    rows.append(models.AccountHistory(
         account_id=account_id, user_id=user.id, family_id=user.family_id, action="archived",
         details={"closed_by": user.display_name, "final_amount": float(final_amount)}
-    )
-    db.add(account_history_entry)
-
-    for wish in db_account.wishes:
-        if wish.status != 'completed':
-            wish.status = 'completed'
-            wish.completed_at = datetime.utcnow()
-            create_history_entry(
-                db, wish_id=wish.id, user_id=user.id, action='completed',
-                notes=f"Teljesítve a(z) '{db_account.name}' kassza lezárásával."
-            )
+    ))
+    db.add_all(rows)
+
+    # 5. A kívánságok teljesítése egy UPDATE ... RETURNING-gel, az előzmények egy kötegelt INSERT-tel
+    completed_at = datetime.utcnow()
+    completed_ids = [row.id for row in db.execute(
+        update(models.Wish)
+        .where(models.Wish.goal_account_id == account_id, models.Wish.status != 'completed')
+        .values(status='completed', completed_at=completed_at)
+        .returning(models.Wish.id)
+        .execution_options(synchronize_session="fetch")
+    )]
+    if completed_ids:
+        notes = f"Teljesítve a(z) '{db_account.name}' kassza lezárásával."
+        db.execute(insert(models.WishHistory), [
+            {"wish_id": wish_id, "user_id": user.id, "action": "completed", "notes": notes}
+            for wish_id in completed_ids
+        ])
 
-    db.commit()
-    db.refresh(db_account)
-    
-    return {"message": "Célkassza sikeresen lezárva és archiválva.", "account": db_account}
+    db.flush()
+    notifications.goals_reached(db, [acc for acc_id, acc in locked.items() if acc_id != account_id], previous_balances)
+    notifications.goal_closed(db, account_id)
+    _publish_balances(db, locked.values())
+    _publish_transaction(db, db_account.family_id, "transaction.created", purchase)
+    if completed_ids:
+        # Egy esemény az összes teljesített kívánságról
+        events.publish(db, db_account.family_id, "wishes.completed", {
+            "ids": completed_ids, "goal_account_id": account_id, "status": "completed",
+        })
+    return {
+        "message": "Célkassza sikeresen lezárva és archiválva.",
+        "account": schemas.AccountSummary.model_validate(db_account).model_dump(mode="json"),
+    }
+
+def close_goal_account(db: Session, account_id: int, user: models.User, request_data: schemas.GoalCloseRequest):
+    return run_in_transaction(db, lambda: apply_close_goal_account(db, account_id, user, request_data))
 
 # ==============================================================================
 # ÚJ, KISZERVEZETT DASHBOARD LOGIKA
@@ -2247,11 +2526,12 @@ def get_dashboard_data(db: Session, user: models.User):
     next_month_forecast = get_financial_forecast(db, user, family_members_ids, start_date=start_of_next_month, end_date=end_of_next_month)
 
     # --- 3. Célok ---
-    personal_goals = db.query(models.Account).filter(models.Account.owner_user_id == user.id, models.Account.type == 'cél', models.Account.status == 'active').all()
+    # A haladás (átlagos havi befizetés, becsült dátum) az átutalásokkor frissített goal_progress sorból jön
+    personal_goals = db.query(models.Account).options(selectinload(models.Account.goal_progress)).filter(models.Account.owner_user_id == user.id, models.Account.type == 'cél', models.Account.status == 'active').all()
     
     family_goals = []
     if is_parent_role and user.family_id:
-        family_goals = db.query(models.Account).filter(
+        family_goals = db.query(models.Account).options(selectinload(models.Account.goal_progress)).filter(
             models.Account.family_id == user.family_id, 
             models.Account.type == 'cél',
             models.Account.status == 'active'
@@ -2386,6 +2666,13 @@ def delete_shift_template(db: Session, template_id: int, user_id: int):
     return False
 
 # Shift Assignment CRUD
+def _publish_shift_assignment(db: Session, type: str, assignment: models.ShiftAssignment):
+    family_id = db.query(models.User.family_id).filter(models.User.id == assignment.user_id).scalar()
+    events.publish(db, family_id, type, {
+        "id": assignment.id, "user_id": assignment.user_id, "date": assignment.date,
+        "template_id": assignment.template_id, "status": assignment.status,
+    })
+
 def create_shift_assignment(db: Session, assignment: schemas.ShiftAssignmentCreate, user_id: int):
     # Check if assignment already exists for this date
     existing = db.query(models.ShiftAssignment).filter(
@@ -2398,6 +2685,7 @@ def create_shift_assignment(db: Session, assignment: schemas.ShiftAssignmentCrea
         existing.template_id = assignment.template_id
         existing.status = assignment.status
         existing.notes = assignment.notes
+        _publish_shift_assignment(db, "shift_assignment.updated", existing)
         db.commit()
         db.refresh(existing)
         return existing
@@ -2411,6 +2699,8 @@ def create_shift_assignment(db: Session, assignment: schemas.ShiftAssignmentCrea
         notes=assignment.notes
     )
     db.add(db_assignment)
+    db.flush()
+    _publish_shift_assignment(db, "shift_assignment.updated", db_assignment)
     db.commit()
     db.refresh(db_assignment)
     return db_assignment
@@ -2451,6 +2741,7 @@ def update_shift_assignment(db: Session, assignment_id: int, assignment_update:
     
     for field, value in assignment_update.dict(exclude_unset=True).items():
         setattr(db_assignment, field, value)
+    _publish_shift_assignment(db, "shift_assignment.updated", db_assignment)
     
     db.commit()
     db.refresh(db_assignment)
@@ -2463,6 +2754,7 @@ def delete_shift_assignment(db: Session, assignment_id: int, user_id: int):
     ).first()
     
     if db_assignment:
+        _publish_shift_assignment(db, "shift_assignment.deleted", db_assignment)
         db.delete(db_assignment)
         db.commit()
         return True
@@ -2507,11 +2799,13 @@ def get_monthly_schedule(db: Session, user_id: int, month: int, year: int):
 
 # Calendar Integration CRUD
 def create_calendar_integration(db: Session, integration: schemas.CalendarIntegrationCreate, user_id: int):
+    calendar_sync.validate_source(integration.url)
     db_integration = models.CalendarIntegration(
         user_id=user_id,
         name=integration.name,
         type=integration.type,
-        sync_enabled=integration.sync_enabled
+        sync_enabled=integration.sync_enabled,
+        url=integration.url
     )
     db.add(db_integration)
     db.commit()
@@ -2532,7 +2826,13 @@ def update_calendar_integration(db: Session, integration_id: int, integration_up
     if not db_integration:
         return None
     
-    for field, value in integration_update.dict(exclude_unset=True).items():
+    update_data = integration_update.dict(exclude_unset=True)
+    if "url" in update_data and update_data["url"] != db_integration.url:
+        calendar_sync.validate_source(update_data["url"])
+        # Új forrásnál a feltételes letöltés állapota érvénytelen
+        db_integration.etag = None
+        db_integration.last_modified = None
+    for field, value in update_data.items():
         setattr(db_integration, field, value)
     
     db.commit()
@@ -2673,86 +2973,91 @@ def delete_family_event(db: Session, event_id: int, family_id: int):
 
 # User Status Management
 def update_user_status(db: Session, user_id: int, status_update: schemas.UserStatusUpdate):
+    """ A státusz a memóriabeli jelenlét tárba kerül; a történetet a háttér kötegelve írja. """
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         return None
-    
-    # Update current status
-    user.status = status_update.status
-    user.last_active = datetime.utcnow()
-    
-    # Create status history entry
-    status_history = models.UserStatusHistory(
-        user_id=user_id,
-        status=status_update.status,
-        changed_until=status_update.until,
-        note=status_update.note
-    )
-    db.add(status_history)
-    
-    db.commit()
-    db.refresh(user)
-    return user
+    return presence.store.set_status(user, status_update.status, note=status_update.note, until=status_update.until)
 
-def get_family_status(db: Session, family_id: int):
+def get_family_status(db: Session, family_id: int, today_items=None):
     members = db.query(models.User).filter(
         models.User.family_id == family_id
     ).all()
-    
+    member_ids = [member.id for member in members]
+
+    # A tagok mai műszakjai és eseményei az egységes idővonalból (forrásonként egy lekérdezés, cache-elve)
+    if today_items is None:
+        today_items = timeline.family_timeline(db, family_id, *timeline.day_window(date.today()), member_ids=member_ids)
+    shifts_by_user, events_by_user = {}, {}
+    for item in today_items:
+        if item.source in ("work_shift", "shift_assignment"):
+            shifts_by_user.setdefault(item.user_id, []).append(
+                {'name': item.title, 'start_time': item.start.strftime('%H:%M'), 'end_time': item.end.strftime('%H:%M')})
+        elif item.source in ("user_event", "calendar"):
+            events_by_user.setdefault(item.user_id, []).append(
+                {'title': item.title, 'start_time': item.start, 'end_time': item.end})
+
+    # Jelenlét a memóriából; akit ez a folyamat még nem látott, annál a tárolt last_active dönt
+    live = presence.store.family_snapshot(family_id)
+    now = datetime.utcnow()
     family_status = []
     for member in members:
-        # Get current shifts
-        today_weekday = datetime.now().weekday() + 1  # Monday = 1
-        current_shifts = db.query(models.WorkShift).filter(
-            models.WorkShift.user_id == member.id,
-            models.WorkShift.is_active == True,
-            models.WorkShift.days_of_week.contains(str(today_weekday))
-        ).all()
-        
-        # Get today's events
-        today_events = db.query(models.UserEvent).filter(
-            models.UserEvent.user_id == member.id,
-            func.date(models.UserEvent.start_time) == date.today()
-        ).all()
-        
+        current = live.get(member.id)
         family_status.append({
             'id': member.id,
             'name': member.display_name,
             'role': member.role,
-            'status': member.status or 'offline',
-            'last_active': member.last_active,
-            'current_shifts': [{'name': s.name, 'start_time': s.start_time, 'end_time': s.end_time} for s in current_shifts],
-            'today_events': [{'title': e.title, 'start_time': e.start_time, 'end_time': e.end_time} for e in today_events]
+            'status': current['status'] if current else presence.effective_status(member.status, member.last_active, now),
+            'last_active': current['last_active'] if current else member.last_active,
+            'current_shifts': shifts_by_user.get(member.id, []),
+            'today_events': events_by_user.get(member.id, [])
         })
     
     return family_status
 
+def get_family_timeline(db: Session, family_id: int, start_date: date = None, end_date: date = None):
+    """ Az egységes idővonal [start_date, end_date] napjaira (alapértelmezés: a következő 7 nap), ütközésekkel. """
+    start_date = start_date or date.today()
+    end_date = end_date or start_date + timedelta(days=6)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="A záró dátum nem lehet korábbi a kezdő dátumnál.")
+    if (end_date - start_date).days >= config.TIMELINE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Legfeljebb {config.TIMELINE_MAX_DAYS} nap kérhető le egyszerre.")
+    member_ids = [row.id for row in db.query(models.User.id).filter(models.User.family_id == family_id)]
+    window_start, window_end = timeline.day_window(start_date)[0], timeline.day_window(end_date)[1]
+    items = timeline.family_timeline(db, family_id, window_start, window_end, member_ids=member_ids)
+    return {
+        'start': window_start,
+        'end': window_end,
+        'items': [item.as_dict() for item in items],
+        'conflicts': timeline.conflicts(items, member_ids),
+    }
+
 # Dashboard Time Data
 def get_dashboard_time_data(db: Session, family_id: int):
-    # Get family status
-    family_members = get_family_status(db, family_id)
-    
-    # Get today's events
-    today_events = get_todays_events(db, family_id)
+    # A mai idővonal egyszer épül fel; a tagok státusza és a mai események is ebből dolgoznak
+    day_start, day_end = timeline.day_window(date.today())
+    today_items = timeline.family_timeline(db, family_id, day_start, day_end)
+    family_members = get_family_status(db, family_id, today_items)
+
     upcoming_events = [
         {
-            'time': event.start_time.strftime('%H:%M'),
-            'title': event.title,
-            'type': event.event_type,
-            'member': 'Család' if not event.involves_members else 'Résztvevők'
+            'time': item.start.strftime('%H:%M'),
+            'title': item.title,
+            'type': item.kind,
+            'member': 'Család' if not item.member_ids else 'Résztvevők'
         }
-        for event in today_events
+        for item in today_items
+        if item.source == "family_event" and item.start >= day_start
     ]
     
     # Get active conflicts
     conflicts = get_family_conflicts(db, family_id, "active")
     
-    # Get calendar sync status for all family members
-    family_member_ids = [member['id'] for member in family_members]
-    calendar_integrations = []
-    for member_id in family_member_ids:
-        integrations = get_user_calendar_integrations(db, member_id)
-        calendar_integrations.extend(integrations)
+    # A tagok naptár integrációi egy lekérdezéssel
+    calendar_integrations = db.query(models.CalendarIntegration).filter(
+        models.CalendarIntegration.user_id.in_([member['id'] for member in family_members])
+    ).all()
     
     return schemas.DashboardTimeData(
         family_members=family_members,
@@ -0,0 +1,204 @@
+# Élő családi változásértesítések (Server-Sent Events).
+# Az írási útvonalak a publish()-sel tömör eseményeket tesznek a DB munkamenetre;
+# ezek csak sikeres commit után mennek ki (rollbacknél eldobjuk őket).
+# Alapértelmezés: folyamaton belüli pub/sub. FAMILYHUB_EVENTS_BACKEND=postgres
+# esetén a commit pg_notify-on keresztül minden workerhez eljut (LISTEN szál).
+import asyncio
+import itertools
+import json
+import select
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from . import config
+from .database import SessionLocal, engine
+from .serialization import dumps
+
+PG_CHANNEL = "familyhub_events"
+_PENDING_KEY = "pending_family_events"
+_SUBSCRIBER_QUEUE_SIZE = 256
+# Ekkora tétlen várakozás után a LISTEN szál ellenőrzi, hogy le kell-e állnia
+_LISTEN_POLL_SECONDS = 5.0
+
+
+class _Subscriber:
+    __slots__ = ("loop", "queue", "overflowed")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, message: str):
+        # Csak az eseményhurok szálán fut (call_soon_threadsafe)
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A lassú kliens nem tartja fel a többieket: újratöltést kérünk tőle
+            self.overflowed = True
+
+
+class Broker:
+    """ Folyamaton belüli, családonkénti feliratkozások; bármely szálból publikálható. """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, family_id: int) -> _Subscriber:
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[family_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, family_id: int, subscriber: _Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(family_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[family_id]
+
+    def dispatch(self, family_id: int, payload: str):
+        """ Egy már szerializált esemény kiküldése a család feliratkozóinak. """
+        with self._lock:
+            subscribers = list(self._subscribers.get(family_id, ()))
+        if not subscribers:
+            return
+        message = f"id: {next(self._sequence)}\ndata: {payload}\n\n"
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, message)
+            except RuntimeError:
+                # A kliens eseményhurka már leállt
+                self.unsubscribe(family_id, subscriber)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = Broker()
+
+
+def _encode(family_id: int, type: str, data: dict) -> str:
+    return dumps({"family_id": family_id, "type": type, "data": data}).decode("utf-8")
+
+
+def publish(db: Session, family_id: int, type: str, data: dict):
+    """
+    Esemény a család élő csatornájára, a munkamenet következő sikeres
+    commitja után. A `data` legyen tömör (id + megváltozott mezők), hogy a
+    kliens a helyi állapotát foltozhassa újratöltés helyett.
+    """
+    if family_id is None:
+        return
+    payload = _encode(family_id, type, data)
+    if config.EVENTS_BACKEND == "postgres":
+        # A NOTIFY tranzakciós: a Postgres maga csak commitkor kézbesíti
+        db.execute(func.pg_notify(PG_CHANNEL, payload).select())
+    else:
+        db.info.setdefault(_PENDING_KEY, []).append((family_id, payload))
+
+
+def publish_now(family_id: int, type: str, data: dict):
+    """ Adatbázis írás nélküli változás (pl. jelenlét) azonnali kiküldése. """
+    if family_id is None:
+        return
+    payload = _encode(family_id, type, data)
+    if config.EVENTS_BACKEND == "postgres":
+        with engine.begin() as connection:
+            connection.execute(func.pg_notify(PG_CHANNEL, payload).select())
+    else:
+        broker.dispatch(family_id, payload)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _flush_pending(session: Session):
+    for family_id, payload in session.info.pop(_PENDING_KEY, ()):
+        broker.dispatch(family_id, payload)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# --- PostgreSQL LISTEN/NOTIFY háttér ---
+
+class _PostgresListener(threading.Thread):
+    """ Saját kapcsolaton LISTEN-el, és a beérkező eseményeket a helyi brokernek adja. """
+
+    def __init__(self):
+        super().__init__(name="familyhub-events-listener", daemon=True)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as exc:
+                print(f"Esemény LISTEN kapcsolat hiba, újracsatlakozás: {exc}")
+                self._stopped.wait(_LISTEN_POLL_SECONDS)
+
+    def _listen(self):
+        connection = engine.raw_connection()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {PG_CHANNEL}")
+            while not self._stopped.is_set():
+                if select.select([dbapi_connection], [], [], _LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    family_id = json.loads(notification.payload)["family_id"]
+                    broker.dispatch(family_id, notification.payload)
+        finally:
+            connection.invalidate()
+
+
+_listener: Optional[_PostgresListener] = None
+
+
+def start():
+    global _listener
+    if config.EVENTS_BACKEND == "postgres" and _listener is None:
+        _listener = _PostgresListener()
+        _listener.start()
+
+
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+async def stream(family_id: int, request):
+    """ SSE üzenetfolyam; csendes időszakban heartbeat komment tartja életben a kapcsolatot. """
+    subscriber = broker.subscribe(family_id)
+    try:
+        yield f"retry: {config.EVENTS_RETRY_MS}\n\n"
+        while True:
+            if await request.is_disconnected():
+                break
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                yield 'event: resync\ndata: {}\n\n'
+            try:
+                yield await asyncio.wait_for(subscriber.queue.get(), timeout=config.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+    finally:
+        broker.unsubscribe(family_id, subscriber)
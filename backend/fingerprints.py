@@ -0,0 +1,93 @@
+# Olcsó változásdetektálás a származtatott (cache-elt) nézetekhez: táblánként
+# és tagonként (sorok száma, legutóbbi updated_at), egyetlen UNION lekérdezéssel.
+# Beszúrás, módosítás (onupdate) és törlés is megváltoztatja; több worker mellett
+# is helyes, mert az adatbázisból számoljuk, nem folyamaton belüli jelzésből.
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+
+FAMILY_KEY = 0  # a családszintű táblák (pl. family_events) "user_id"-ja az eredményben
+
+
+def _per_user(name: str, model, user_column: str = "user_id"):
+    column = getattr(model, user_column)
+    return lambda family_id, user_ids: select(
+        literal(name), column, func.count(), func.max(model.updated_at)
+    ).where(column.in_(user_ids)).group_by(column)
+
+
+def _family_events(family_id, user_ids):
+    return select(
+        literal("family_events"), literal(FAMILY_KEY), func.count(), func.max(models.FamilyEvent.updated_at)
+    ).where(models.FamilyEvent.family_id == family_id)
+
+
+def _synced_events(family_id, user_ids):
+    # Csak az engedélyezett integrációk eseményei: a ki-/bekapcsolás a darabszámot is változtatja
+    integration = models.CalendarIntegration
+    return select(
+        literal("synced_events"), integration.user_id, func.count(), func.max(models.SyncedEvent.updated_at)
+    ).select_from(models.SyncedEvent).join(
+        integration, models.SyncedEvent.calendar_integration_id == integration.id
+    ).where(integration.user_id.in_(user_ids), integration.sync_enabled == True).group_by(integration.user_id)
+
+
+def _assigned_shift_templates(family_id, user_ids):
+    # A tag beosztásai által hivatkozott sablonok, a tulajdonosuktól függetlenül
+    # (egy szülő a saját sablonjával is beoszthat egy gyereket)
+    template = models.ShiftTemplate
+    assignment = models.ShiftAssignment
+    return select(
+        literal("assigned_shift_templates"), assignment.user_id,
+        func.count(func.distinct(template.id)), func.max(template.updated_at)
+    ).select_from(assignment).join(
+        template, assignment.template_id == template.id
+    ).where(assignment.user_id.in_(user_ids)).group_by(assignment.user_id)
+
+
+SOURCES = {
+    "family_events": _family_events,
+    "user_events": _per_user("user_events", models.UserEvent),
+    "work_shifts": _per_user("work_shifts", models.WorkShift),
+    "shift_assignments": _per_user("shift_assignments", models.ShiftAssignment),
+    "shift_templates": _per_user("shift_templates", models.ShiftTemplate),
+    "assigned_shift_templates": _assigned_shift_templates,
+    "synced_events": _synced_events,
+    "recurring_rules": _per_user("recurring_rules", models.RecurringRule, "owner_id"),
+    "expected_expenses": _per_user("expected_expenses", models.ExpectedExpense, "owner_id"),
+}
+
+
+def collect(db: Session, family_id: int, user_ids: List[int], tables: Iterable[str]) -> Dict[Tuple[str, int], tuple]:
+    """ (tábla, user_id vagy FAMILY_KEY) -> (sorok száma, legutóbbi updated_at). Hiányzó kulcs = üres. """
+    statements = [SOURCES[table](family_id, user_ids) for table in tables]
+    return {(row[0], row[1]): (row[2], row[3]) for row in db.execute(union_all(*statements))}
+
+
+class FingerprintCache:
+    """ Folyamaton belüli LRU: kulcs -> (ujjlenyomat, érték); eltérő ujjlenyomatnál nincs találat. """
+
+    def __init__(self, max_entries: int):
+        self._entries: "OrderedDict[tuple, Tuple[Any, Any]]" = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, fingerprint) -> Optional[Any]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached[0] != fingerprint:
+                return None
+            self._entries.move_to_end(key)
+            return cached[1]
+
+    def put(self, key: tuple, fingerprint, value):
+        with self._lock:
+            self._entries[key] = (fingerprint, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
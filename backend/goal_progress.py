@@ -0,0 +1,189 @@
+# Célkasszák futó statisztikája (models.GoalProgress). Minden átutalás a zárolt
+# kasszák mellett frissíti: befizetett/kiutalt összeg, átlagos havi nettó
+# befizetés és az ezzel az ütemmel becsült teljesülési dátum a goal_date-hez
+# képest. A dashboard ezt a sort olvassa, a tranzakció-történetet nem nézi.
+# Az átlag és a becslés az eltelt időtől is függ, ezért az ütemező naponta egy
+# halmazos UPDATE-tel frissíti azokat a kasszákat is, amelyekre nem érkezett
+# átutalás (refresh_all). Egy átutalás-láb módosításakor vagy törlésekor a
+# kassza összegei a főkönyvből számolódnak újra (recalculate).
+import math
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+DAYS_PER_MONTH = 30.4375
+_CENT = Decimal("0.01")
+
+
+def _months_since(first: datetime, now: datetime) -> float:
+    # Az első hónapot teljesnek vesszük, különben egy friss befizetés irreális ütemet adna
+    return max(1.0, (now - first).total_seconds() / 86400 / DAYS_PER_MONTH)
+
+
+def _project(progress: models.GoalProgress, account: models.Account, now: datetime):
+    """ Az átlag, a becsült dátum és az on_track újraszámolása a már frissített összegekből. """
+    net = (progress.contributed or Decimal(0)) - (progress.withdrawn or Decimal(0))
+    if progress.first_contribution_at is None:
+        progress.average_monthly = None
+    else:
+        months = _months_since(progress.first_contribution_at, now)
+        progress.average_monthly = (net / Decimal(months)).quantize(_CENT)
+
+    projected = None
+    if account.goal_amount is not None:
+        remaining = account.goal_amount - account.balance
+        if remaining <= 0:
+            projected = now.date()
+        elif progress.average_monthly and progress.average_monthly > 0:
+            days = math.ceil(float(remaining / progress.average_monthly) * DAYS_PER_MONTH)
+            # Irreálisan távoli becslésnél (date.max fölött) nincs dátum
+            if days < (date.max - now.date()).days:
+                projected = now.date() + timedelta(days=days)
+    progress.projected_completion_date = projected
+    if account.goal_date is None or account.goal_amount is None:
+        progress.on_track = None
+    else:
+        progress.on_track = projected is not None and projected <= account.goal_date
+
+
+def _load(db: Session, account_ids: Iterable[int]) -> dict:
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+    rows = db.query(models.GoalProgress).filter(models.GoalProgress.account_id.in_(account_ids)).all()
+    return {row.account_id: row for row in rows}
+
+
+def record_transfers(db: Session, transfers: Iterable[Tuple[models.Account, models.Account, Decimal]],
+                     now: Optional[datetime] = None):
+    """
+    (forrás, cél, összeg) átutalások hatása a célkasszák statisztikájára, commit
+    nélkül. A kasszák már zárolva vannak, így a sorok módosítása sorosított.
+    """
+    now = now or datetime.now()
+    changes = {}
+    for from_account, to_account, amount in transfers:
+        if to_account.type == 'cél':
+            changes.setdefault(to_account.id, [to_account, Decimal(0), Decimal(0), 0])
+            changes[to_account.id][1] += amount
+            changes[to_account.id][3] += 1
+        if from_account.type == 'cél':
+            changes.setdefault(from_account.id, [from_account, Decimal(0), Decimal(0), 0])
+            changes[from_account.id][2] += amount
+    if not changes:
+        return
+
+    existing = _load(db, changes)
+    for account_id, (account, contributed, withdrawn, count) in changes.items():
+        progress = existing.get(account_id)
+        if progress is None:
+            progress = models.GoalProgress(account_id=account_id, contributed=Decimal(0), withdrawn=Decimal(0),
+                                           contribution_count=0)
+            db.add(progress)
+        progress.contributed = (progress.contributed or Decimal(0)) + contributed
+        progress.withdrawn = (progress.withdrawn or Decimal(0)) + withdrawn
+        if count:
+            progress.contribution_count = (progress.contribution_count or 0) + count
+            progress.first_contribution_at = progress.first_contribution_at or now
+            progress.last_contribution_at = now
+        _project(progress, account, now)
+
+
+def recalculate(db: Session, accounts: Iterable[models.Account], now: Optional[datetime] = None):
+    """
+    A célkasszák összegeinek újraszámolása az átutalás-lábaikból (az archiváltakkal
+    együtt), majd a becslés; commit nélkül. Módosított vagy törölt tranzakció után.
+    """
+    accounts = {account.id: account for account in accounts if account.type == 'cél'}
+    if not accounts:
+        return
+    T = models.TransactionAll
+    is_contribution = T.type == 'bevétel'
+    sums = db.query(
+        T.account_id,
+        func.coalesce(func.sum(T.amount).filter(is_contribution), 0),
+        func.coalesce(func.sum(T.amount).filter(T.type == 'kiadás'), 0),
+        func.count().filter(is_contribution),
+        func.min(T.date).filter(is_contribution),
+        func.max(T.date).filter(is_contribution),
+    ).filter(T.account_id.in_(list(accounts)), T.transfer_id.isnot(None)).group_by(T.account_id).all()
+    sums = {row[0]: row[1:] for row in sums}
+
+    now = now or datetime.now()
+    existing = _load(db, accounts)
+    for account_id, account in accounts.items():
+        progress = existing.get(account_id)
+        if progress is None:
+            if account_id not in sums:
+                continue
+            progress = models.GoalProgress(account_id=account_id)
+            db.add(progress)
+        contributed, withdrawn, count, first, last = sums.get(account_id, (Decimal(0), Decimal(0), 0, None, None))
+        progress.contributed, progress.withdrawn, progress.contribution_count = contributed, withdrawn, count
+        # A tranzakciók dátuma időzónás, a statisztika naiv időpontokat tárol
+        progress.first_contribution_at = first.replace(tzinfo=None) if first else None
+        progress.last_contribution_at = last.replace(tzinfo=None) if last else None
+        _project(progress, account, now)
+
+
+def refresh(db: Session, account: models.Account, now: Optional[datetime] = None):
+    """ Célösszeg vagy céldátum módosítása után a becslés frissítése (az összegek nem változnak). """
+    if account.type != 'cél':
+        return
+    progress = _load(db, [account.id]).get(account.id)
+    if progress is not None:
+        _project(progress, account, now or datetime.now())
+
+
+# Ugyanaz a számítás, mint a _project-ben, egyetlen utasításban az összes célkasszára
+_REFRESH_ALL_SQL = text("""
+    WITH rates AS (
+        SELECT gp.account_id, a.goal_amount, a.goal_date, a.goal_amount - a.balance AS remaining,
+               CASE WHEN gp.first_contribution_at IS NULL THEN NULL
+                    ELSE ROUND((gp.contributed - gp.withdrawn) / GREATEST(1.0,
+                         EXTRACT(EPOCH FROM (CAST(:now AS timestamp) - gp.first_contribution_at)) / 86400 / :days_per_month)::numeric, 2)
+               END AS average_monthly
+        FROM goal_progress gp
+        JOIN accounts a ON a.id = gp.account_id
+        WHERE a.type = 'cél'
+    ), projected AS (
+        SELECT r.*,
+               CASE WHEN r.goal_amount IS NULL THEN NULL
+                    WHEN r.remaining <= 0 THEN CAST(:today AS date)
+                    WHEN r.average_monthly > 0 AND r.remaining / r.average_monthly * :days_per_month < :max_days
+                         THEN CAST(:today AS date) + CEIL(r.remaining / r.average_monthly * :days_per_month)::int
+               END AS projected_completion_date
+        FROM rates r
+    ), fresh AS (
+        SELECT p.account_id, p.average_monthly, p.projected_completion_date,
+               CASE WHEN p.goal_date IS NULL OR p.goal_amount IS NULL THEN NULL
+                    ELSE COALESCE(p.projected_completion_date <= p.goal_date, false)
+               END AS on_track
+        FROM projected p
+    )
+    UPDATE goal_progress gp SET
+        average_monthly = f.average_monthly,
+        projected_completion_date = f.projected_completion_date,
+        on_track = f.on_track,
+        updated_at = now()
+    FROM fresh f
+    WHERE gp.account_id = f.account_id
+      AND (gp.average_monthly, gp.projected_completion_date, gp.on_track)
+          IS DISTINCT FROM (f.average_monthly, f.projected_completion_date, f.on_track)
+""")
+
+
+def refresh_all(db: Session, now: Optional[datetime] = None) -> int:
+    """ Az ütemezett feladat: az időfüggő mezők újraszámolása minden célkasszára; a módosult sorok száma. """
+    now = now or datetime.now()
+    result = db.execute(_REFRESH_ALL_SQL, {
+        "now": now, "today": now.date(), "days_per_month": DAYS_PER_MONTH,
+        "max_days": (date.max - now.date()).days - 1,
+    })
+    db.commit()
+    return result.rowcount
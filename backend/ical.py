@@ -0,0 +1,231 @@
+# Minimális iCalendar (RFC 5545) olvasó a naptár szinkronhoz: soronként
+# dolgozik (a feed soha nincs egyben a memóriában), és VEVENT-enként ad
+# vissza egy normalizált dict-et. Az ismétlődő eseményeket nem bontjuk ki:
+# az RRULE/EXDATE tárolódik, az előfordulásokat a recurrence modul állítja elő.
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import recurrence
+
+
+def unfold(lines: Iterable[str]) -> Iterator[str]:
+    """ A folytatósorokat (szóközzel/tabbal kezdődő sor) az előzőhöz fűzi. """
+    current = None
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if current is None:
+            line = line.lstrip("\ufeff")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """ "DTSTART;TZID=Europe/Budapest:20250101T080000" -> (név, paraméterek, érték). """
+    head, separator, value = line.partition(":")
+    # Az idézőjeles paraméterérték tartalmazhat kettőspontot
+    while head.count('"') % 2 == 1 and separator:
+        more, separator, value = value.partition(":")
+        head = f"{head}:{more}"
+    name, *params = head.split(";")
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition("=")
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def unescape(value: str) -> str:
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+            .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def event_zone(value: str, parameters: Dict[str, str]) -> Optional[str]:
+    """ Az időpont zónája: TZID, "UTC" a ...Z alakú értéknél, lebegő időnél None. """
+    if value.strip().endswith("Z"):
+        return "UTC"
+    tzid = parameters.get("TZID")
+    return tzid if recurrence.zone(tzid) is not None else None
+
+
+def _wall_clock(value: str) -> datetime:
+    # A strptime-nál jóval gyorsabb; a nagy feedeknél ez a legforróbb pont
+    return datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                    int(value[9:11]), int(value[11:13]), int(value[13:15]))
+
+
+def parse_datetime(value: str, parameters: Dict[str, str]):
+    """
+    DATE -> date; DATE-TIME -> helyi (a szerver időzónája szerinti) naiv
+    datetime, ahogy a többi időpont is a DB-ben. Lebegő időpont változatlan.
+    """
+    value = value.strip()
+    if parameters.get("VALUE") == "DATE" or len(value) == 8:
+        return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    parsed = _wall_clock(value)
+    if value.endswith("Z"):
+        return parsed.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    zone = recurrence.zone(parameters.get("TZID"))
+    if zone is not None:
+        return parsed.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _as_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.combine(value, time.min)
+
+
+def normalize_rrule(value: str, tzid: Optional[str]) -> str:
+    """
+    Az UNTIL-t a kibontás módjához igazítja: zónás kezdőpontnál UTC ("...Z"),
+    ahogy az RFC előírja (a hibás, zóna nélküli UNTIL-t az esemény zónájában
+    értelmezzük); lebegő kezdőpontnál helyi naiv idő.
+    """
+    tz = recurrence.zone(tzid)
+    parts = []
+    for part in value.strip().split(";"):
+        key, _, item = part.partition("=")
+        key = key.upper()
+        if key == "UNTIL" and item:
+            if item.endswith("Z"):
+                until = _wall_clock(item).replace(tzinfo=timezone.utc)
+            else:
+                until = _as_datetime(parse_datetime(item, {}))
+                if tz is not None:
+                    until = until.replace(tzinfo=tz)
+            if tz is not None:
+                item = until.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            else:
+                item = recurrence.from_zone(until).strftime("%Y%m%dT%H%M%S")
+        parts.append(f"{key}={item}")
+    return ";".join(parts)
+
+
+_CLOCK_UNITS = {"H": "hours", "M": "minutes", "S": "seconds"}
+
+
+def parse_duration(value: str) -> timedelta:
+    """ RFC 5545 DURATION, pl. "PT1H30M", "P1D", "-PT15M". """
+    sign = -1 if value.startswith("-") else 1
+    value = value.lstrip("+-").lstrip("P")
+    days, _, clock = value.partition("T")
+    total = timedelta()
+    number = ""
+    for char in days:
+        if char.isdigit():
+            number += char
+        elif number:
+            total += timedelta(weeks=int(number)) if char == "W" else timedelta(days=int(number))
+            number = ""
+    for char in clock:
+        if char.isdigit():
+            number += char
+        elif number:
+            total += timedelta(**{_CLOCK_UNITS[char]: int(number)})
+            number = ""
+    return sign * total
+
+
+def _finish_event(properties: Dict[str, List[Tuple[Dict[str, str], str]]]) -> Optional[dict]:
+    def first(name):
+        values = properties.get(name)
+        return values[0] if values else (None, None)
+
+    uid = first("UID")[1]
+    dtstart_params, dtstart_value = first("DTSTART")
+    if not uid or not dtstart_value:
+        return None
+    start = parse_datetime(dtstart_value, dtstart_params)
+    is_all_day = not isinstance(start, datetime)
+    tzid = None if is_all_day else event_zone(dtstart_value, dtstart_params)
+
+    dtend_params, dtend_value = first("DTEND")
+    _, duration_value = first("DURATION")
+    if dtend_value:
+        end = parse_datetime(dtend_value, dtend_params)
+    elif duration_value:
+        end = start + parse_duration(duration_value)
+    else:
+        end = start + timedelta(days=1) if is_all_day else start
+
+    if is_all_day:
+        start = datetime.combine(start, time.min)
+        end = _as_datetime(end)
+
+    # Egy ismétlődő sorozat módosított előfordulása külön eseményként, saját azonosítóval;
+    # a recurrence_id alapján a sorozat kibontása ezt az előfordulást kihagyja
+    recurrence_params, recurrence_value = first("RECURRENCE-ID")
+    external_id = uid if not recurrence_value else f"{uid}#{recurrence_value}"
+    recurrence_id = _as_datetime(parse_datetime(recurrence_value, recurrence_params)) if recurrence_value else None
+
+    _, rrule_value = first("RRULE")
+    exdates = [
+        _as_datetime(parse_datetime(item, params))
+        for params, value in properties.get("EXDATE", ())
+        for item in value.split(",") if item.strip()
+    ]
+
+    status = (first("STATUS")[1] or "").upper()
+    return {
+        "external_event_id": external_id,
+        "title": unescape(first("SUMMARY")[1] or "(névtelen esemény)"),
+        "description": unescape(first("DESCRIPTION")[1]) if first("DESCRIPTION")[1] else None,
+        "location": unescape(first("LOCATION")[1]) if first("LOCATION")[1] else None,
+        "start_datetime": start,
+        "end_datetime": end,
+        "is_all_day": is_all_day,
+        "rrule": normalize_rrule(rrule_value, tzid) if rrule_value and not recurrence_value else None,
+        "exdates": recurrence.format_exdates(exdates),
+        "recurrence_id": recurrence_id,
+        "tzid": tzid,
+        "cancelled": status == "CANCELLED",
+    }
+
+
+def iter_events(lines: Iterable[str]) -> Iterator[dict]:
+    """ VEVENT-enként normalizált dict; a hibás/hiányos eseményeket kihagyja. """
+    properties = None
+    depth = 0
+    for line in unfold(lines):
+        if not line:
+            continue
+        name, parameters, value = parse_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and depth == 0:
+                properties = {}
+            elif properties is not None:
+                # Beágyazott komponens (pl. VALARM): a tulajdonságait figyelmen kívül hagyjuk
+                depth += 1
+            continue
+        if name == "END":
+            if properties is None:
+                continue
+            if depth:
+                depth -= 1
+            elif value.upper() == "VEVENT":
+                try:
+                    event = _finish_event(properties)
+                except (ValueError, KeyError):
+                    event = None
+                properties = None
+                if event is not None:
+                    yield event
+            continue
+        if properties is not None and not depth:
+            properties.setdefault(name, []).append((parameters, value))
+
+
+def event_hash(event: dict) -> str:
+    """ A tárolt mezők ujjlenyomata: változatlan eseményt nem írunk újra. """
+    canonical = "\x1f".join(
+        "" if event.get(field) is None else str(event[field])
+        for field in sorted(event) if field != "content_hash"
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
@@ -0,0 +1,115 @@
+# Idempotency-Key kezelés a pénzmozgató végpontokhoz: az első sikeres válasz
+# eltárolódik, az ismételt (újrapróbált) kérés ugyanazt kapja vissza anélkül,
+# hogy az egyenlegekhez újra hozzányúlnánk.
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import config, models
+from .locking import run_in_transaction
+from .serialization import FastJSONResponse
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint(endpoint: str, payload) -> str:
+    canonical = json.dumps({"endpoint": endpoint, "payload": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def to_json(result):
+    """
+    Minden idempotens pénzmozgató végpont ezzel szerializál, így a tárolt és a
+    visszajátszott válasz is egyforma: a Decimal szövegként, mint a Pydantic
+    JSON módjában és a FastJSONResponse-ban.
+    """
+    return jsonable_encoder(result, custom_encoder={Decimal: str})
+
+
+def _advisory_lock_id(user_id: int, key: str) -> int:
+    # pg_advisory_xact_lock előjeles 64 bites kulcsot vár
+    digest = hashlib.sha256(f"{user_id}:{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def execute(
+    db: Session,
+    user: models.User,
+    key: Optional[str],
+    endpoint: str,
+    payload,
+    operation: Callable,
+    serialize: Callable = to_json,
+    status_code: int = 200,
+):
+    """
+    Lefuttatja a commit nélküli `operation()`-t egyetlen tranzakcióban, és a
+    `serialize`-olt eredményt JSON válaszként adja vissza.
+
+    Ha van kulcs: a kulcsra tranzakciós advisory lockot veszünk, így a
+    párhuzamos duplikátumok sorban futnak; a második már a tárolt választ
+    látja. A válasz ugyanabban a commitban íródik, mint a pénzmozgás.
+    Hibás (HTTPException) kimenet nem tárolódik, az újrapróbálás újra lefut.
+    """
+    if not key:
+        body = run_in_transaction(db, lambda: serialize(operation()))
+        return FastJSONResponse(body, status_code=status_code)
+
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Az {IDEMPOTENCY_HEADER} legfeljebb {MAX_KEY_LENGTH} karakter lehet.")
+
+    request_hash = _fingerprint(endpoint, payload)
+
+    def attempt():
+        db.execute(func.pg_advisory_xact_lock(_advisory_lock_id(user.id, key)).select())
+        stored = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.user_id == user.id,
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.expires_at > func.now(),
+        ).first()
+        if stored:
+            if stored.request_hash != request_hash:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Ez az {IDEMPOTENCY_HEADER} már egy másik kéréshez tartozik.",
+                )
+            return stored.status_code, stored.response_body, True
+
+        body = serialize(operation())
+        now = datetime.now(timezone.utc)
+        values = {
+            "user_id": user.id, "key": key, "endpoint": endpoint, "request_hash": request_hash,
+            "status_code": status_code, "response_body": body,
+            "created_at": now, "expires_at": now + timedelta(hours=config.IDEMPOTENCY_KEY_TTL_HOURS),
+        }
+        # Lejárt, de még nem takarított azonos kulcs felülírása
+        stmt = insert(models.IdempotencyKey).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_idempotency_key_user_key",
+            set_={column: stmt.excluded[column] for column in values if column not in ("user_id", "key")},
+        )
+        db.execute(stmt)
+        return status_code, body, False
+
+    stored_status, body, replayed = run_in_transaction(db, attempt)
+    headers = {REPLAY_HEADER: "true"} if replayed else None
+    return FastJSONResponse(body, status_code=stored_status, headers=headers)
+
+
+def purge_expired_keys(db: Session) -> int:
+    """ Törli a lejárt kulcsokat; a darabszámot adja vissza. """
+    deleted = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.expires_at <= func.now()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
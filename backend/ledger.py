@@ -0,0 +1,163 @@
+# Kassza főkönyv: havi egyenleg-pillanatképek, "egyenleg adott napon" lekérdezés
+# és a tárolt Account.balance tömeges egyeztetése a tranzakciókkal.
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Date, case, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def signed_amount(T=models.Transaction):
+    """ A tranzakció előjeles hatása az egyenlegre, SQL kifejezésként. """
+    return case((T.type == 'bevétel', T.amount), (T.type == 'kiadás', -T.amount), else_=0)
+
+
+def signed_value(transaction_type: str, amount) -> Decimal:
+    """ Ugyanaz a szabály Pythonban, egy már betöltött tranzakcióhoz. """
+    if transaction_type == 'bevétel':
+        return Decimal(amount)
+    if transaction_type == 'kiadás':
+        return -Decimal(amount)
+    return Decimal(0)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _latest_snapshots(upto: Optional[date], inclusive: bool = True):
+    """ Kasszánként a legutolsó pillanatkép az `upto` napig (DISTINCT ON). """
+    S = models.AccountBalanceSnapshot
+    query = select(S.account_id, S.as_of, S.balance) \
+        .distinct(S.account_id) \
+        .order_by(S.account_id, S.as_of.desc())
+    if upto is not None:
+        query = query.where(S.as_of <= upto if inclusive else S.as_of < upto)
+    return query.cte("latest_snapshot")
+
+
+def _ledger_balances(upto: Optional[date], account_ids: Optional[Iterable[int]] = None, inclusive: bool = True,
+                     source=models.Transaction):
+    """
+    Kasszánkénti főkönyvi egyenleg az `upto` nap kezdetéig (None: minden tranzakció):
+    a legközelebbi korábbi pillanatkép + az azóta rögzített tranzakciók összege,
+    így a tranzakció-szkennelés legfeljebb egy hónapnyi sort érint. Múltbeli
+    napra a `source` a transactions_all nézet, mert a sorok már archiválva lehetnek.
+    """
+    A, T = models.Account, source
+    snap = _latest_snapshots(upto, inclusive)
+
+    delta_query = select(T.account_id, func.sum(signed_amount(T)).label("delta")) \
+        .outerjoin(snap, snap.c.account_id == T.account_id) \
+        .where(or_(snap.c.as_of.is_(None), T.date >= snap.c.as_of))
+    if upto is not None:
+        delta_query = delta_query.where(T.date < datetime.combine(upto, time.min))
+    if account_ids is not None:
+        delta_query = delta_query.where(T.account_id.in_(list(account_ids)))
+    delta = delta_query.group_by(T.account_id).subquery("ledger_delta")
+
+    query = select(
+        A.id.label("account_id"),
+        (func.coalesce(snap.c.balance, 0) + func.coalesce(delta.c.delta, 0)).label("ledger_balance"),
+        snap.c.as_of.label("snapshot_as_of"),
+    ).outerjoin(snap, snap.c.account_id == A.id).outerjoin(delta, delta.c.account_id == A.id)
+    if account_ids is not None:
+        query = query.where(A.id.in_(list(account_ids)))
+    return query
+
+
+def balance_at(db: Session, account_id: int, day: date) -> dict:
+    """ A kassza egyenlege a `day` nap végén, a főkönyv alapján. """
+    row = db.execute(_ledger_balances(day + timedelta(days=1), [account_id], source=models.TransactionAll)).first()
+    if row is None:
+        return None
+    return {
+        "account_id": account_id,
+        "date": day,
+        "balance": Decimal(row.ledger_balance),
+        "snapshot_as_of": row.snapshot_as_of,
+    }
+
+
+def write_month_snapshots(db: Session, as_of: Optional[date] = None) -> int:
+    """
+    Egyetlen INSERT ... SELECT-tel megírja (vagy felülírja) az összes kassza
+    pillanatképét az `as_of` hónap elejére. Nem commitol.
+    """
+    S = models.AccountBalanceSnapshot
+    as_of = month_start(as_of or date.today())
+    balances = _ledger_balances(as_of, inclusive=False).subquery("balances")
+    stmt = insert(S).from_select(
+        ["account_id", "as_of", "balance"],
+        select(balances.c.account_id, literal(as_of, Date), balances.c.ledger_balance),
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_account_balance_snapshot",
+        set_={"balance": stmt.excluded.balance, "created_at": func.now()},
+    )
+    return db.execute(stmt).rowcount
+
+
+def ensure_month_snapshots(db: Session, today: Optional[date] = None) -> list:
+    """ Pótolja a hiányzó hónapforduló pillanatképeket a legutolsótól a folyó hónapig. """
+    current = month_start(today or date.today())
+    last = db.query(func.max(models.AccountBalanceSnapshot.as_of)).scalar()
+    if last is None:
+        first_transaction = db.query(func.min(models.Transaction.date)).scalar()
+        if first_transaction is None:
+            return []
+        month = month_start(first_transaction.date()) + relativedelta(months=1)
+    else:
+        month = last + relativedelta(months=1)
+
+    written = []
+    while month <= current:
+        write_month_snapshots(db, month)
+        written.append(month)
+        month += relativedelta(months=1)
+    db.commit()
+    return written
+
+
+def shift_snapshots(db: Session, account_id: int, transaction_date: datetime, delta: Decimal):
+    """
+    Visszadátumozott módosításnál (tranzakció szerkesztése / törlése) a későbbi
+    pillanatképeket a különbséggel eltolja, hogy ne kelljen újraszámolni őket.
+    """
+    if not delta or transaction_date is None:
+        return
+    S = models.AccountBalanceSnapshot
+    db.query(S).filter(S.account_id == account_id, S.as_of > transaction_date.date()) \
+        .update({S.balance: S.balance + delta}, synchronize_session=False)
+
+
+def reconcile_balances(db: Session, family_id: Optional[int] = None) -> list:
+    """
+    Egyetlen aggregált lekérdezéssel összeveti a tárolt egyenlegeket a főkönyvvel,
+    és visszaadja az eltérő kasszákat.
+    """
+    A = models.Account
+    ledger = _ledger_balances(None).subquery("ledger")
+    query = select(A.id, A.name, A.family_id, A.balance, ledger.c.ledger_balance) \
+        .join(ledger, ledger.c.account_id == A.id) \
+        .where(func.coalesce(A.balance, 0) != ledger.c.ledger_balance) \
+        .order_by(A.family_id, A.id)
+    if family_id is not None:
+        query = query.where(A.family_id == family_id)
+
+    return [
+        {
+            "account_id": row.id,
+            "name": row.name,
+            "family_id": row.family_id,
+            "balance": row.balance,
+            "ledger_balance": row.ledger_balance,
+            "drift": (row.balance or 0) - row.ledger_balance,
+        }
+        for row in db.execute(query)
+    ]
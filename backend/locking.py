@@ -0,0 +1,61 @@
+# Sorzárolás és újrapróbálás a pénzmozgásokhoz: a kasszákat mindig azonosító
+# szerinti sorrendben zároljuk (SELECT ... FOR UPDATE), így két párhuzamos
+# átutalás nem tud ugyanabból az egyenlegből fedezetet "kétszer" látni.
+import random
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import config, models
+
+# Sorosítási hiba és holtpont: a tranzakció változatlanul megismételhető
+RETRYABLE_PGCODES = {"40001", "40P01"}
+
+
+def lock_accounts(db: Session, account_ids) -> dict:
+    """
+    Zárolja a megadott kasszákat növekvő id sorrendben, és a friss (zárolt)
+    állapotukat adja vissza id -> Account formában. A populate_existing miatt a
+    session-ben már betöltött példányok is a zárolt értékekre frissülnek.
+    Join nélkül kérdezünk, mert a FOR UPDATE külső join nullázható oldalán nem működik.
+    """
+    ids = sorted(set(account_ids))
+    if not ids:
+        return {}
+    accounts = (
+        db.query(models.Account)
+        .filter(models.Account.id.in_(ids))
+        .order_by(models.Account.id)
+        .with_for_update(of=models.Account)
+        .populate_existing()
+        .all()
+    )
+    return {account.id: account for account in accounts}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    orig = getattr(exc, "orig", None)
+    return getattr(orig, "pgcode", None) in RETRYABLE_PGCODES
+
+
+def run_in_transaction(db: Session, operation, attempts: int = None):
+    """
+    Lefuttatja az `operation()`-t és commitol. Sorosítási hiba vagy holtpont
+    esetén visszagörget és rövid, véletlenszerű várakozás után újrapróbálja;
+    minden más hiba visszagörgetés után továbbmegy a hívóhoz.
+    """
+    attempts = attempts or config.TRANSACTION_RETRY_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            result = operation()
+            db.commit()
+            return result
+        except DBAPIError as exc:
+            db.rollback()
+            if not is_retryable(exc) or attempt == attempts:
+                raise
+            time.sleep(random.uniform(0.01, 0.05) * attempt)
+        except Exception:
+            db.rollback()
+            raise
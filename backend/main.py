@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Form, Body, Query, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, status, Form, Body, Query, File, UploadFile, Header, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from .scheduler import scheduler
@@ -6,14 +7,15 @@ from sqlalchemy import func, extract, and_, or_
 from datetime import datetime, timedelta, date
 from typing import Optional, List
 from fastapi import Query
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import os
 import uuid
-import shutil
 from pathlib import Path
 
 
-from . import crud
+from . import crud, ledger, idempotency, uploads, notifications, events, presence, calendar_sync, calendar_feed, account_deletion
+from starlette.concurrency import run_in_threadpool
 from .crud import (
     get_tasks, create_task, toggle_task_status, delete_task,
     create_family, create_user, get_user, update_user,
@@ -76,6 +78,10 @@ from .schemas import (
     UserStatusUpdate, DashboardTimeData
 )
 from .database import SessionLocal, engine
+from . import config
+from .profiling import QueryProfilerMiddleware, install_query_profiler, route_aggregates
+from .serialization import FastJSONResponse
+from .static_files import CachedStaticFiles, serve_file
 from .security import create_access_token, verify_pin, oauth2_scheme, SECRET_KEY, ALGORITHM
 from jose import JWTError, jwt
 
@@ -85,24 +91,49 @@ async def lifespan(app: FastAPI):
     # Induláskor
     print("Időzítő indítása...")
     scheduler.start()
+    events.start()
+    presence_flusher = asyncio.create_task(presence.run_flusher())
     yield
     # Leálláskor
     print("Időzítő leállítása...")
     scheduler.shutdown()
-app = FastAPI(lifespan=lifespan)
-
+    uploads.shutdown()
+    events.shutdown()
+    presence_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await presence_flusher
+    if config.QUERY_PROFILE_SAMPLE_RATE > 0:
+        route_aggregates.dump()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+install_query_profiler(engine)
+
+# A feltöltések törzse már beérkezés közben korlátozott (a multipart spool előtt).
+# A CORS előtt regisztráljuk, hogy az körbevegye: a korai 413 is CORS fejlécet kapjon.
+app.add_middleware(uploads.UploadSizeLimitMiddleware, limits=[
+    (r"^/api/users/\d+/avatar$", config.MAX_AVATAR_UPLOAD_MB),
+    (r"^/api/wishes/\d+/images$", config.MAX_WISH_IMAGE_UPLOAD_MB),
+])
 origins = ["*"]
-app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(
+    CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time"] if config.DEBUG else []
+)
+# A profilozó a legkülső réteg, így a teljes kérés idejét méri
+app.add_middleware(QueryProfilerMiddleware)
 
 # Statikus fájlok kiszolgálása
-from fastapi.responses import FileResponse
 
 @app.get("/uploads/avatars/{filename}")
-async def get_avatar(filename: str):
-    file_path = Path(f"/home/viragma/familyhub-app/uploads/avatars/{filename}")
-    if not file_path.exists():
+async def get_avatar(request: Request, filename: str, size: Optional[int] = Query(None, description="Bélyegkép mérete: 64, 128 vagy 256")):
+    file_path = await run_in_threadpool(uploads.resolve_avatar, filename, size)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Fájl nem található")
-    return FileResponse(file_path)
+    # A fájlnév egyedi (UUID), így a tartalma soha nem változik: ETag, 304, Range és immutable cache
+    return await run_in_threadpool(serve_file, file_path, request.headers, request.method)
+
+# Minden más feltöltés (a fenti avatar útvonal után, hogy a ?size= paraméter érvényesüljön)
+app.mount("/uploads", CachedStaticFiles(directory=str(config.UPLOAD_ROOT), check_dir=False), name="uploads")
 
 def get_db():
     db = SessionLocal()
@@ -124,8 +155,47 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         raise credentials_exception
     user = get_user(db, user_id=int(user_id))
     if user is None: raise credentials_exception
+    # Minden hitelesített kérés aktivitásnak számít (csak memória, DB írás nélkül)
+    presence.store.touch(user)
     return user
 
+def _user_from_token(token: str) -> Optional[UserModel]:
+    # Hosszú életű stream-hez: a munkamenetet a hitelesítés után rögtön lezárjuk
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("sub")
+    except JWTError:
+        return None
+    if user_id is None:
+        return None
+    db = SessionLocal()
+    try:
+        user = get_user(db, user_id=int(user_id))
+        if user is not None:
+            db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+@app.get("/api/events/stream")
+async def stream_family_events(request: Request, token: Optional[str] = Query(None, description="JWT; az EventSource nem tud fejlécet küldeni")):
+    """
+    A család élő változásai Server-Sent Events formában (pl. account.updated,
+    wish.updated, member.status). A kliens ezekkel foltozza a helyi állapotát.
+    """
+    if token is None:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+    user = await run_in_threadpool(_user_from_token, token) if token else None
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    return StreamingResponse(
+        events.stream(user.family_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 def get_current_admin_user(current_user: UserModel = Depends(get_current_user)):
     if current_user.role != "Családfő":
         raise HTTPException(status_code=403, detail="Nincs jogosultságod a művelethez!")
@@ -182,31 +252,35 @@ def update_user_details(user_id: int, user_data: UserUpdate, db: Session = Depen
     return update_user(db=db, user_id=user_id, user_data=user_data)
 
 @app.put("/api/users/{user_id}/status")
-def update_user_status(user_id: int, status_data: dict, db: Session = Depends(get_db), current_user: UserModel = Depends(get_current_user)):
+def update_user_status(user_id: int, status_data: dict, current_user: UserModel = Depends(get_current_user)):
     # Only allow users to update their own status
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Csak a saját státuszodat módosíthatod")
     
-    # Update user status
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    if not db_user:
-        raise HTTPException(status_code=404, detail="Felhasználó nem található")
-    
-    db_user.status = status_data.get("status", db_user.status)
-    db_user.last_active = func.now()
-    
-    # Save status history
-    status_history = models.UserStatusHistory(
-        user_id=user_id,
-        status=status_data.get("status"),
-        note=status_data.get("note")
-    )
-    db.add(status_history)
+    # A jelenlét memóriában él; a users sort és a történetet a háttér kötegelve írja
+    new_status = status_data.get("status") or current_user.status
+    snapshot = presence.store.set_status(current_user, new_status, note=status_data.get("note"))
     
+    return {"message": "Státusz frissítve", "status": snapshot["status"]}
+
+@app.post("/api/presence/heartbeat")
+def presence_heartbeat(current_user: UserModel = Depends(get_current_user)):
+    """Aktivitás jelzése; PRESENCE_TTL_SECONDS heartbeat nélkül a tag offline lesz."""
+    return presence.store.touch(current_user)
+
+@app.get("/api/presence")
+def read_family_presence(current_user: UserModel = Depends(get_current_user)):
+    """A család aktuális jelenléte a memóriából (akit a szerver még nem látott, az hiányzik)."""
+    return list(presence.store.family_snapshot(current_user.family_id).values())
+
+def _set_avatar_url(db: Session, user_id: int, avatar_url: str):
+    """ Beírja az új profilkép URL-t, és visszaadja a régit (threadpoolból hívva). """
+    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    old_avatar_url = db_user.avatar_url
+    db_user.avatar_url = avatar_url
+    db_user.updated_at = func.now()
     db.commit()
-    db.refresh(db_user)
-    
-    return {"message": "Státusz frissítve", "status": db_user.status}
+    return old_avatar_url
 
 @app.post("/api/users/{user_id}/avatar")
 async def upload_avatar(
@@ -219,58 +293,46 @@ async def upload_avatar(
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Csak a saját profilképedet módosíthatod")
     
-    # Check if user exists
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    if not db_user:
-        raise HTTPException(status_code=404, detail="Felhasználó nem található")
-    
     # Validate file type
     allowed_types = ["image/jpeg", "image/png", "image/gif", "image/webp"]
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Csak kép fájlokat lehet feltölteni (JPEG, PNG, GIF, WebP)")
     
-    # Validate file size (5MB max)
-    if file.size > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="A fájl mérete nem lehet nagyobb 5MB-nál")
+    # Validate file size: a kérés törzsét már az UploadSizeLimitMiddleware korlátozza,
+    # a fájl pontos korlátját a save_upload másolás közben ellenőrzi
+    max_bytes = int(config.MAX_AVATAR_UPLOAD_MB * 1024 * 1024)
     
     # Generate unique filename
     file_extension = file.filename.split('.')[-1].lower()
     unique_filename = f"{user_id}_{uuid.uuid4().hex}.{file_extension}"
+    file_path = uploads.AVATAR_UPLOAD_DIR / unique_filename
     
-    # Create uploads directory if it doesn't exist
-    upload_dir = Path("/home/viragma/familyhub-app/uploads/avatars")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Save file
-    file_path = upload_dir / unique_filename
+    # Save file: darabolva, a lemezírás threadpoolban
+    await uploads.save_upload(file, file_path, max_bytes)
     
+    # Bélyegképek process poolban; nem értelmezhető képnél a feltöltést eldobjuk
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Fájl mentési hiba: {str(e)}")
-    
-    # Delete old avatar if exists
-    if db_user.avatar_url:
-        old_file_path = Path(db_user.avatar_url.replace("/uploads/", "/home/viragma/familyhub-app/uploads/"))
-        if old_file_path.exists():
-            try:
-                old_file_path.unlink()
-            except:
-                pass  # Ignore errors when deleting old file
+        await uploads.generate_thumbnails(file_path)
+    except HTTPException:
+        await run_in_threadpool(uploads.remove_with_thumbnails, file_path)
+        raise
     
-    # Update user avatar URL
-    avatar_url = f"/uploads/avatars/{unique_filename}"
-    db_user.avatar_url = avatar_url
-    db_user.updated_at = func.now()
+    # Update user avatar URL (a szinkron DB hívás threadpoolban fut)
+    avatar_url = f"{uploads.AVATAR_URL_PREFIX}/{unique_filename}"
+    old_avatar_url = await run_in_threadpool(_set_avatar_url, db, user_id, avatar_url)
     
-    db.commit()
-    db.refresh(db_user)
+    # Delete old avatar (és bélyegképei) if exists
+    if old_avatar_url and old_avatar_url.startswith(uploads.AVATAR_URL_PREFIX + "/"):
+        old_file_path = uploads.AVATAR_UPLOAD_DIR / Path(old_avatar_url).name
+        await run_in_threadpool(uploads.remove_with_thumbnails, old_file_path)
     
     return {
         "message": "Profilkép sikeresen feltöltve",
         "avatar_url": avatar_url,
-        "filename": unique_filename
+        "filename": unique_filename,
+        "thumbnails": {
+            str(size): f"{avatar_url}?size={size}" for size in uploads.THUMBNAIL_SIZES
+        },
     }
 
 @app.get("/api/users/{user_id}/settings", response_model=UserSettings)
@@ -347,18 +409,44 @@ def remove_task_endpoint(task_id: int, db: Session = Depends(get_db)):
     if db_task is None: raise HTTPException(status_code=404, detail="A feladat nem található")
     return db_task
 
+def _parse_account_expand(expand: Optional[str]) -> tuple:
+    """ "wishes,history" -> ("wishes", "history"); ismeretlen érték 400-as hiba. """
+    if not expand:
+        return ()
+    requested = tuple(dict.fromkeys(part.strip() for part in expand.split(",") if part.strip()))
+    unknown = [part for part in requested if part not in crud.ACCOUNT_EXPANSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ismeretlen expand érték: {', '.join(unknown)}. Lehetséges: {', '.join(crud.ACCOUNT_EXPANSIONS)}."
+        )
+    return requested
+
+def _account_payload(account: models.Account, expand: tuple) -> dict:
+    # Csak az összefoglaló mezőket és a kért listákat érintjük, így más kapcsolat nem töltődik be
+    payload = {field: getattr(account, field) for field in schemas.AccountSummary.model_fields}
+    if "wishes" in expand:
+        payload["wishes"] = account.wishes
+    if "history" in expand:
+        payload["history_entries"] = account.history_entries
+    return payload
+
 # === JAVÍTÁS: HIÁNYZÓ GET VÉGPONT HOZZÁADVA ===
-@app.get("/api/accounts", response_model=List[Account])
+@app.get("/api/accounts", response_model=List[schemas.AccountDetail], response_model_exclude_unset=True)
 def read_accounts(
     type: Optional[str] = None,
     status: Optional[str] = 'active', # Új, opcionális paraméter
+    expand: Optional[str] = Query(None, description="Beágyazott adatok vesszővel elválasztva: wishes, history"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Listázza a kasszákat típus és státusz alapján a felhasználó jogosultságainak megfelelően.
+    Alapértelmezésben összefoglalót ad; az ?expand=wishes,history kéri a beágyazott listákat.
     """
-    return get_accounts_by_family(db, user=current_user, account_type=type, status=status)
+    expand_fields = _parse_account_expand(expand)
+    accounts = get_accounts_by_family(db, user=current_user, account_type=type, status=status, expand=expand_fields)
+    return [_account_payload(account, expand_fields) for account in accounts]
 
 @app.post("/api/accounts", response_model=Account)
 def create_new_account(
@@ -411,17 +499,20 @@ def read_transactions(
     type: str | None = None,
     search: str | None = None,
     sort_by: str | None = 'date_desc',
+    include_archived: bool = False,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    return get_transactions(
+    # Projekciós lekérdezés, közvetlen JSON: nagy listáknál se ORM, se Pydantic kör
+    return FastJSONResponse(crud.get_transaction_rows(
         db=db, 
         user=current_user, 
         account_id=account_id,
         transaction_type=type,
         search_term=search,
-        sort_by=sort_by
-    )
+        sort_by=sort_by,
+        include_archived=include_archived
+    ))
 @app.put("/api/transactions/{transaction_id}", response_model=Transaction)
 def update_transaction_details(
     transaction_id: int,
@@ -444,14 +535,35 @@ def remove_transaction(
 @app.post("/api/transfers")
 def execute_transfer(
     transfer_data: TransferCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
     Végrehajt egy átutalást két kassza között.
     Ez a művelet két tranzakciót hoz létre (egy kiadást és egy bevételt).
+    Idempotency-Key fejléccel az újrapróbált kérés a tárolt választ kapja.
     """
-    return create_transfer(db=db, transfer_data=transfer_data, user=current_user)
+    return idempotency.execute(
+        db, current_user, idempotency_key, "POST /api/transfers", transfer_data.model_dump(mode="json"),
+        operation=lambda: crud.apply_transfer(db=db, transfer_data=transfer_data, user=current_user),
+    )
+
+@app.post("/api/transfers/batch")
+def execute_transfer_batch(
+    batch: schemas.TransferBatchCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Több átutalás egyszerre (pl. zsebpénz több gyereknek), egyetlen atomi
+    tranzakcióban: vagy az összes tétel teljesül, vagy egyik sem.
+    """
+    return idempotency.execute(
+        db, current_user, idempotency_key, "POST /api/transfers/batch", batch.model_dump(mode="json"),
+        operation=lambda: crud.apply_transfer_batch(db=db, transfers=batch.transfers, user=current_user),
+    )
 
 @app.post("/api/users", response_model=User)
 def add_new_user_by_admin(user: UserCreate, db: Session = Depends(get_db), admin: UserModel = Depends(get_current_admin_user)):
@@ -494,31 +606,63 @@ def create_new_account(
         
     return create_family_account(db=db, account=account, family_id=current_user.family_id, owner_user=current_user)
 
-@app.get("/api/accounts/{account_id}", response_model=Account)
+@app.get("/api/accounts/{account_id}", response_model=schemas.AccountDetail, response_model_exclude_unset=True)
 def read_account_details(
     account_id: int,
+    expand: Optional[str] = Query(None, description="Beágyazott adatok vesszővel elválasztva: wishes, history"),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    """ Visszaadja egyetlen kassza részletes adatait, jogosultsággal ellenőrizve. """
-    db_account = get_account(db=db, account_id=account_id, user=current_user)
+    """ Visszaadja egyetlen kassza adatait, jogosultsággal ellenőrizve; a beágyazott listák csak ?expand-del. """
+    expand_fields = _parse_account_expand(expand)
+    db_account = get_account(db=db, account_id=account_id, user=current_user, expand=expand_fields)
     if db_account is None:
         raise HTTPException(status_code=404, detail="Kassza nem található.")
-    return db_account
+    return _account_payload(db_account, expand_fields)
+
+@app.get("/api/accounts/{account_id}/balance-at", response_model=schemas.AccountBalanceAt)
+def read_account_balance_at(
+    account_id: int,
+    at: date = Query(..., alias="date", description="A nap, aminek a végén az egyenleg érdekes (YYYY-MM-DD)"),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """ A kassza egyenlege egy korábbi napon: legközelebbi havi pillanatkép + a napig tartó tranzakciók. """
+    if account_id not in crud.get_visible_account_ids(db, user=current_user, status=None):
+        raise HTTPException(status_code=404, detail="Kassza nem található vagy nincs jogosultságod hozzá.")
+    return ledger.balance_at(db, account_id, at)
+
+@app.get("/api/ledger/reconciliation", response_model=List[schemas.AccountBalanceDrift])
+def read_balance_reconciliation(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """ A család kasszái, amelyek tárolt egyenlege eltér a tranzakciók összegétől. """
+    if current_user.role != 'Családfő':
+        raise HTTPException(status_code=403, detail="Csak a családfő futtathat egyenleg-egyeztetést.")
+    return ledger.reconcile_balances(db, family_id=current_user.family_id)
 
 @app.delete("/api/accounts/{account_id}")
 def remove_account(
     account_id: int, 
+    background_tasks: BackgroundTasks,
     force: bool = False,  # ÚJ query parameter
+    background: bool = False,
     db: Session = Depends(get_db), 
     current_user: UserModel = Depends(get_current_user)
 ):
     """
     Kassza törlése.
-    ?force=true esetén a függőségeket is törli.
+    ?force=true esetén a függőségeket is törli; nagyon sok tranzakciónál (vagy
+    ?background=true esetén) a tranzakciók törlése a válasz után, a háttérben fut.
     """
     if force:
-        return delete_account_with_dependencies(db=db, account_id=account_id, user=current_user, force=True)
+        result = delete_account_with_dependencies(
+            db=db, account_id=account_id, user=current_user, force=True, background=background
+        )
+        if result and result.get("background"):
+            background_tasks.add_task(account_deletion.purge_in_background, account_id)
+        return result
     else:
         return delete_account(db=db, account_id=account_id, user=current_user)
 @app.get("/api/accounts/{account_id}/dependencies")
@@ -535,13 +679,20 @@ def check_account_dependencies(
 def add_transaction_to_account(
     account_id: int,
     transaction: TransactionCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
     """
     Hozzáad egy új bevételi vagy kiadási tranzakciót egy adott kasszához.
+    Idempotency-Key fejléccel az újrapróbált kérés a tárolt választ kapja.
     """
-    return create_account_transaction(db=db, transaction=transaction, account_id=account_id, user=current_user)
+    return idempotency.execute(
+        db, current_user, idempotency_key, f"POST /api/accounts/{account_id}/transactions",
+        transaction.model_dump(mode="json"),
+        operation=lambda: crud.apply_account_transaction(db=db, transaction=transaction, account_id=account_id, user=current_user),
+        serialize=lambda db_transaction: idempotency.to_json(TransactionSchema.model_validate(db_transaction)),
+    )
 
 
 
@@ -601,6 +752,16 @@ def debug_dashboard_parts(db: Session = Depends(get_db), current_user: UserModel
         return {"status": "All parts working"}
     except Exception as e:
         return {"error": str(e)}
+
+@app.get("/api/debug/query-stats")
+def debug_query_stats(reset: bool = False, admin: UserModel = Depends(get_current_admin_user)):
+    """Végpontonkénti lekérdezés-összesítés (csak debug vagy mintavételezés módban)."""
+    if not config.DEBUG and config.QUERY_PROFILE_SAMPLE_RATE <= 0:
+        raise HTTPException(status_code=404, detail="A lekérdezés-profilozás nincs bekapcsolva.")
+    snapshot = route_aggregates.snapshot()
+    if reset:
+        route_aggregates.reset()
+    return {"sample_rate": config.QUERY_PROFILE_SAMPLE_RATE, "routes": snapshot}
     
 @app.get("/api/analytics/category-spending")
 def get_category_spending_endpoint(
@@ -730,19 +891,86 @@ def complete_expense(
     return complete_expected_expense(db=db, expense_id=expense_id, completion_data=completion_data, user=current_user)
 
 @app.get("/api/upcoming-events", response_model=List[UpcomingEvent])
-def read_upcoming_events(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    """Lekérdezi a következő 30 nap eseményeit."""
-    return get_upcoming_events(db=db, user=current_user)
+def read_upcoming_events(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Legfeljebb ennyi tétel (alapértelmezés: FAMILYHUB_UPCOMING_LIMIT)"),
+    days: Optional[int] = Query(None, ge=1, le=366, description="Az időablak hossza napokban (alapértelmezés: 30)"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Lekérdezi a következő napok eseményeit; az ismétlődő szabályok minden előfordulásával."""
+    return get_upcoming_events(db=db, user=current_user, limit=limit, days=days)
+
 
+def _save_wish_image_metadata(content_hash: str, width: int, height: int, thumbnail_url: str):
+    # Háttérfeladat: a kérés munkamenete ekkorra már lezárult, sajátot nyitunk
+    db = SessionLocal()
+    try:
+        crud.update_wish_image_metadata(db, content_hash, width, height, thumbnail_url)
+    finally:
+        db.close()
+
+async def _process_wish_image(content_hash: str, source: Path):
+    """ Borító bélyegkép és képméret előállítása a válasz elküldése után. """
+    try:
+        result = await uploads.generate_thumbnails(source, sizes=(uploads.WISH_COVER_SIZE,), crop=False)
+    except HTTPException:
+        print(f"A kívánság kép nem értelmezhető, bélyegkép nem készült: {source}")
+        return
+    if result is None:
+        return
+    thumbnail_url = uploads.upload_url(Path(result["thumbnails"][0]))
+    await run_in_threadpool(_save_wish_image_metadata, content_hash, result["width"], result["height"], thumbnail_url)
+
+def _schedule_wish_image_processing(background_tasks: BackgroundTasks, images):
+    scheduled = set()
+    for image in images:
+        if image.thumbnail_url or not image.content_hash or image.content_hash in scheduled:
+            continue
+        scheduled.add(image.content_hash)
+        source = config.UPLOAD_ROOT / image.image_url.removeprefix("/uploads/")
+        background_tasks.add_task(_process_wish_image, image.content_hash, source)
 
 @app.post("/api/wishes", response_model=WishSchema, status_code=status.HTTP_201_CREATED)
 def add_new_wish(
     wish: WishCreate, 
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(get_current_user)
 ):
     """Új kívánság létrehozása a bejelentkezett felhasználó számára."""
-    return create_wish(db=db, wish=wish, user=current_user)
+    db_wish = create_wish(db=db, wish=wish, user=current_user)
+    _schedule_wish_image_processing(background_tasks, db_wish.images)
+    return db_wish
+
+@app.post("/api/wishes/{wish_id}/images", response_model=schemas.WishImage, status_code=status.HTTP_201_CREATED)
+async def upload_wish_image(
+    wish_id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Kép feltöltése egy kívánsághoz (multipart). A fájl darabolva, hash-elve
+    kerül a tartalom-címzett tárba; a borító bélyegkép a háttérben készül.
+    """
+    # A törzs méretét az UploadSizeLimitMiddleware már beérkezés közben korlátozza
+    max_bytes = int(config.MAX_WISH_IMAGE_UPLOAD_MB * 1024 * 1024)
+
+    # Jogosultság és állapot a lemezre írás előtt: elutasított kérés nem hagy fájlt a tárban
+    await run_in_threadpool(crud.get_image_editable_wish, db, wish_id, current_user)
+    content_hash, path, byte_size, created = await uploads.save_wish_image_upload(file, max_bytes)
+    try:
+        db_image = await run_in_threadpool(
+            crud.add_wish_image, db, wish_id, current_user, content_hash, uploads.upload_url(path), byte_size
+        )
+    except Exception:
+        # Közben változhatott a kívánság állapota: a most lerakott (árva) fájlt eltávolítjuk
+        if created:
+            await run_in_threadpool(path.unlink, True)
+        raise
+    _schedule_wish_image_processing(background_tasks, [db_image])
+    return db_image
 
 @app.get("/api/wishes", response_model=List[WishSchema])
 def read_wishes(
@@ -755,12 +983,13 @@ def read_wishes(
     current_user: models.User = Depends(get_current_user)
 ):
     """Listázza a család kívánságait szűrési lehetőségekkel."""
-    wishes = get_wishes_by_family(
+    # A response_model csak a dokumentációt adja: a sorok már a séma alakjában jönnek
+    wishes = crud.get_wish_rows_by_family(
         db=db, user=current_user, 
         statuses=statuses, owner_ids=owner_ids, category_ids=category_ids,
         skip=skip, limit=limit
     )
-    return wishes
+    return FastJSONResponse(wishes)
 
 @app.get("/api/wishes/{wish_id}", response_model=WishSchema)
 def read_wish(
@@ -829,6 +1058,27 @@ def read_notifications(
     """Lekérdezi a felhasználó számára releváns dashboard értesítéseket."""
     return get_dashboard_notifications(db=db, user=current_user)
 
+@app.get("/api/notifications/feed", response_model=schemas.NotificationFeed)
+def read_notification_feed(
+    cursor: Optional[int] = Query(None, description="Az előző lap next_cursor értéke"),
+    limit: int = Query(notifications.DEFAULT_FEED_LIMIT, ge=1, le=notifications.MAX_FEED_LIMIT),
+    unread_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Az értesítések postafiókja, a legújabbal kezdve, kurzoros lapozással."""
+    return notifications.get_feed(db, current_user, cursor=cursor, limit=limit, unread_only=unread_only)
+
+@app.post("/api/notifications/read")
+def mark_notifications_read(
+    request: schemas.NotificationReadRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Olvasottnak jelöli a megadott (vagy egy id-ig az összes) értesítést."""
+    updated = notifications.mark_read(db, current_user, notification_ids=request.ids, up_to=request.up_to)
+    return {"updated": updated, "unread_count": notifications.unread_count(db, current_user)}
+
 @app.get("/api/wishes/{wish_id}/history", response_model=List[WishHistorySchema])
 def read_wish_history(
     wish_id: int,
@@ -877,6 +1127,7 @@ def close_account_goal(account_id: int, db: Session = Depends(get_db), current_u
 def close_account_goal_endpoint(
     account_id: int,
     request_data: GoalCloseRequest,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -884,12 +1135,14 @@ def close_account_goal_endpoint(
     Lezár egy célkasszát a "persely" logika alapján:
     létrehoz egy statisztikai kiadást, lenullázza a kasszát,
     és teljesített státuszba helyezi a kapcsolódó kívánságokat.
+    Idempotency-Key fejléccel az újrapróbált kérés a tárolt választ kapja.
     """
-    return close_goal_account(
-        db=db,
-        account_id=account_id,
-        user=current_user,
-        request_data=request_data
+    return idempotency.execute(
+        db, current_user, idempotency_key, f"POST /api/accounts/{account_id}/close",
+        request_data.model_dump(mode="json"),
+        operation=lambda: crud.apply_close_goal_account(
+            db=db, account_id=account_id, user=current_user, request_data=request_data
+        ),
     )
 
 # === TIME MANAGEMENT API ENDPOINTS ===
@@ -1085,6 +1338,23 @@ def update_calendar_integration(
         raise HTTPException(status_code=404, detail="Calendar integration not found")
     return updated_integration
 
+@app.post("/api/time-management/calendar-integrations/{integration_id}/sync")
+def sync_calendar_integration(
+    integration_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Azonnali szinkron; változatlan feednél csak egy feltételes kérés megy ki."""
+    integration = db.query(models.CalendarIntegration).filter(
+        models.CalendarIntegration.id == integration_id,
+        models.CalendarIntegration.user_id == current_user.id
+    ).first()
+    if not integration:
+        raise HTTPException(status_code=404, detail="Calendar integration not found")
+    if not integration.url:
+        raise HTTPException(status_code=400, detail="Az integrációhoz nincs naptár cím megadva.")
+    return calendar_sync.sync_integration(db, integration).as_dict()
+
 @app.delete("/api/time-management/calendar-integrations/{integration_id}")
 def delete_calendar_integration(
     integration_id: int,
@@ -1096,6 +1366,45 @@ def delete_calendar_integration(
         raise HTTPException(status_code=404, detail="Calendar integration not found")
     return {"message": "Calendar integration deleted successfully"}
 
+# Calendar export feeds (.ics)
+@app.post("/api/time-management/calendar-feeds", response_model=schemas.CalendarFeedTokenCreated)
+def create_calendar_feed(
+    request: Request,
+    feed: schemas.CalendarFeedTokenCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    feed_token, token = calendar_feed.create_token(db, current_user, feed.scope)
+    return schemas.CalendarFeedTokenCreated(
+        id=feed_token.id, scope=feed_token.scope, created_at=feed_token.created_at, token=token,
+        url=str(request.url_for("get_calendar_feed", token=token)),
+    )
+
+@app.get("/api/time-management/calendar-feeds", response_model=List[schemas.CalendarFeedToken])
+def get_my_calendar_feeds(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return calendar_feed.list_tokens(db, current_user.id)
+
+@app.delete("/api/time-management/calendar-feeds/{feed_id}")
+def revoke_calendar_feed(
+    feed_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if not calendar_feed.revoke_token(db, feed_id, current_user.id):
+        raise HTTPException(status_code=404, detail="A naptár feed nem található.")
+    return {"message": "A naptár feed visszavonva."}
+
+@app.get("/api/calendar-feeds/{token}.ics", name="get_calendar_feed")
+def get_calendar_feed(token: str, request: Request, db: Session = Depends(get_db)):
+    """Csak olvasható .ics feed; bejelentkezés helyett a token azonosít. Változatlan adatnál 304."""
+    feed_token = calendar_feed.resolve_token(db, token)
+    if feed_token is None:
+        raise HTTPException(status_code=404, detail="A naptár feed nem található.")
+    return calendar_feed.feed_response(db, feed_token, request.headers)
+
 # Time Conflicts
 @app.post("/api/time-management/conflicts", response_model=schemas.TimeConflict)
 def create_conflict(
@@ -1163,6 +1472,16 @@ def get_todays_events(
 ):
     return crud.get_todays_events(db=db, family_id=current_user.family_id)
 
+@app.get("/api/time-management/timeline", response_model=schemas.Timeline)
+def get_family_timeline(
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Családi események, saját események, műszakok és importált naptárak egy rendezett folyamban, ütközésekkel."""
+    return crud.get_family_timeline(db=db, family_id=current_user.family_id, start_date=start_date, end_date=end_date)
+
 @app.put("/api/time-management/events/{event_id}", response_model=schemas.FamilyEvent)
 def update_event(
     event_id: int,
@@ -1,9 +1,9 @@
 from sqlalchemy import (
     Boolean, Column, Integer, String, Date, ForeignKey,
-    Numeric, DateTime, Table, Enum, Text
+    Numeric, DateTime, Table, Enum, Text, UniqueConstraint, Index, MetaData
 )
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from .database import Base
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 
@@ -107,6 +107,8 @@ class Account(Base):
     goal_date = Column(Date, nullable=True)
     show_on_dashboard = Column(Boolean, default=False)
     status = Column(Enum('active', 'archived', name='account_status_enum'), default='active', nullable=False)
+    # Függőben lévő háttértörlés: a kérés, majd minden commitolt adag ideje (account_deletion)
+    pending_purge_at = Column(DateTime, nullable=True)
     
     family_id = Column(Integer, ForeignKey("families.id"))
     owner_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -121,15 +123,21 @@ class Account(Base):
     
     # === EZ VOLT A HIBA, EZT JAVÍTOTTAM ===
     history_entries = relationship("AccountHistory", back_populates="account")
+    goal_progress = relationship("GoalProgress", back_populates="account", uselist=False,
+                                 cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Az adatbázisban date szerint havonta particionált (Alembic migráció + partitions modul);
+    # ott az elsődleges kulcs (id, date), a leképezés azonosítója továbbra is az id.
+    # A főkönyvi lekérdezések kasszánként, dátum-tartományra szűrnek
+    __table_args__ = (Index('ix_transactions_account_id_date', 'account_id', 'date'),)
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String)
     amount = Column(Numeric(10, 2))
     type = Column(String)
-    date = Column(DateTime(timezone=True), server_default=func.now())
+    date = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     account_id = Column(Integer, ForeignKey("accounts.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
@@ -139,7 +147,62 @@ class Transaction(Base):
     account = relationship("Account", back_populates="transactions")
     creator = relationship("User", back_populates="transactions")
     category = relationship("Category", back_populates="transactions")
-    expected_expense = relationship("ExpectedExpense", back_populates="transaction", uselist=False)
+    expected_expense = relationship("ExpectedExpense", back_populates="transaction", uselist=False,
+                                    primaryjoin="Transaction.id == foreign(ExpectedExpense.transaction_id)")
+
+class TransactionArchive(Base):
+    """ Az archiválási horizontnál régebbi tranzakciók, az eredeti azonosítóval; csak olvasásra. """
+    __tablename__ = "transactions_archive"
+    __table_args__ = (Index('ix_transactions_archive_account_id_date', 'account_id', 'date'),)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String)
+    amount = Column(Numeric(10, 2))
+    type = Column(String)
+    date = Column(DateTime(timezone=True))
+    # Nincs kaszkád: a pénzügyi történetet csak a kényszerített kassza törlés viheti el
+    account_id = Column(Integer, ForeignKey("accounts.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    transfer_id = Column(UUID(as_uuid=True), nullable=True)
+    is_family_expense = Column(Boolean, default=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class TransactionMonthlyRollup(Base):
+    """
+    Az archivált tranzakciók havi összegei kasszánként, kategóriánként és az
+    elemzések szűrőinek megfelelő bontásban; az elemzések a hideg sorok helyett ezt olvassák.
+    """
+    __tablename__ = "transaction_monthly_rollups"
+    __table_args__ = (Index('ix_transaction_monthly_rollups_month_account_id', 'month', 'account_id'),)
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
+    month = Column(Date, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)
+    type = Column(String, nullable=False)
+    is_transfer = Column(Boolean, nullable=False)
+    is_family_expense = Column(Boolean, nullable=False)
+    amount = Column(Numeric(14, 2), nullable=False)
+    transaction_count = Column(Integer, nullable=False)
+
+# Az élő és az archivált tranzakciók együtt (nézet, az Alembic hozza létre; a create_all nem látja)
+transactions_all = Table(
+    "transactions_all", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("description", String),
+    Column("amount", Numeric(10, 2)),
+    Column("type", String),
+    Column("date", DateTime(timezone=True)),
+    Column("account_id", Integer),
+    Column("user_id", Integer),
+    Column("category_id", Integer),
+    Column("transfer_id", UUID(as_uuid=True)),
+    Column("is_family_expense", Boolean),
+    Column("is_archived", Boolean),
+)
+
+class TransactionAll(Base):
+    """ Csak olvasható leképezés a transactions_all nézetre (történeti lekérdezésekhez). """
+    __table__ = transactions_all
 
 class WishlistItem(Base):
     __tablename__ = "wishlist_items"
@@ -152,6 +215,7 @@ class WishlistItem(Base):
 
 class RecurringRule(Base):
     __tablename__ = "recurring_rules"
+    __table_args__ = (Index('ix_recurring_rules_owner_id_updated_at', 'owner_id', 'updated_at'),)
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String)
     amount = Column(Numeric(10, 2))
@@ -168,11 +232,13 @@ class RecurringRule(Base):
     end_date = Column(Date, nullable=True)
     next_run_date = Column(Date)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
 
     owner_user = relationship("User", back_populates="recurring_rules")
 
 class ExpectedExpense(Base):
     __tablename__ = 'expected_expenses'
+    __table_args__ = (Index('ix_expected_expenses_owner_id_updated_at', 'owner_id', 'updated_at'),)
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String, nullable=False)
     estimated_amount = Column(Numeric(10, 2), nullable=False)
@@ -183,14 +249,17 @@ class ExpectedExpense(Base):
     owner_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     family_id = Column(Integer, ForeignKey('families.id'), nullable=False)
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
-    transaction_id = Column(Integer, ForeignKey('transactions.id'), nullable=True)
+    # A particionált transactions táblára nincs idegen kulcs; törléskor az ORM / a törlő kód nullázza
+    transaction_id = Column(Integer, nullable=True)
     is_recurring = Column(Boolean, default=False, nullable=False)
     recurring_frequency = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
     
     owner = relationship("User", back_populates="expected_expenses")
     family = relationship("Family", back_populates="expected_expenses")
     category = relationship("Category", back_populates="expected_expenses")
-    transaction = relationship("Transaction", back_populates="expected_expense", uselist=False)
+    transaction = relationship("Transaction", back_populates="expected_expense", uselist=False,
+                               primaryjoin="foreign(ExpectedExpense.transaction_id) == Transaction.id")
 
 
 class Wish(Base):
@@ -215,24 +284,35 @@ class Wish(Base):
     approved_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
     deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Materializált jóváhagyási állapot: beküldéskor nyílik, döntésenként a wish soron zárolva frissül
+    approvals_required = Column(Integer, nullable=False, default=0, server_default='0')
+    approvals_received = Column(Integer, nullable=False, default=0, server_default='0')
+    has_conditional_approval = Column(Boolean, nullable=False, default=False, server_default='false')
     owner = relationship("User", back_populates="wishes", foreign_keys=[owner_user_id])
     family = relationship("Family", back_populates="wishes")
     category = relationship("Category", back_populates="wishes")
     # === EZ A MÓDOSÍTÁS ===
     goal_account = relationship("Account", back_populates="wishes", foreign_keys=[goal_account_id])
     
-    images = relationship("WishImage", back_populates="wish", cascade="all, delete-orphan")
+    images = relationship("WishImage", back_populates="wish", cascade="all, delete-orphan", order_by="WishImage.image_order")
     links = relationship("WishLink", back_populates="wish", cascade="all, delete-orphan")
     approvals = relationship("WishApproval", back_populates="wish", cascade="all, delete-orphan")
     history = relationship("WishHistory", back_populates="wish", cascade="all, delete-orphan")
 
 class WishImage(Base):
     __tablename__ = "wish_images"
+    __table_args__ = (Index('ix_wish_images_wish_id_order', 'wish_id', 'image_order'),)
     id = Column(Integer, primary_key=True, index=True)
     wish_id = Column(Integer, ForeignKey("wishes.id"), nullable=False)
     image_url = Column(String(500), nullable=False)
     image_order = Column(Integer, default=0)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Tartalom-címzett tárolás: azonos fájl egyszer van a lemezen, a metaadat hash szerint megosztott
+    content_hash = Column(String(64), nullable=True, index=True)
+    byte_size = Column(Integer, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    thumbnail_url = Column(String(500), nullable=True)
     
     wish = relationship("Wish", back_populates="images")
 
@@ -247,6 +327,12 @@ class WishLink(Base):
     
     wish = relationship("Wish", back_populates="links")
 
+class WishPendingApprover(Base):
+    """ Szülő, akinek a döntésére egy beküldött kívánság még vár. Csak 'pending' kívánsághoz van sor. """
+    __tablename__ = "wish_pending_approvers"
+    wish_id = Column(Integer, ForeignKey("wishes.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
 class WishApproval(Base):
     __tablename__ = "wish_approvals"
     id = Column(Integer, primary_key=True, index=True)
@@ -331,10 +417,73 @@ class AccountHistory(Base):
     user = relationship("User", back_populates="account_history_entries")
     family = relationship("Family", back_populates="account_history")
 
+class IdempotencyKey(Base):
+    """ Pénzmozgató kérések Idempotency-Key fejléce -> a tárolt válasz, lejáratig. """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(JSONB, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class AccountBalanceSnapshot(Base):
+    """ Kassza egyenlege egy hónap első napjának kezdetén (az as_of előtti tranzakciók összege). """
+    __tablename__ = "account_balance_snapshots"
+    __table_args__ = (UniqueConstraint('account_id', 'as_of', name='uq_account_balance_snapshot'),)
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
+    as_of = Column(Date, nullable=False)
+    balance = Column(Numeric(10, 2), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GoalProgress(Base):
+    """ Célkassza futó statisztikája: minden átutaláskor frissül, a dashboard csak ezt olvassa. """
+    __tablename__ = "goal_progress"
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True)
+    contributed = Column(Numeric(12, 2), nullable=False, default=0)  # befizetések összesen
+    withdrawn = Column(Numeric(12, 2), nullable=False, default=0)  # kiutalások összesen
+    contribution_count = Column(Integer, nullable=False, default=0)
+    first_contribution_at = Column(DateTime, nullable=True)
+    last_contribution_at = Column(DateTime, nullable=True)
+    average_monthly = Column(Numeric(12, 2), nullable=True)  # nettó befizetés / eltelt hónapok
+    projected_completion_date = Column(Date, nullable=True)  # az átlagos ütemmel mikor telik meg
+    on_track = Column(Boolean, nullable=True)  # a becsült dátum legkésőbb a goal_date
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    account = relationship("Account", back_populates="goal_progress")
+
 # Time Management Models
 
+class Notification(Base):
+    """ Felhasználói értesítés-postafiók: az esemény pillanatában íródik, olvasáskor csak lekérdezzük. """
+    __tablename__ = "notifications"
+    __table_args__ = (
+        # Feed lapozás (user_id, id DESC) és az olvasatlanok számlálása
+        Index('ix_notifications_user_id_id', 'user_id', 'id'),
+        Index('ix_notifications_user_unread', 'user_id', postgresql_where=text('read_at IS NULL')),
+        Index('ix_notifications_entity', 'entity_type', 'entity_id'),
+    )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String(50), nullable=False)
+    message = Column(String(500), nullable=False)
+    link = Column(String(255), nullable=True)
+    # A kiváltó objektum (pl. 'wish', 42), az értesítések automatikus lezárásához
+    entity_type = Column(String(30), nullable=True)
+    entity_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    read_at = Column(DateTime(timezone=True), nullable=True)
+
 class ShiftTemplate(Base):
     __tablename__ = "shift_templates"
+    __table_args__ = (
+        Index('ix_shift_templates_user_id_updated_at', 'user_id', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)  # "Reggeli műszak", "Délutáni műszak"
@@ -353,6 +502,9 @@ class ShiftTemplate(Base):
 
 class ShiftAssignment(Base):
     __tablename__ = "shift_assignments"
+    __table_args__ = (
+        Index('ix_shift_assignments_user_id_date', 'user_id', 'date'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     template_id = Column(Integer, ForeignKey("shift_templates.id"), nullable=False)
@@ -367,6 +519,9 @@ class ShiftAssignment(Base):
 
 class WorkShift(Base):
     __tablename__ = "work_shifts"
+    __table_args__ = (
+        Index('ix_work_shifts_user_id_updated_at', 'user_id', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
@@ -392,10 +547,60 @@ class CalendarIntegration(Base):
     refresh_token = Column(String, nullable=True)
     external_calendar_id = Column(String, nullable=True)
     sync_enabled = Column(Boolean, nullable=False, default=True)
+    # iCalendar feed (http(s)://, webcal:// vagy a CALENDAR_FILE_ROOT alatti fájl)
+    url = Column(String, nullable=True)
+    # Feltételes letöltéshez: változatlan feednél a szerver 304-et ad
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    sync_error = Column(Text, nullable=True)
     created_at = Column(DateTime, nullable=False, default=func.now())
     updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
     
     user = relationship("User", back_populates="calendar_integrations")
+    synced_events = relationship("SyncedEvent", back_populates="integration", cascade="all, delete-orphan", passive_deletes=True)
+
+class SyncedEvent(Base):
+    """ Külső naptárból importált esemény; a content_hash alapján csak a változás íródik. """
+    __tablename__ = "synced_events"
+    __table_args__ = (
+        UniqueConstraint('calendar_integration_id', 'external_event_id', name='uq_synced_event_integration_external_id'),
+        Index('ix_synced_events_integration_start', 'calendar_integration_id', 'start_datetime'),
+        # Az ismétlődő sorozatok az ablakon kívül is kezdődhetnek: ezeket külön, kis indexből olvassuk
+        Index('ix_synced_events_recurring', 'calendar_integration_id', postgresql_where=text('rrule IS NOT NULL')),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    calendar_integration_id = Column(Integer, ForeignKey("calendar_integrations.id", ondelete="CASCADE"), nullable=False)
+    external_event_id = Column(String, nullable=False)
+    title = Column(String, nullable=False)
+    description = Column(Text, nullable=True)
+    start_datetime = Column(DateTime, nullable=False)
+    end_datetime = Column(DateTime, nullable=False)
+    is_all_day = Column(Boolean, nullable=False, default=False)
+    location = Column(String, nullable=True)
+    rrule = Column(Text, nullable=True)  # "FREQ=WEEKLY;BYDAY=MO,WE", UNTIL helyi időre igazítva
+    exdates = Column(Text, nullable=True)  # "20250106T080000,..." kivett előfordulások
+    recurrence_id = Column(DateTime, nullable=True)  # módosított előfordulásnál az eredeti kezdet
+    recurrence_end = Column(DateTime, nullable=True)  # az utolsó előfordulás vége; None = végtelen
+    tzid = Column(String, nullable=True)  # a kibontás időzónája (TZID / "UTC"); None = lebegő idő
+    content_hash = Column(String(64), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    integration = relationship("CalendarIntegration", back_populates="synced_events")
+
+class CalendarFeedToken(Base):
+    """
+    Csak olvasható .ics feed elérése token alapján (a telefonos naptárak nem
+    tudnak bejelentkezni). A tokent csak hash-ként tároljuk; visszavonás után a feed 404.
+    """
+    __tablename__ = "calendar_feed_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family_id = Column(Integer, ForeignKey("families.id", ondelete="CASCADE"), nullable=False)
+    scope = Column(String(10), nullable=False)  # 'user', 'family'
+    token_hash = Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    revoked_at = Column(DateTime, nullable=True)
 
 class TimeConflict(Base):
     __tablename__ = "time_conflicts"
@@ -420,6 +625,9 @@ class TimeConflict(Base):
 
 class FamilyEvent(Base):
     __tablename__ = "family_events"
+    __table_args__ = (
+        Index('ix_family_events_family_id_start_time', 'family_id', 'start_time'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     family_id = Column(Integer, ForeignKey("families.id"), nullable=False)
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,185 @@
+# Értesítés-postafiók: az események a bekövetkezésükkor, egyetlen kötegelt
+# INSERT-tel íródnak a címzettek postafiókjába; a feed olvasása így egy
+# indexelt lekérdezés. Új értesítés típus = egy újabb notify() hívás.
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+WISH_SUBMITTED = "wish_submitted"
+WISH_DECIDED = "wish_decided"
+MODIFICATIONS_REQUESTED = "modifications_requested"
+GOAL_REACHED = "goal_reached"
+RECURRING_RULE_FAILED = "recurring_rule_failed"
+
+PARENT_ROLES = ("Családfő", "Szülő")
+DEFAULT_FEED_LIMIT = 20
+MAX_FEED_LIMIT = 100
+
+_DECISION_LABELS = {"approved": "jóváhagyta", "conditional": "feltételesen jóváhagyta", "rejected": "elutasította"}
+
+
+def notify(db: Session, user_ids: Iterable[int], type: str, message: str,
+           link: Optional[str] = None, entity_type: Optional[str] = None, entity_id: Optional[int] = None) -> int:
+    """ Értesítés a címzetteknek egyetlen INSERT-tel, commit nélkül. A címzettek számát adja vissza. """
+    recipients = sorted(set(user_ids))
+    if not recipients:
+        return 0
+    db.bulk_insert_mappings(models.Notification, [
+        {"user_id": user_id, "type": type, "message": message, "link": link,
+         "entity_type": entity_type, "entity_id": entity_id}
+        for user_id in recipients
+    ])
+    return len(recipients)
+
+
+def resolve(db: Session, type: str, entity_type: str, entity_id: int, user_ids: Optional[Iterable[int]] = None) -> int:
+    """ Olvasottnak jelöli a már okafogyott értesítéseket (pl. a döntés megszületett). Commit nélkül. """
+    query = db.query(models.Notification).filter(
+        models.Notification.type == type,
+        models.Notification.entity_type == entity_type,
+        models.Notification.entity_id == entity_id,
+        models.Notification.read_at.is_(None),
+    )
+    if user_ids is not None:
+        query = query.filter(models.Notification.user_id.in_(list(user_ids)))
+    return query.update({"read_at": datetime.now(timezone.utc)}, synchronize_session=False)
+
+
+def _family_parent_ids(db: Session, family_id: int):
+    return [row.id for row in db.query(models.User.id).filter(
+        models.User.family_id == family_id, models.User.role.in_(PARENT_ROLES)
+    )]
+
+
+# --- Események ---
+
+def wish_submitted(db: Session, wish: models.Wish, submitter: models.User):
+    """ A várakozó szülők (wish_pending_approvers) kapják; a jóváhagyási kör megnyitása után hívandó. """
+    approver_ids = [row.user_id for row in db.query(models.WishPendingApprover.user_id).filter(
+        models.WishPendingApprover.wish_id == wish.id
+    )]
+    notify(db, approver_ids, WISH_SUBMITTED,
+           f"{submitter.display_name} jóváhagyásra küldte: {wish.name}",
+           link="/wishes?tab=pending", entity_type="wish", entity_id=wish.id)
+
+
+def wish_owner_acted(db: Session, wish: models.Wish):
+    """ A tulajdonos módosította vagy újraküldte: a korábbi döntés/módosításkérés értesítései okafogyottak. """
+    resolve(db, MODIFICATIONS_REQUESTED, "wish", wish.id, user_ids=[wish.owner_user_id])
+    resolve(db, WISH_DECIDED, "wish", wish.id, user_ids=[wish.owner_user_id])
+
+
+def wish_removed(db: Session, wish: models.Wish):
+    """ Törölt kívánságról semmilyen értesítés nem marad nyitva. """
+    for type in (WISH_SUBMITTED, MODIFICATIONS_REQUESTED, WISH_DECIDED):
+        resolve(db, type, "wish", wish.id)
+
+
+def wish_decided(db: Session, wish: models.Wish, approver: models.User, decision: str):
+    """
+    A döntő szülő értesítése lezárul; a tulajdonos a döntésről vagy a végső
+    státuszról kap hírt, az új hír a korábbi döntés-értesítéseit lezárja.
+    """
+    resolve(db, WISH_SUBMITTED, "wish", wish.id, user_ids=[approver.id])
+    if wish.status != 'pending':
+        # A kör lezárult: a többi szülőnek sincs már teendője
+        resolve(db, WISH_SUBMITTED, "wish", wish.id)
+    if decision == 'modifications_requested' or wish.status in _DECISION_LABELS:
+        wish_owner_acted(db, wish)
+
+    if decision == 'modifications_requested':
+        notify(db, [wish.owner_user_id], MODIFICATIONS_REQUESTED,
+               f"{approver.display_name} módosítást kért: {wish.name}",
+               link="/wishes?tab=my-wishes", entity_type="wish", entity_id=wish.id)
+    elif wish.status in _DECISION_LABELS:
+        notify(db, [wish.owner_user_id], WISH_DECIDED,
+               f"A családod {_DECISION_LABELS[wish.status]} a kívánságodat: {wish.name}",
+               link="/wishes?tab=my-wishes", entity_type="wish", entity_id=wish.id)
+
+
+def goals_reached(db: Session, accounts: Iterable[models.Account], previous_balances: Dict[int, Decimal]):
+    """
+    Célkasszák, amelyek ebben a műveletben érték el a célösszeget (előtte alatta
+    voltak): a tulajdonos és a család szülei kapnak értesítést. Commit nélkül.
+    """
+    for account in accounts:
+        if account.type != 'cél' or account.goal_amount is None or account.id not in previous_balances:
+            continue
+        if previous_balances[account.id] < account.goal_amount <= account.balance:
+            recipients = set(_family_parent_ids(db, account.family_id))
+            if account.owner_user_id:
+                recipients.add(account.owner_user_id)
+            notify(db, recipients, GOAL_REACHED,
+                   f"A(z) '{account.name}' célkassza elérte a célösszeget!",
+                   link=f"/finances/account/{account.id}", entity_type="account", entity_id=account.id)
+
+
+def goal_closed(db: Session, account_id: int):
+    """ Lezárt vagy törölt célkasszánál a "célt elérte" értesítések okafogyottak. """
+    resolve(db, GOAL_REACHED, "account", account_id)
+
+
+def recurring_rule_failed(db: Session, rule: models.RecurringRule, error: str):
+    """ Egy szabályról egyszerre csak egy olvasatlan hibaértesítés él (az ütemező a következő futáskor újrapróbálja). """
+    already_notified = db.query(models.Notification.id).filter(
+        models.Notification.user_id == rule.owner_id,
+        models.Notification.type == RECURRING_RULE_FAILED,
+        models.Notification.entity_type == "recurring_rule",
+        models.Notification.entity_id == rule.id,
+        models.Notification.read_at.is_(None),
+    ).first()
+    if already_notified:
+        return
+    notify(db, [rule.owner_id], RECURRING_RULE_FAILED,
+           f"Nem sikerült végrehajtani az ismétlődő tételt ({rule.description}): {error}"[:500],
+           link="/finances", entity_type="recurring_rule", entity_id=rule.id)
+
+
+# --- Olvasás ---
+
+def unread_count(db: Session, user: models.User) -> int:
+    return db.query(func.count(models.Notification.id)).filter(
+        models.Notification.user_id == user.id, models.Notification.read_at.is_(None)
+    ).scalar()
+
+
+def get_feed(db: Session, user: models.User, cursor: Optional[int] = None,
+             limit: int = DEFAULT_FEED_LIMIT, unread_only: bool = False):
+    """
+    Kurzoros lapozás id szerint csökkenő sorrendben: a `cursor` az előző lap
+    utolsó elemének id-ja. Egy lappal többet kérünk, abból tudjuk, van-e még.
+    """
+    limit = max(1, min(limit, MAX_FEED_LIMIT))
+    query = db.query(models.Notification).filter(models.Notification.user_id == user.id)
+    if unread_only:
+        query = query.filter(models.Notification.read_at.is_(None))
+    if cursor is not None:
+        query = query.filter(models.Notification.id < cursor)
+    items = query.order_by(models.Notification.id.desc()).limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "next_cursor": items[-1].id if has_more else None,
+        "unread_count": unread_count(db, user),
+    }
+
+
+def mark_read(db: Session, user: models.User, notification_ids: Optional[Iterable[int]] = None,
+              up_to: Optional[int] = None) -> int:
+    """ Olvasottnak jelöl megadott id-kat, vagy minden olvasatlant az `up_to` id-ig (beleértve). """
+    query = db.query(models.Notification).filter(
+        models.Notification.user_id == user.id, models.Notification.read_at.is_(None)
+    )
+    if notification_ids is not None:
+        query = query.filter(models.Notification.id.in_(list(notification_ids)))
+    if up_to is not None:
+        query = query.filter(models.Notification.id <= up_to)
+    updated = query.update({"read_at": datetime.now(timezone.utc)}, synchronize_session=False)
+    db.commit()
+    return updated
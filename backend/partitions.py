@@ -0,0 +1,83 @@
+# A transactions tábla havi range-partíciói (date szerint). Magát a
+# particionálást az Alembic migráció végzi; ez a modul a karbantartás: az
+# ütemező naponta előre létrehozza a következő hónapok partícióit, hogy az új
+# sorok ne a default partícióba essenek. Ha mégis oda kerültek sorok (pl. egy
+# régi vagy távoli dátumú import), a hónap partíciójának létrehozásakor
+# átköltöznek a helyükre. Nem particionált (vagy nem PostgreSQL) adatbázison
+# nem csinál semmit.
+from datetime import date
+from typing import List, Optional, Set
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import config, ledger
+
+TABLE = "transactions"
+DEFAULT_PARTITION = "transactions_default"
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"
+    ), {"table": TABLE}).scalar())
+
+
+def existing_partitions(db: Session) -> Set[str]:
+    rows = db.execute(text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass(:table)"
+    ), {"table": TABLE})
+    return {row[0] for row in rows}
+
+
+def create_partition(db: Session, month: date, has_default: bool = True):
+    """
+    A hónap partíciója, commit nélkül. Ha a default partícióban már vannak erre
+    a hónapra eső sorok, azt le kell választani, a sorokat áttenni, majd visszacsatolni.
+    """
+    start, end = month, month + relativedelta(months=1)
+    create = (f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} "
+              f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+    # A szülő táblát rövid ideig kizárólagosan zárolja: inkább várjon a következő futásra, mint hogy feltartsa a forgalmat
+    db.execute(text("SET LOCAL lock_timeout = '5s'"))
+    bounds = {"start": start, "end": end}
+    stray = has_default and db.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end)"
+    ), bounds).scalar()
+    if not stray:
+        db.execute(text(create))
+        return
+    db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    db.execute(text(create))
+    db.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {TABLE} SELECT * FROM moved"
+    ), bounds)
+    db.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_partitions(db: Session, today: Optional[date] = None, months_ahead: Optional[int] = None) -> List[date]:
+    """ Az ütemezett feladat: a hiányzó partíciók az aktuális hónaptól `months_ahead` hónapig, egyenként commitolva. """
+    if not is_partitioned(db):
+        return []
+    if months_ahead is None:
+        months_ahead = config.TRANSACTION_PARTITION_MONTHS_AHEAD
+    existing = existing_partitions(db)
+    first = ledger.month_start(today or date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = first + relativedelta(months=offset)
+        if partition_name(month) in existing:
+            continue
+        create_partition(db, month, has_default=DEFAULT_PARTITION in existing)
+        db.commit()
+        created.append(month)
+    return created
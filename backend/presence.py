@@ -0,0 +1,197 @@
+# Jelenlét (online státusz) memóriában: a gyakori, rövid életű státusz- és
+# heartbeat frissítések nem írnak azonnal az adatbázisba. Az utolsó aktivitás
+# után PRESENCE_TTL_SECONDS-szel a tag automatikusan 'offline' lesz. A
+# státusztörténet és a users.status / last_active kötegelve, a háttérben íródik.
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import config, events, models
+from .database import SessionLocal
+
+OFFLINE = "offline"
+DEFAULT_STATUS = "Online"
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """ A tár naiv UTC időpontokkal dolgozik; a zónás értéket (pl. JS toISOString "Z") átváltja. """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def effective_status(status: Optional[str], last_active: Optional[datetime], now: datetime,
+                     until: Optional[datetime] = None) -> str:
+    """ A tárolt státusz és az utolsó aktivitás alapján a ténylegesen mutatott státusz. """
+    if last_active is None or now - last_active > timedelta(seconds=config.PRESENCE_TTL_SECONDS):
+        return OFFLINE
+    if until is not None and now > naive_utc(until):
+        # A lejárt ideiglenes státusz (pl. "Megbeszélésen 15:00-ig") visszaáll
+        return DEFAULT_STATUS
+    return status or DEFAULT_STATUS
+
+
+@dataclass
+class PresenceEntry:
+    user_id: int
+    family_id: int
+    status: str
+    last_active: datetime
+    note: Optional[str] = None
+    until: Optional[datetime] = None
+
+    def effective_status(self, now: datetime) -> str:
+        return effective_status(self.status, self.last_active, now, self.until)
+
+    def as_dict(self, now: datetime) -> dict:
+        return {
+            "user_id": self.user_id,
+            "status": self.effective_status(now),
+            "last_active": self.last_active,
+            "note": self.note,
+            "until": self.until,
+        }
+
+
+class PresenceStore:
+    """ Szálbiztos jelenlét tár; a szinkron végpontok threadpoolból is hívhatják. """
+
+    def __init__(self):
+        self._entries: Dict[int, PresenceEntry] = {}
+        self._families: Dict[int, set] = {}
+        # Utoljára kiküldött/eltárolt státusz tagonként: csak a változás kerül a történetbe
+        self._announced: Dict[int, str] = {}
+        self._pending_history: List[dict] = []
+        self._dirty_users: set = set()
+        self._lock = threading.Lock()
+
+    def _entry(self, user: models.User, now: datetime) -> PresenceEntry:
+        entry = self._entries.get(user.id)
+        if entry is None:
+            entry = PresenceEntry(user_id=user.id, family_id=user.family_id,
+                                  status=user.status if user.status and user.status != OFFLINE else DEFAULT_STATUS,
+                                  last_active=now)
+            self._entries[user.id] = entry
+            self._families.setdefault(user.family_id, set()).add(user.id)
+            self._announced[user.id] = OFFLINE
+        return entry
+
+    def _announce(self, entry: PresenceEntry, now: datetime, force_history: bool = False):
+        """
+        A lock alatt hívva: státuszváltásnál történet sort tesz a sorba, és
+        visszaadja a kiküldendő eseményt (family_id, data), különben None-t.
+        """
+        self._dirty_users.add(entry.user_id)
+        status = entry.effective_status(now)
+        if self._announced.get(entry.user_id) == status and not force_history:
+            return None
+        self._pending_history.append({
+            "user_id": entry.user_id, "status": status, "changed_at": now,
+            "changed_until": entry.until, "note": entry.note,
+        })
+        self._announced[entry.user_id] = status
+        return entry.family_id, {"user_id": entry.user_id, "status": status, "last_active": entry.last_active}
+
+    def set_status(self, user: models.User, status: str, note: Optional[str] = None,
+                   until: Optional[datetime] = None) -> dict:
+        """ Kifejezett státuszváltás: mindig bekerül a történetbe. """
+        now = datetime.utcnow()
+        until = naive_utc(until)
+        with self._lock:
+            entry = self._entry(user, now)
+            entry.status, entry.note, entry.until, entry.last_active = status, note, until, now
+            family_id, data = self._announce(entry, now, force_history=True)
+            snapshot = entry.as_dict(now)
+        events.publish_now(family_id, "member.status", data)
+        return snapshot
+
+    def touch(self, user: models.User) -> dict:
+        """ Heartbeat: csak az utolsó aktivitást frissíti; offline-ból visszatérve jelez. """
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entry(user, now)
+            entry.last_active = now
+            outgoing = self._announce(entry, now)
+            snapshot = entry.as_dict(now)
+        if outgoing:
+            events.publish_now(outgoing[0], "member.status", outgoing[1])
+        return snapshot
+
+    def family_snapshot(self, family_id: int) -> Dict[int, dict]:
+        now = datetime.utcnow()
+        with self._lock:
+            return {user_id: self._entries[user_id].as_dict(now) for user_id in self._families.get(family_id, ())}
+
+    def expire(self):
+        """ A TTL-en túl inaktív tagok offline-ra váltása (eseménnyel és történet sorral). """
+        now = datetime.utcnow()
+        outgoing = []
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.effective_status(now) != self._announced.get(entry.user_id):
+                    message = self._announce(entry, now)
+                    if message:
+                        outgoing.append(message)
+        for family_id, data in outgoing:
+            events.publish_now(family_id, "member.status", data)
+
+    def drain(self):
+        """ Kiveszi a kiírandó történet sorokat és a users tábla frissítéseit. """
+        with self._lock:
+            history, self._pending_history = self._pending_history, []
+            # A users táblába a bejelentett státusz kerül; az offline állapot a last_active-ból számolható
+            users = [
+                {"id": user_id, "status": self._entries[user_id].status, "last_active": self._entries[user_id].last_active}
+                for user_id in self._dirty_users
+            ]
+            self._dirty_users = set()
+        return history, users
+
+    def requeue(self, history: List[dict], users: List[dict]):
+        # Sikertelen kiírás után a következő körben újra próbáljuk
+        with self._lock:
+            self._pending_history[:0] = history
+            self._dirty_users.update(user["id"] for user in users)
+
+
+store = PresenceStore()
+
+
+def flush() -> int:
+    """ Egy köteg kiírása: a történet egy INSERT, a users frissítés egy executemany. """
+    store.expire()
+    history, users = store.drain()
+    if not history and not users:
+        return 0
+    db = SessionLocal()
+    try:
+        if history:
+            db.bulk_insert_mappings(models.UserStatusHistory, history)
+        if users:
+            db.bulk_update_mappings(models.User, users)
+        db.commit()
+    except Exception:
+        db.rollback()
+        store.requeue(history, users)
+        raise
+    finally:
+        db.close()
+    return len(history)
+
+
+async def run_flusher():
+    """ Háttérciklus a lifespan alatt; leálláskor még egy utolsó kiírás. """
+    try:
+        while True:
+            await asyncio.sleep(config.PRESENCE_FLUSH_SECONDS)
+            try:
+                await run_in_threadpool(flush)
+            except Exception as exc:
+                print(f"Jelenlét kiírása sikertelen, következő körben újra: {exc}")
+    except asyncio.CancelledError:
+        await run_in_threadpool(flush)
+        raise
@@ -0,0 +1,219 @@
+# SQL lekérdezés-számláló és lassú kérés profilozó: kérésenként számolja az
+# utasításokat és a DB időt, naplózza a lassú kéréseket, debug módban fejlécekbe írja.
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from . import config
+
+logger = logging.getLogger("familyhub.db")
+
+_MAX_STATEMENT_LOG_LENGTH = 300
+
+
+class RequestQueryStats:
+    """Egyetlen kérés (vagy egy `track_queries` blokk) lekérdezés-statisztikája."""
+
+    __slots__ = ("query_count", "db_time", "statements")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        # utasítás szövege -> [darabszám, összes idő másodpercben]
+        self.statements = {}
+
+    def record(self, statement: str, elapsed: float):
+        self.query_count += 1
+        self.db_time += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def top_statements(self, limit: int):
+        """A legtöbb időt elvitt utasítások: (utasítás, darabszám, összes idő)."""
+        ranked = sorted(
+            ((statement, count, total) for statement, (count, total) in self.statements.items()),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+        return ranked[:limit]
+
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("familyhub_query_stats", default=None)
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries():
+    """HTTP kérésen kívüli kódhoz (scriptek, időzített feladatok, benchmark)."""
+    stats = RequestQueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def install_query_profiler(engine):
+    """ Rákapcsolja az időmérő eseménykezelőket az engine-re (egyszer). """
+    if engine.info.get("familyhub_query_profiler"):
+        return
+    engine.info["familyhub_query_profiler"] = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._familyhub_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current_stats.get()
+        started = getattr(context, "_familyhub_query_start", None)
+        if stats is None or started is None:
+            return
+        stats.record(statement, time.perf_counter() - started)
+
+
+class RouteQueryAggregates:
+    """Végpontonkénti összesítés a mintavételezett kérésekről."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, route: str, stats: RequestQueryStats, elapsed: float):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    "requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "db_time_ms": 0.0,
+                    "total_time_ms": 0.0,
+                    "max_time_ms": 0.0,
+                }
+            entry["requests"] += 1
+            entry["queries"] += stats.query_count
+            entry["max_queries"] = max(entry["max_queries"], stats.query_count)
+            entry["db_time_ms"] += stats.db_time * 1000
+            entry["total_time_ms"] += elapsed * 1000
+            entry["max_time_ms"] = max(entry["max_time_ms"], elapsed * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            result = []
+            for route, entry in self._routes.items():
+                requests = entry["requests"]
+                result.append({
+                    "route": route,
+                    "requests": requests,
+                    "avg_queries": round(entry["queries"] / requests, 2),
+                    "max_queries": entry["max_queries"],
+                    "avg_db_time_ms": round(entry["db_time_ms"] / requests, 2),
+                    "avg_time_ms": round(entry["total_time_ms"] / requests, 2),
+                    "max_time_ms": round(entry["max_time_ms"], 2),
+                })
+        return sorted(result, key=lambda item: item["avg_queries"] * item["requests"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def dump(self):
+        """ Kiírja a naplóba az eddig gyűjtött összesítést. """
+        for row in self.snapshot():
+            logger.info(
+                "%s: %d kérés, átlag %.1f lekérdezés (max %d), átlag %.1f ms DB / %.1f ms összesen",
+                row["route"], row["requests"], row["avg_queries"], row["max_queries"],
+                row["avg_db_time_ms"], row["avg_time_ms"],
+            )
+
+
+route_aggregates = RouteQueryAggregates()
+
+
+def _route_label(scope) -> str:
+    # A FastAPI a routing után beírja a scope-ba az illeszkedő route-ot,
+    # így a path paraméterek nélküli sablont ({account_id}) tudjuk összesíteni.
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}"
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > _MAX_STATEMENT_LOG_LENGTH:
+        return statement[:_MAX_STATEMENT_LOG_LENGTH] + "..."
+    return statement
+
+
+class QueryProfilerMiddleware:
+    """
+    Tiszta ASGI middleware, ami minden HTTP kéréshez saját statisztikát nyit.
+    A szinkron végpontok threadpoolban futnak, de a contextvar a szálba is
+    átmásolódik, így ugyanazt a statisztika objektumot töltik.
+    """
+
+    def __init__(self, app, expose_headers: bool = None, slow_request_ms: float = None, sample_rate: float = None):
+        self.app = app
+        self.expose_headers = config.DEBUG if expose_headers is None else expose_headers
+        self.slow_request_ms = config.SLOW_REQUEST_MS if slow_request_ms is None else slow_request_ms
+        self.sample_rate = config.QUERY_PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+
+        event_stream = False
+
+        async def send_with_headers(message):
+            nonlocal event_stream
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                # Az SSE kapcsolat percekig nyitva van: nem lassú kérés, nem mérjük
+                event_stream = headers.get("content-type", "").startswith("text/event-stream")
+                if self.expose_headers:
+                    headers.append("X-DB-Queries", str(stats.query_count))
+                    headers.append("X-DB-Time", f"{stats.db_time * 1000:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_stats.reset(token)
+            if not event_stream:
+                self._report(scope, stats, time.perf_counter() - started)
+
+    def _report(self, scope, stats: RequestQueryStats, elapsed: float):
+        route = None
+        if elapsed * 1000 >= self.slow_request_ms:
+            route = _route_label(scope)
+            lines = [
+                f"Lassú kérés: {route} {elapsed * 1000:.1f} ms, "
+                f"{stats.query_count} lekérdezés ({stats.db_time * 1000:.1f} ms DB)"
+            ]
+            for statement, count, total in stats.top_statements(config.SLOW_REQUEST_TOP_STATEMENTS):
+                lines.append(f"  {count:4d}x {total * 1000:8.1f} ms  {_shorten(statement)}")
+            logger.warning("\n".join(lines))
+
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            route_aggregates.add(route or _route_label(scope), stats, elapsed)
@@ -0,0 +1,141 @@
+# Ismétlődési szabályok (RFC 5545 RRULE + EXDATE) kibontása. Az előfordulásokat
+# sosem listázzuk ki teljesen: csak a kért időablakba esőket állítjuk elő, a
+# napi/heti szabályoknál a kezdőpontot egész periódusokkal az ablak elé léptetve.
+# A tárolt időpontok helyi naiv időben vannak; a kibontás viszont az esemény
+# saját időzónájában (TZID) fut, hogy a nyári/téli időszámítás váltásakor is
+# ugyanarra a faliórás időpontra essenek az előfordulások.
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Iterator, Optional, Tuple
+
+from dateutil.rrule import rrulestr
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+EXDATE_FORMAT = "%Y%m%dT%H%M%S"
+# A FamilyEvent.recurrence_pattern értékei szabályként
+PATTERN_RRULE = {"daily": "FREQ=DAILY", "weekly": "FREQ=WEEKLY", "monthly": "FREQ=MONTHLY"}
+
+
+@lru_cache(maxsize=256)
+def zone(tzid: Optional[str]):
+    """ ZoneInfo a TZID-hez; ismeretlen vagy hiányzó zónánál None (lebegő idő). """
+    if not tzid or ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def to_zone(value: datetime, tz) -> datetime:
+    # Helyi naiv -> az esemény zónája (tz=None: marad naiv)
+    return value.astimezone(tz) if tz is not None else value
+
+
+def from_zone(value: datetime) -> datetime:
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+@lru_cache(maxsize=4096)
+def _rule(rrule: str, dtstart: datetime):
+    return rrulestr(rrule, dtstart=dtstart, cache=False)
+
+
+@lru_cache(maxsize=4096)
+def _fields(rrule: str) -> dict:
+    return dict(part.split("=", 1) for part in rrule.upper().split(";") if "=" in part)
+
+
+def format_exdates(dates: Iterable[datetime]) -> Optional[str]:
+    """ A kivett előfordulások tárolt alakja: rendezett, vesszővel elválasztott helyi időpontok. """
+    values = sorted({value.strftime(EXDATE_FORMAT) for value in dates})
+    return ",".join(values) or None
+
+
+@lru_cache(maxsize=4096)
+def parse_exdates(value: Optional[str]) -> FrozenSet[datetime]:
+    if not value:
+        return frozenset()
+    return frozenset(datetime.strptime(item, EXDATE_FORMAT) for item in value.split(","))
+
+
+def _fast_forward(start: datetime, rrule: str, not_before: datetime) -> datetime:
+    """
+    COUNT és BYSETPOS nélküli napi/heti szabálynál a kezdőpont egész
+    periódusokkal előreléptethető: a sorozat ugyanaz marad, de nem kell
+    végigiterálni az évekkel korábbi előfordulásokon.
+    """
+    fields = _fields(rrule)
+    if "COUNT" in fields or "BYSETPOS" in fields:
+        return start
+    interval = int(fields.get("INTERVAL", 1))
+    step = {"DAILY": timedelta(days=interval), "WEEKLY": timedelta(weeks=interval)}.get(fields.get("FREQ"))
+    if step is None:
+        return start
+    # Egy periódus ráhagyás: a léptetett hét/nap eleje még az ablak előtt van
+    target = not_before - step
+    if target <= start:
+        return start
+    return start + ((target - start) // step) * step
+
+
+def occurrences(start: datetime, end: datetime, rrule: Optional[str], exdates: Optional[str],
+                window_start: datetime, window_end: datetime, tzid: Optional[str] = None,
+                skip: FrozenSet[datetime] = frozenset()) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Az ablakkal átfedő előfordulások (kezdet, vég) párjai időrendben, helyi
+    naiv időben. Az ablak előtt kezdődő, de abba átnyúló előfordulás is benne
+    van. A `skip` a külön eseményként tárolt (RECURRENCE-ID) módosított
+    előfordulások eredeti kezdete.
+    """
+    if not rrule:
+        if start < window_end and (end > window_start or start >= window_start):
+            yield start, end
+        return
+    tz = zone(tzid)
+    duration = to_zone(end, tz) - to_zone(start, tz)
+    excluded = parse_exdates(exdates)
+    not_before = to_zone(window_start, tz) - duration
+    dtstart = to_zone(start, tz)
+    rule = _rule(rrule, _fast_forward(dtstart, rrule, not_before))
+    for occurrence in rule.xafter(not_before, inc=True):
+        occurrence_start = from_zone(occurrence)
+        if occurrence_start >= window_end:
+            break
+        if occurrence_start in excluded or occurrence_start in skip:
+            continue
+        occurrence_end = from_zone(occurrence + duration)
+        if occurrence_end > window_start or occurrence_start >= window_start:
+            yield occurrence_start, occurrence_end
+
+
+def rule_end(start: datetime, end: datetime, rrule: str, tzid: Optional[str] = None) -> Optional[datetime]:
+    """
+    Az utolsó előfordulás vége helyi időben (COUNT vagy UNTIL esetén), különben
+    None (végtelen sorozat). Érvénytelen szabálynál ValueError.
+    """
+    tz = zone(tzid)
+    dtstart = to_zone(start, tz)
+    rule = _rule(rrule, dtstart)
+    fields = _fields(rrule)
+    if "COUNT" not in fields and "UNTIL" not in fields:
+        return None
+    last = None
+    for last in rule:
+        pass
+    return from_zone((last or dtstart) + (to_zone(end, tz) - dtstart))
+
+
+def shift_span(day: date, start_time: str, end_time: str) -> Tuple[datetime, datetime]:
+    """ Egy "07:00"-"15:00" alakú műszak kezdete és vége az adott napon; éjszakásnál a vége másnap. """
+    def clock(value: str) -> datetime:
+        hours, _, minutes = value.partition(":")
+        return datetime(day.year, day.month, day.day, int(hours), int(minutes or 0))
+
+    start, end = clock(start_time), clock(end_time)
+    return start, end if end > start else end + timedelta(days=1)
@@ -1,7 +1,9 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.orm import Session
 from datetime import date, timedelta,datetime
-from . import crud, models
+from . import crud, models, ledger, idempotency, notifications, calendar_sync, config, upcoming, archive, partitions, goal_progress, account_deletion
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
 from .database import SessionLocal
 from dateutil.relativedelta import relativedelta
 from .schemas import TransferCreate,TransactionCreate
@@ -13,14 +15,9 @@ def get_next_run_date(rule: models.RecurringRule) -> date:
     # A számítást mindig a legutóbbi esedékességtől vagy a kezdődátumtól végezzük
     current_next_run = rule.next_run_date if rule.next_run_date > rule.start_date else rule.start_date
 
-    if rule.frequency == 'napi':
-        return current_next_run + relativedelta(days=1)
-    elif rule.frequency == 'heti':
-        return current_next_run + relativedelta(weeks=1)
-    elif rule.frequency == 'havi':
-        return current_next_run + relativedelta(months=1)
-    elif rule.frequency == 'éves':
-        return current_next_run + relativedelta(years=1)
+    step = upcoming.RULE_STEPS.get(rule.frequency)
+    if step is not None:
+        return current_next_run + step
 
     return today + relativedelta(days=1) # Fallback
 
@@ -40,39 +37,155 @@ async def process_recurring_transactions():
             db.close()
             return
 
+        # Szabályonként külön tranzakció: egy hibás szabály nem állítja meg a többit
+        succeeded = 0
         for rule in rules_to_run:
             print(f"Tranzakció végrehajtása a(z) {rule.id} szabály alapján.")
-            owner = crud.get_user(db, rule.owner_id)
-            
-            # === KIBŐVÍTETT LOGIKA ===
-            if rule.type == 'átutalás':
-                transfer_data = TransferCreate(
-                    from_account_id=rule.from_account_id,
-                    to_account_id=rule.to_account_id,
-                    amount=rule.amount,
-                    description=rule.description
-                )
-                crud.create_transfer(db=db, transfer_data=transfer_data, user=owner)
-            else: # Bevétel vagy Kiadás
-                transaction_data = TransactionCreate(
-                    description=rule.description,
-                    amount=rule.amount,
-                    type=rule.type,
-                    category_id=rule.category_id
-                )
-                crud.create_account_transaction(db=db, transaction=transaction_data, account_id=rule.to_account_id, user=owner)
-
-            rule.next_run_date = get_next_run_date(rule)
-            db.add(rule)
-        
-        db.commit()
-        print(f"{len(rules_to_run)} ismétlődő tranzakció sikeresen végrehajtva.")
+            try:
+                owner = crud.get_user(db, rule.owner_id)
 
+                # === KIBŐVÍTETT LOGIKA ===
+                if rule.type == 'átutalás':
+                    transfer_data = TransferCreate(
+                        from_account_id=rule.from_account_id,
+                        to_account_id=rule.to_account_id,
+                        amount=rule.amount,
+                        description=rule.description
+                    )
+                    crud.create_transfer(db=db, transfer_data=transfer_data, user=owner)
+                else: # Bevétel vagy Kiadás
+                    transaction_data = TransactionCreate(
+                        description=rule.description,
+                        amount=rule.amount,
+                        type=rule.type,
+                        category_id=rule.category_id
+                    )
+                    crud.create_account_transaction(db=db, transaction=transaction_data, account_id=rule.to_account_id, user=owner)
+
+                rule.next_run_date = get_next_run_date(rule)
+                db.add(rule)
+                db.commit()
+                succeeded += 1
+            except Exception as e:
+                db.rollback()
+                error = e.detail if isinstance(e, HTTPException) else type(e).__name__
+                print(f"A(z) {rule.id} szabály végrehajtása sikertelen: {error}")
+                notifications.recurring_rule_failed(db, rule, str(error))
+                db.commit()
+
+        print(f"{succeeded}/{len(rules_to_run)} ismétlődő tranzakció sikeresen végrehajtva.")
+
+    finally:
+        db.close()
+async def write_balance_snapshots():
+    """ Hónapfordulón megírja (és pótolja) a kasszák egyenleg-pillanatképeit. """
+    db: Session = SessionLocal()
+    try:
+        written = ledger.ensure_month_snapshots(db)
+        if written:
+            print(f"[{datetime.now()}] Egyenleg-pillanatképek megírva: {', '.join(m.isoformat() for m in written)}")
+    finally:
+        db.close()
+
+async def reconcile_account_balances():
+    """ Összeveti a tárolt egyenlegeket a főkönyvvel, és jelzi az eltéréseket. """
+    db: Session = SessionLocal()
+    try:
+        drifts = ledger.reconcile_balances(db)
+        if not drifts:
+            print(f"[{datetime.now()}] Egyenleg-egyeztetés: nincs eltérés.")
+            return
+        print(f"[{datetime.now()}] Egyenleg-egyeztetés: {len(drifts)} kassza egyenlege eltér a főkönyvtől!")
+        for drift in drifts:
+            print(f"  #{drift['account_id']} {drift['name']} (család {drift['family_id']}): "
+                  f"tárolt {drift['balance']}, főkönyv {drift['ledger_balance']}, eltérés {drift['drift']}")
+    finally:
+        db.close()
+
+async def purge_idempotency_keys():
+    """ Törli a lejárt Idempotency-Key bejegyzéseket. """
+    db: Session = SessionLocal()
+    try:
+        deleted = idempotency.purge_expired_keys(db)
+        if deleted:
+            print(f"[{datetime.now()}] {deleted} lejárt idempotencia kulcs törölve.")
+    finally:
+        db.close()
+
+async def archive_transactions():
+    """ A horizontnál régebbi hónapok tranzakcióinak áthelyezése az archív táblába. """
+    db: Session = SessionLocal()
+    try:
+        archived = archive.archive_old_transactions(db)
+        for month, count in archived:
+            print(f"[{datetime.now()}] Tranzakció archiválás: {month:%Y-%m} ({count} tranzakció).")
+    except Exception as e:
+        db.rollback()
+        print(f"[{datetime.now()}] Hiba a tranzakciók archiválásakor: {e}")
+    finally:
+        db.close()
+
+async def maintain_transaction_partitions():
+    """ A tranzakció tábla következő hónapjainak partíciói előre (particionált adatbázison). """
+    db: Session = SessionLocal()
+    try:
+        created = partitions.ensure_partitions(db)
+        if created:
+            print(f"[{datetime.now()}] Új tranzakció partíciók: {', '.join(f'{m:%Y-%m}' for m in created)}")
+    except Exception as e:
+        db.rollback()
+        print(f"[{datetime.now()}] Hiba a tranzakció partíciók létrehozásakor: {e}")
+    finally:
+        db.close()
+
+async def refresh_goal_progress():
+    """ A célkasszák átlagának és becsült teljesülésének napi frissítése (az eltelt idő miatt is változnak). """
+    db: Session = SessionLocal()
+    try:
+        updated = goal_progress.refresh_all(db)
+        if updated:
+            print(f"[{datetime.now()}] Célkassza becslések frissítve: {updated} kassza.")
+    except Exception as e:
+        db.rollback()
+        print(f"[{datetime.now()}] Hiba a célkassza becslések frissítésekor: {e}")
+    finally:
+        db.close()
+
+async def resume_account_purges():
+    """ A megakadt (pl. szerver újraindítás miatt félbemaradt) háttérbeli kassza törlések folytatása. """
+    db: Session = SessionLocal()
+    try:
+        account_ids = account_deletion.stalled_purges(db)
     finally:
         db.close()
+    for account_id in account_ids:
+        # A törlés adagonként commitol és hosszan futhat: ne az eseményhurkot foglalja
+        if await run_in_threadpool(account_deletion.purge_in_background, account_id):
+            print(f"[{datetime.now()}] A(z) {account_id} kassza félbemaradt törlése befejezve.")
+
+async def sync_calendars():
+    """ A bekapcsolt naptár integrációk feedjeinek importja (változatlan feed: csak egy 304). """
+    results = await calendar_sync.sync_all()
+    changed = [r for r in results if r.status == "synced"]
+    failed = [r for r in results if r.status == "error"]
+    if changed or failed:
+        print(f"[{datetime.now()}] Naptár szinkron: {len(changed)} frissült, {len(failed)} hibás, "
+              f"{len(results) - len(changed) - len(failed)} változatlan.")
+    for result in failed:
+        print(f"  {result.integration_id}. integráció: {result.error}")
+
 # Létrehozzuk és elindítjuk az időzítőt
 scheduler = AsyncIOScheduler()
 # Beállítjuk, hogy a 'process_recurring_transactions' fusson le minden nap hajnali 3-kor
 # Teszteléshez átállíthatod, pl. `trigger='interval', seconds=30`
 scheduler.add_job(process_recurring_transactions, trigger='interval', hours=3)
-#scheduler.add_job(process_recurring_transactions, trigger='cron', hour=3, minute=0)
\ No newline at end of file
+#scheduler.add_job(process_recurring_transactions, trigger='cron', hour=3, minute=0)
+# Hónap elején a pillanatképek, éjjel az egyeztetés
+scheduler.add_job(write_balance_snapshots, trigger='cron', day=1, hour=0, minute=15)
+scheduler.add_job(reconcile_account_balances, trigger='cron', hour=2, minute=30)
+scheduler.add_job(purge_idempotency_keys, trigger='interval', hours=1)
+scheduler.add_job(maintain_transaction_partitions, trigger='cron', hour=0, minute=5)
+scheduler.add_job(archive_transactions, trigger='cron', day=1, hour=1, minute=0)
+scheduler.add_job(refresh_goal_progress, trigger='cron', hour=0, minute=20)
+scheduler.add_job(resume_account_purges, trigger='interval', minutes=config.ACCOUNT_PURGE_RESUME_MINUTES)
+scheduler.add_job(sync_calendars, trigger='interval', minutes=config.CALENDAR_SYNC_INTERVAL_MINUTES)
@@ -43,6 +43,9 @@ class CategorySimple(BaseModel):
 class WishImage(WishImageBase):
     id: int
     wish_id: int
+    thumbnail_url: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -418,6 +421,9 @@ class TransferCreate(BaseModel):
     amount: Decimal
     description: str
 
+class TransferBatchCreate(BaseModel):
+    transfers: List[TransferCreate] = Field(..., min_length=1, max_length=100)
+
 # --- Account sémák ---
 class AccountBase(BaseModel):
     name: str
@@ -455,6 +461,39 @@ class Account(AccountBase):
     class Config:
         from_attributes = True
 
+# A kassza lista és részletek alapértelmezett, beágyazott listák nélküli alakja
+class AccountSummary(AccountBase):
+    id: int
+    balance: Decimal
+    family_id: int
+    owner_user_id: int | None = None
+    viewers: list[UserProfile] = []
+    owner_user: Optional[UserProfile] = None
+    status: Literal['active', 'archived']
+
+    class Config:
+        from_attributes = True
+
+# ?expand=wishes,history - csak a kért listák kerülnek a válaszba
+class AccountDetail(AccountSummary):
+    wishes: Optional[List[Wish]] = None
+    history_entries: Optional[List[AccountHistory]] = None
+
+# --- Főkönyv ---
+class AccountBalanceAt(BaseModel):
+    account_id: int
+    date: date
+    balance: Decimal
+    snapshot_as_of: Optional[date] = None  # melyik havi pillanatképből indult a számítás
+
+class AccountBalanceDrift(BaseModel):
+    account_id: int
+    name: str
+    family_id: int
+    balance: Decimal
+    ledger_balance: Decimal
+    drift: Decimal
+
 # Account response transactions nélkül - a legtöbb esetben ezt használd
 class AccountResponse(AccountBase):
     id: int
@@ -503,6 +542,9 @@ class WishImageBase(BaseModel):
 class WishImage(WishImageBase):
     id: int
     wish_id: int
+    thumbnail_url: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -591,14 +633,33 @@ class Wish(WishBase):
     approvals: List[WishApproval] = []
     goal_account: Optional[AccountSimple] = None
     history: List[WishHistory] = []
+    # Listákban csak a borítókép jön, ez mutatja a galéria teljes méretét
+    image_count: Optional[int] = None
+    approvals_required: int = 0
+    approvals_received: int = 0
 
     class Config:
         from_attributes = True
 
 class Notification(BaseModel):
+    id: Optional[int] = None
     type: str
     message: str
-    link: str
+    link: Optional[str] = None
+    created_at: Optional[datetime] = None
+    read_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class NotificationFeed(BaseModel):
+    items: List[Notification]
+    next_cursor: Optional[int] = None
+    unread_count: int
+
+class NotificationReadRequest(BaseModel):
+    ids: Optional[List[int]] = Field(None, description="Olvasottnak jelölendő értesítések.")
+    up_to: Optional[int] = Field(None, description="Minden olvasatlan ezzel az id-val bezárólag.")
 
 class WishActivationRequest(BaseModel):
     goal_account_id: Optional[int] = Field(None, description="ID of an existing goal account to link to.")
@@ -629,9 +690,25 @@ class Forecast(BaseModel):
     family: Optional[ForecastData] = None
     view_type: str
 
+class GoalProgress(BaseModel):
+    contributed: Decimal
+    withdrawn: Decimal
+    contribution_count: int
+    first_contribution_at: Optional[datetime] = None
+    last_contribution_at: Optional[datetime] = None
+    average_monthly: Optional[Decimal] = None
+    projected_completion_date: Optional[date] = None
+    on_track: Optional[bool] = None
+
+    class Config:
+        from_attributes = True
+
+class GoalAccount(Account):
+    goal_progress: Optional[GoalProgress] = None
+
 class Goals(BaseModel):
-    personal_goals: List[Account]
-    family_goals: List[Account]
+    personal_goals: List[GoalAccount]
+    family_goals: List[GoalAccount]
 
 class DashboardResponse(BaseModel):
     financial_summary: FinancialSummary
@@ -838,6 +915,7 @@ class CalendarIntegrationBase(BaseModel):
     name: str
     type: str  # 'google', 'outlook', 'school', 'icloud'
     sync_enabled: bool = True
+    url: Optional[str] = None  # iCalendar feed címe (http(s):// vagy webcal://)
 
 class CalendarIntegrationCreate(CalendarIntegrationBase):
     pass
@@ -846,18 +924,35 @@ class CalendarIntegrationUpdate(BaseModel):
     name: Optional[str] = None
     sync_enabled: Optional[bool] = None
     status: Optional[str] = None
+    url: Optional[str] = None
 
 class CalendarIntegration(CalendarIntegrationBase):
     id: int
     user_id: int
     status: str
     last_sync: Optional[datetime] = None
+    sync_error: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
 
+class CalendarFeedTokenCreate(BaseModel):
+    scope: Literal['user', 'family'] = Field('user', description="Saját vagy az egész család naptára.")
+
+class CalendarFeedToken(BaseModel):
+    id: int
+    scope: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class CalendarFeedTokenCreated(CalendarFeedToken):
+    token: str
+    url: str = Field(..., description="A naptár alkalmazásba feliratkozáshoz; csak most jelenik meg.")
+
 class TimeConflictBase(BaseModel):
     title: str
     description: str
@@ -933,6 +1028,32 @@ class UserStatusUpdate(BaseModel):
     note: Optional[str] = None
     until: Optional[datetime] = None
 
+class TimelineItem(BaseModel):
+    start: datetime
+    end: datetime
+    source: str  # 'family_event', 'user_event', 'work_shift', 'shift_assignment', 'calendar'
+    source_id: int
+    title: str
+    user_id: Optional[int] = None
+    member_ids: List[int] = []
+    kind: Optional[str] = None
+    color: Optional[str] = None
+    location: Optional[str] = None
+    all_day: bool = False
+
+class TimelineConflict(BaseModel):
+    user_id: int
+    start: datetime
+    end: datetime
+    first: TimelineItem
+    second: TimelineItem
+
+class Timeline(BaseModel):
+    start: datetime
+    end: datetime
+    items: List[TimelineItem]
+    conflicts: List[TimelineConflict]
+
 class DashboardTimeData(BaseModel):
     family_members: List[dict]
     upcoming_events: List[dict]
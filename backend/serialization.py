@@ -0,0 +1,44 @@
+# Gyors JSON válasz a nagy listákhoz: orjson-nal szerializál (ha telepítve van),
+# és a Decimal/UUID/dátum értékeket ugyanúgy írja ki, mint a Pydantic JSON módja.
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # opcionális függőség, nélküle a szabványos json modul fut
+    orjson = None
+
+
+def _default(value):
+    # A Pydantic a Decimal-t szövegként adja ki, a frontend is ehhez igazodik
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        # UTC időpontoknál a Pydantic is "Z" utótagot ír
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    raise TypeError(f"Nem szerializálható típus: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Előre összerakott dict/list tartalmat küld ki validáció nélkül.
+    Alapértelmezett válaszosztályként a response_model-es végpontokat is gyorsítja.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
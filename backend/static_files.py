@@ -0,0 +1,108 @@
+# Feltöltött fájlok kiszolgálása erős ETag-gel, feltételes GET-tel (304),
+# Range kérésekkel (206) és "immutable" cache-eléssel. A feltöltött fájlnevek
+# UUID-t tartalmaznak, így egy URL tartalma soha nem változik.
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def strong_etag(stat_result: os.stat_result) -> str:
+    raw = f"{stat_result.st_ino}-{stat_result.st_size}-{stat_result.st_mtime_ns}"
+    return '"' + hashlib.md5(raw.encode("ascii")).hexdigest() + '"'
+
+
+def etag_matches(header_value: Optional[str], etag: str) -> bool:
+    if not header_value:
+        return False
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    # If-None-Match gyenge összehasonlítás: a W/ előtag nem számít
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _parse_range(header_value: str, size: int):
+    """
+    Egyetlen "bytes=start-end" tartomány -> (start, end) zárt intervallum.
+    None, ha a fejléc nem értelmezhető (ilyenkor a teljes fájl megy);
+    ValueError, ha a tartomány nem kielégíthető (416).
+    """
+    unit, _, spec = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    if not (start_text.isdigit() or start_text == "") or not (end_text.isdigit() or end_text == ""):
+        return None
+    if start_text == "":
+        # Utótag tartomány: az utolsó N bájt
+        if not end_text or int(end_text) == 0 or size == 0:
+            raise ValueError("nem kielégíthető tartomány")
+        return max(size - int(end_text), 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("nem kielégíthető tartomány")
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path: Path, start: int, end: int):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = handle.read(min(_RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(path: Path, request_headers: Headers, method: str = "GET",
+               stat_result: Optional[os.stat_result] = None,
+               cache_control: str = IMMUTABLE_CACHE_CONTROL) -> Response:
+    """ Fájl válasz ETag / 304 / Range / Cache-Control kezeléssel. """
+    stat_result = stat_result or os.stat(path)
+    etag = strong_etag(stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        size = stat_result.st_size
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            media_type = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+            headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+            if method == "HEAD":
+                return Response(status_code=206, headers=headers, media_type=media_type)
+            return StreamingResponse(_iter_file_range(path, start, end), status_code=206,
+                                     headers=headers, media_type=media_type)
+
+    return FileResponse(path, stat_result=stat_result, headers=headers, method=method)
+
+
+class CachedStaticFiles(StaticFiles):
+    """ StaticFiles, ami minden fájlt a serve_file-on keresztül, immutable cache-eléssel ad ki. """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        return serve_file(Path(full_path), Headers(scope=scope), method=scope["method"], stat_result=stat_result)
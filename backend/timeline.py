@@ -0,0 +1,230 @@
+# Egységes családi idővonal: családi események, saját események, heti műszakok,
+# beosztott műszakok és az importált naptárak egyetlen, kezdési idő szerint
+# rendezett intervallumfolyamban. Forrásonként egy lekérdezés (ablakra szűrve,
+# időrendben), a források összefésülése k-utas merge-dzsel (heapq.merge).
+# Az eredmény családonként és ablakonként cache-elődik; a fingerprints.collect
+# ujjlenyomata (egy lekérdezés) dönti el, hogy még érvényes-e.
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from . import config, fingerprints, models, recurrence
+
+_TABLES = ("family_events", "user_events", "work_shifts", "shift_assignments", "shift_templates", "synced_events")
+
+
+class TimelineItem(NamedTuple):
+    start: datetime
+    end: datetime
+    source: str  # 'family_event', 'user_event', 'work_shift', 'shift_assignment', 'calendar'
+    source_id: int
+    title: str
+    user_id: Optional[int] = None  # személyes forrásnál a tag; családi eseménynél None
+    member_ids: Tuple[int, ...] = ()  # családi esemény résztvevői; üres = az egész család
+    kind: Optional[str] = None  # eseménytípus / 'shift' / a naptár integráció típusa
+    color: Optional[str] = None
+    location: Optional[str] = None
+    all_day: bool = False
+
+    def attendees(self, family_member_ids: Iterable[int]) -> Tuple[int, ...]:
+        if self.user_id is not None:
+            return (self.user_id,)
+        return self.member_ids or tuple(family_member_ids)
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def _sort_key(item: TimelineItem):
+    return item.start, item.end, item.source, item.source_id
+
+
+def _overlaps(start_column, end_column, window_start: datetime, window_end: datetime):
+    # Átfed az ablakkal; vég nélküli (pillanatszerű) elemnél a kezdet dönt
+    return and_(start_column < window_end, or_(end_column > window_start, start_column >= window_start))
+
+
+# --- Források: mindegyik egy lekérdezés, időrendben ---
+
+def _family_events(db: Session, family_id: int, window_start: datetime, window_end: datetime) -> List[TimelineItem]:
+    FamilyEvent = models.FamilyEvent
+    items = []
+    for event in db.query(FamilyEvent).filter(
+        FamilyEvent.family_id == family_id,
+        or_(and_(FamilyEvent.is_recurring == True, FamilyEvent.start_time < window_end),
+            _overlaps(FamilyEvent.start_time, FamilyEvent.end_time, window_start, window_end))
+    ):
+        rrule = recurrence.PATTERN_RRULE.get(event.recurrence_pattern or "") if event.is_recurring else None
+        member_ids = tuple(int(value) for value in (event.involves_members or "").split(",") if value.strip().isdigit())
+        for start, end in recurrence.occurrences(event.start_time, event.end_time or event.start_time, rrule, None,
+                                                 window_start, window_end):
+            items.append(TimelineItem(start, end, "family_event", event.id, event.title, None, member_ids,
+                                      event.event_type, event.color, event.location))
+    # Az ismétlődő események előfordulásai miatt itt kell rendezni
+    items.sort(key=_sort_key)
+    return items
+
+
+def _user_events(db: Session, user_ids: List[int], window_start: datetime, window_end: datetime) -> List[TimelineItem]:
+    UserEvent = models.UserEvent
+    return [
+        TimelineItem(event.start_time, event.end_time or event.start_time, "user_event", event.id, event.title,
+                     event.user_id, (), event.event_type, event.color)
+        for event in db.query(UserEvent).filter(
+            UserEvent.user_id.in_(user_ids),
+            _overlaps(UserEvent.start_time, UserEvent.end_time, window_start, window_end)
+        ).order_by(UserEvent.start_time, UserEvent.id)
+    ]
+
+
+def _work_shifts(db: Session, user_ids: List[int], window_start: datetime, window_end: datetime) -> List[TimelineItem]:
+    shifts = db.query(models.WorkShift).filter(
+        models.WorkShift.user_id.in_(user_ids),
+        models.WorkShift.is_active == True
+    ).all()
+    items = []
+    # Az előző nap éjszakás műszakja is belelóghat az ablakba
+    day = window_start.date() - timedelta(days=1)
+    while day < window_end.date() + timedelta(days=1):
+        weekday = str(day.weekday() + 1)  # Monday = 1
+        for shift in shifts:
+            if weekday not in shift.days_of_week.split(","):
+                continue
+            start, end = recurrence.shift_span(day, shift.start_time, shift.end_time)
+            if start < window_end and end > window_start:
+                items.append(TimelineItem(start, end, "work_shift", shift.id, shift.name, shift.user_id, (),
+                                          "shift", shift.color))
+        day += timedelta(days=1)
+    items.sort(key=_sort_key)
+    return items
+
+
+def _shift_assignments(db: Session, user_ids: List[int], window_start: datetime, window_end: datetime) -> List[TimelineItem]:
+    items = []
+    for assignment, template in db.query(models.ShiftAssignment, models.ShiftTemplate).join(
+        models.ShiftTemplate, models.ShiftAssignment.template_id == models.ShiftTemplate.id
+    ).filter(
+        models.ShiftAssignment.user_id.in_(user_ids),
+        models.ShiftAssignment.date >= window_start.date() - timedelta(days=1),
+        models.ShiftAssignment.date <= window_end.date(),
+        models.ShiftAssignment.status != "cancelled"
+    ).order_by(models.ShiftAssignment.date):
+        start, end = recurrence.shift_span(assignment.date, template.start_time, template.end_time)
+        if start < window_end and end > window_start:
+            items.append(TimelineItem(start, end, "shift_assignment", assignment.id, template.name, assignment.user_id,
+                                      (), "shift", template.color, template.location_details or template.location))
+    items.sort(key=_sort_key)
+    return items
+
+
+def _synced_events(db: Session, user_ids: List[int], window_start: datetime, window_end: datetime) -> List[TimelineItem]:
+    """ Importált naptárak: az ismétlődő sorozatokból csak az ablakba eső előfordulások. """
+    SyncedEvent, Integration = models.SyncedEvent, models.CalendarIntegration
+    rows = db.query(SyncedEvent, Integration.user_id, Integration.type).join(
+        Integration, SyncedEvent.calendar_integration_id == Integration.id
+    ).filter(
+        Integration.user_id.in_(user_ids),
+        Integration.sync_enabled == True,
+        or_(
+            # Egyszeri esemény (vagy módosított előfordulás), ami átfed az ablakkal
+            and_(SyncedEvent.rrule.is_(None),
+                 _overlaps(SyncedEvent.start_datetime, SyncedEvent.end_datetime, window_start, window_end)),
+            # Az ablak előtt indult, még nem lezárult sorozat
+            and_(SyncedEvent.rrule.isnot(None), SyncedEvent.start_datetime < window_end,
+                 or_(SyncedEvent.recurrence_end.is_(None), SyncedEvent.recurrence_end > window_start)),
+            # Az ablakba eső, de máshová áthelyezett előfordulás: a sorozatból ki kell hagyni
+            and_(SyncedEvent.recurrence_id >= window_start, SyncedEvent.recurrence_id < window_end),
+        )
+    ).all()
+
+    moved: Dict[tuple, set] = {}
+    for event, _, _ in rows:
+        if event.recurrence_id is not None:
+            uid = event.external_event_id.rpartition("#")[0]
+            moved.setdefault((event.calendar_integration_id, uid), set()).add(event.recurrence_id)
+
+    items = []
+    for event, user_id, integration_type in rows:
+        skip = frozenset(moved.get((event.calendar_integration_id, event.external_event_id), ()))
+        try:
+            for start, end in recurrence.occurrences(event.start_datetime, event.end_datetime, event.rrule,
+                                                     event.exdates, window_start, window_end,
+                                                     tzid=event.tzid, skip=skip):
+                items.append(TimelineItem(start, end, "calendar", event.id, event.title, user_id, (),
+                                          integration_type, None, event.location, event.is_all_day))
+        except ValueError:
+            # Hibás szabály: az esemény kimarad, a többi megjelenik
+            continue
+    items.sort(key=_sort_key)
+    return items
+
+
+# --- Összefésülés és cache ---
+
+_cache = fingerprints.FingerprintCache(config.TIMELINE_CACHE_ENTRIES)
+
+
+def build(db: Session, family_id: int, member_ids: List[int],
+          window_start: datetime, window_end: datetime) -> Tuple[TimelineItem, ...]:
+    """ Cache nélkül: forrásonként egy lekérdezés, majd k-utas összefésülés. """
+    sources = [
+        _family_events(db, family_id, window_start, window_end),
+        _user_events(db, member_ids, window_start, window_end),
+        _work_shifts(db, member_ids, window_start, window_end),
+        _shift_assignments(db, member_ids, window_start, window_end),
+        _synced_events(db, member_ids, window_start, window_end),
+    ]
+    return tuple(heapq.merge(*sources, key=_sort_key))
+
+
+def family_timeline(db: Session, family_id: int, window_start: datetime, window_end: datetime,
+                    member_ids: Optional[List[int]] = None) -> Tuple[TimelineItem, ...]:
+    """
+    A család idővonala az ablakban, időrendben. Változatlan forrásoknál a
+    cache-ből jön (egy ujjlenyomat lekérdezés); az eredmény nem módosítható.
+    """
+    if member_ids is None:
+        member_ids = [row.id for row in db.query(models.User.id).filter(models.User.family_id == family_id)]
+    member_ids = sorted(member_ids)
+    state = fingerprints.collect(db, family_id, member_ids, _TABLES)
+    fingerprint = (tuple(member_ids), tuple(sorted(state.items())))
+    key = (family_id, window_start, window_end)
+    items = _cache.get(key, fingerprint)
+    if items is None:
+        items = build(db, family_id, member_ids, window_start, window_end)
+        _cache.put(key, fingerprint, items)
+    return items
+
+
+def day_window(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def conflicts(items: Iterable[TimelineItem], member_ids: Iterable[int]) -> List[dict]:
+    """
+    Tagonként az egymással átfedő elemek párjai (söprés a rendezett folyamon).
+    Az egész napos és a pillanatszerű elemek nem ütköznek.
+    """
+    member_ids = tuple(member_ids)
+    active: Dict[int, List[TimelineItem]] = {}
+    found = []
+    for item in items:
+        if item.all_day or item.end <= item.start:
+            continue
+        for user_id in item.attendees(member_ids):
+            running = [other for other in active.get(user_id, ()) if other.end > item.start]
+            for other in running:
+                found.append({
+                    "user_id": user_id,
+                    "start": item.start,
+                    "end": min(item.end, other.end),
+                    "first": other.as_dict(),
+                    "second": item.as_dict(),
+                })
+            running.append(item)
+            active[user_id] = running
+    return found
@@ -0,0 +1,123 @@
+# Várható pénzmozgások (ismétlődő szabályok és tervezett kiadások) egy
+# időablakban, dátum szerint rendezve. Szabályonként minden ablakba eső
+# előfordulás megjelenik (nem csak a következő futás), ugyanazzal a léptetéssel,
+# amivel az ütemező a next_run_date-et viszi tovább. A források egyenként
+# rendezettek; az összefésülés k-utas merge (heapq.merge), a kimenet limitált.
+# Az eredmény családonként cache-elődik, amíg egy szabály vagy kiadás nem változik.
+import heapq
+from datetime import date, timedelta
+from itertools import islice
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy.orm import Session
+
+from . import config, fingerprints, models
+
+# A RecurringRule.frequency értékei léptetésként (az ütemező is ezt használja)
+RULE_STEPS = {
+    "napi": relativedelta(days=1),
+    "heti": relativedelta(weeks=1),
+    "havi": relativedelta(months=1),
+    "éves": relativedelta(years=1),
+}
+_TABLES = ("recurring_rules", "expected_expenses")
+
+
+class UpcomingItem(NamedTuple):
+    date: date
+    description: str
+    amount: object
+    type: str  # 'bevétel', 'kiadás', 'átutalás', 'tervezett kiadás'
+    owner_name: str
+    is_recurring: bool
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def rule_dates(start_date: Optional[date], next_run_date: date, frequency: str, end_date: Optional[date],
+               window_start: date, window_end: date) -> Iterator[date]:
+    """
+    Egy szabály futási napjai [window_start, window_end] között, időrendben.
+    Ismeretlen gyakoriságnál csak a következő futás.
+    """
+    current = max(next_run_date, start_date) if start_date else next_run_date
+    last = min(window_end, end_date) if end_date else window_end
+    step = RULE_STEPS.get(frequency)
+    if step is None:
+        if window_start <= current <= last:
+            yield current
+        return
+    # Az ütemező mindig az előző futásból lép tovább (hónap végén ez eltolódhat), ezért itt is
+    while current <= last:
+        if current >= window_start:
+            yield current
+        current += step
+
+
+def _rules(db: Session, members: dict, window_start: date, window_end: date) -> Iterator[UpcomingItem]:
+    RecurringRule = models.RecurringRule
+    streams = []
+    for rule in db.query(RecurringRule).filter(
+        RecurringRule.owner_id.in_(list(members)),
+        RecurringRule.is_active == True,
+        RecurringRule.next_run_date <= window_end
+    ).order_by(RecurringRule.next_run_date, RecurringRule.id):
+        streams.append([
+            UpcomingItem(day, rule.description, rule.amount, rule.type, members.get(rule.owner_id), True)
+            for day in rule_dates(rule.start_date, rule.next_run_date, rule.frequency, rule.end_date,
+                                  window_start, window_end)
+        ])
+    return heapq.merge(*streams, key=lambda item: item.date)
+
+
+def _expenses(db: Session, members: dict, window_start: date, window_end: date) -> Iterator[UpcomingItem]:
+    ExpectedExpense = models.ExpectedExpense
+    for expense in db.query(ExpectedExpense).filter(
+        ExpectedExpense.owner_id.in_(list(members)),
+        ExpectedExpense.status == 'tervezett',
+        ExpectedExpense.due_date.between(window_start, window_end)
+    ).order_by(ExpectedExpense.due_date, ExpectedExpense.id):
+        yield UpcomingItem(expense.due_date, expense.description, expense.estimated_amount, 'tervezett kiadás',
+                           members.get(expense.owner_id), expense.is_recurring)
+
+
+_cache = fingerprints.FingerprintCache(config.UPCOMING_CACHE_ENTRIES)
+
+
+def build(db: Session, members: dict, window_start: date, window_end: date) -> Tuple[UpcomingItem, ...]:
+    """ Cache nélkül: forrásonként egy lekérdezés, majd összefésülés (azonos napon a szabályok előbb). """
+    return tuple(heapq.merge(
+        _rules(db, members, window_start, window_end),
+        _expenses(db, members, window_start, window_end),
+        key=lambda item: item.date,
+    ))
+
+
+def upcoming_events(db: Session, user: models.User, limit: Optional[int] = None,
+                    days: Optional[int] = None) -> List[dict]:
+    """
+    A felhasználó (szülőnél az egész család) várható pénzmozgásai a következő
+    `days` napban, legfeljebb `limit` darab. Változatlan szabályoknál és
+    kiadásoknál a cache-ből jön (egy ujjlenyomat lekérdezés).
+    """
+    window_start = date.today()
+    window_end = window_start + timedelta(days=days or config.UPCOMING_DAYS)
+    if user.role in ["Családfő", "Szülő"] and user.family_id is not None:
+        member_filter = models.User.family_id == user.family_id
+    else:
+        member_filter = models.User.id == user.id
+    # A nevek is az ujjlenyomat részei: átnevezésnél a cache érvénytelen
+    members = tuple((member.id, member.display_name) for member in db.query(
+        models.User.id, models.User.display_name
+    ).filter(member_filter).order_by(models.User.id))
+    member_map = dict(members)
+    state = fingerprints.collect(db, user.family_id, list(member_map), _TABLES)
+    fingerprint = (tuple(members), tuple(sorted(state.items())))
+    key = (user.family_id, tuple(member_map), window_start, window_end)
+    items = _cache.get(key, fingerprint)
+    if items is None:
+        items = build(db, member_map, window_start, window_end)
+        _cache.put(key, fingerprint, items)
+    return [item.as_dict() for item in islice(items, limit or config.UPCOMING_LIMIT)]
@@ -0,0 +1,265 @@
+# Feltöltött képek kezelése: darabolt, eseményhurkot nem blokkoló mentés
+# menet közbeni méretkorláttal, és fix méretű WebP bélyegképek process poolban.
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from . import config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # opcionális: Pillow nélkül csak az eredeti kép kerül mentésre
+    Image = None
+    ImageOps = None
+
+AVATAR_UPLOAD_DIR = config.UPLOAD_ROOT / "avatars"
+AVATAR_URL_PREFIX = "/uploads/avatars"
+WISH_IMAGE_DIR = config.UPLOAD_ROOT / "wish_images"
+WISH_IMAGE_URL_PREFIX = "/uploads/wish_images"
+# A kívánság listák borítóképe: a hosszabbik oldal legfeljebb ekkora, képarány-tartó
+WISH_COVER_SIZE = 320
+IMAGE_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+CHUNK_SIZE = 1024 * 1024
+# A multipart boríték (határolók, fejlécek, többi mező) a fájlon felül
+MULTIPART_OVERHEAD = 64 * 1024
+THUMBNAIL_SIZES = (64, 128, 256)
+THUMBNAIL_QUALITY = 82
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def thumbnail_path(source: Path, size: int) -> Path:
+    """ 1_abc.jpeg -> 1_abc_64.webp, ugyanabban a könyvtárban. """
+    return source.with_name(f"{source.stem}_{size}.webp")
+
+
+async def save_upload(upload: UploadFile, destination: Path, max_bytes: int, hasher=None) -> int:
+    """
+    Darabonként kimásolja a feltöltést a célfájlba; a lemezírás threadpoolban
+    fut. A méretkorlátot másolás közben ellenőrizzük (a kliens által küldött
+    méretre nem hagyatkozunk), túllépéskor a félkész fájlt töröljük.
+    A `hasher` (pl. hashlib.sha256()) menet közben megkapja a tartalmat.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    handle = await run_in_threadpool(destination.open, "wb")
+    written = 0
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail=_too_large(max_bytes / (1024 * 1024)))
+            if hasher is not None:
+                hasher.update(chunk)
+            await run_in_threadpool(handle.write, chunk)
+    except BaseException:
+        await run_in_threadpool(handle.close)
+        await run_in_threadpool(destination.unlink, True)
+        raise
+    await run_in_threadpool(handle.close)
+    return written
+
+
+def _too_large(max_mb: float) -> str:
+    return f"A fájl mérete nem lehet nagyobb {max_mb:g}MB-nál"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Tiszta ASGI middleware a feltöltő végpontokra: a kérés törzsét a beérkezés
+    közben számolja, még mielőtt a multipart feldolgozás a teljes törzset
+    lemezre spoolozná. A Content-Length-re nem hagyatkozik (hiányozhat vagy
+    hazudhat), de ha az már túl nagy, azonnal 413-mal válaszol.
+    `limits`: (útvonal regex, MB) párok; a többi kérést érintetlenül továbbadja.
+    """
+
+    def __init__(self, app, limits: Sequence[Tuple[str, float]]):
+        self.app = app
+        self.limits = [(re.compile(pattern), max_mb) for pattern, max_mb in limits]
+
+    def _limit_for(self, path: str) -> Optional[float]:
+        for pattern, max_mb in self.limits:
+            if pattern.match(path):
+                return max_mb
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_mb = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if max_mb is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = int(max_mb * 1024 * 1024) + MULTIPART_OVERHEAD
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await JSONResponse({"detail": _too_large(max_mb)}, status_code=413)(scope, receive, send)
+            return
+
+        received, exceeded, started = 0, False, False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise HTTPException(status_code=413, detail=_too_large(max_mb))
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # Túllépés után az alkalmazás (esetleg 400-as "body parsing") válaszát a 413 váltja fel
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except HTTPException:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            await JSONResponse({"detail": _too_large(max_mb)}, status_code=413)(scope, receive, send)
+
+
+def _render_thumbnails(source: str, sizes: tuple, crop: bool = True) -> dict:
+    # A process poolban fut: csak picklézhető argumentumok és visszatérési érték
+    source_path = Path(source)
+    written = []
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size in sizes:
+            if crop:
+                thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            else:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.LANCZOS)
+            target = thumbnail_path(source_path, size)
+            thumbnail.save(target, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+            written.append(str(target))
+    return {"width": width, "height": height, "thumbnails": written}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=config.THUMBNAIL_WORKERS)
+    return _pool
+
+
+async def generate_thumbnails(source: Path, sizes: Iterable[int] = THUMBNAIL_SIZES, crop: bool = True) -> Optional[dict]:
+    """
+    Elkészíti a bélyegképeket egy külön folyamatban, hogy a képfeldolgozás
+    se az eseményhurkot, se a GIL-t ne foglalja. Visszaadja az eredeti kép
+    méretét és a bélyegképek útvonalát; Pillow nélkül None.
+    Nem értelmezhető képfájlnál 400-as hibát dob.
+    """
+    if Image is None:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), _render_thumbnails, str(source), tuple(sizes), crop)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="A feltöltött fájl nem értelmezhető képként.")
+
+
+def wish_image_path(content_hash: str, extension: str) -> Path:
+    """ Tartalom-címzett útvonal: azonos kép egyszer kerül a lemezre. """
+    return WISH_IMAGE_DIR / content_hash[:2] / f"{content_hash}.{extension}"
+
+
+def upload_url(path: Path) -> str:
+    return "/uploads/" + path.relative_to(config.UPLOAD_ROOT).as_posix()
+
+
+def store_wish_image_bytes(data: bytes, extension: str):
+    """
+    Már memóriában lévő kép (pl. base64) mentése a tartalom-címzett tárba.
+    Visszaadja: (content_hash, path, byte_size).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = wish_image_path(content_hash, extension)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+    return content_hash, path, len(data)
+
+
+async def save_wish_image_upload(upload: UploadFile, max_bytes: int):
+    """
+    Feltöltött kép mentése a tartalom-címzett tárba: ideiglenes fájlba
+    streamelünk, közben hash-elünk, majd a hash szerinti helyre tesszük.
+    Ha a kép már megvan, az új példányt eldobjuk (deduplikáció).
+    Visszaadja: (content_hash, path, byte_size, created); created=True, ha a
+    fájl most került a tárba (hiba esetén a hívó ilyenkor eltávolíthatja).
+    """
+    extension = IMAGE_EXTENSIONS.get(upload.content_type)
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Csak kép fájlokat lehet feltölteni (JPEG, PNG, GIF, WebP)")
+
+    WISH_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    temporary = WISH_IMAGE_DIR / f".{uuid.uuid4().hex}.tmp"
+    hasher = hashlib.sha256()
+    byte_size = await save_upload(upload, temporary, max_bytes, hasher=hasher)
+    content_hash = hasher.hexdigest()
+    path = wish_image_path(content_hash, extension)
+
+    def _place() -> bool:
+        if path.exists():
+            temporary.unlink(missing_ok=True)
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temporary, path)
+        return True
+
+    created = await run_in_threadpool(_place)
+    return content_hash, path, byte_size, created
+
+
+def remove_with_thumbnails(source: Path, sizes: Iterable[int] = THUMBNAIL_SIZES):
+    """ Törli az eredeti fájlt és a bélyegképeit; a hiányzó fájlokat kihagyja. """
+    for path in (source, *(thumbnail_path(source, size) for size in sizes)):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def resolve_avatar(filename: str, size: Optional[int] = None) -> Optional[Path]:
+    """
+    A kért méretű bélyegkép, ha létezik, különben az eredeti; None, ha egyik sincs.
+    A fájlnév nem tartalmazhat könyvtárat.
+    """
+    if Path(filename).name != filename:
+        return None
+    original = AVATAR_UPLOAD_DIR / filename
+    if size in THUMBNAIL_SIZES:
+        thumbnail = thumbnail_path(original, size)
+        if thumbnail.is_file():
+            return thumbnail
+    return original if original.is_file() else None
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,20 +1,36 @@
 import React from 'react';
 import { Link } from 'react-router-dom';
-import { AlertCircle, ChevronRight } from 'lucide-react';
+import { AlertCircle, ChevronRight, X } from 'lucide-react';
 
-function NotificationBar({ notifications }) {
+// onRead(notification): a megnyitott vagy elvetett értesítés olvasottnak jelölése
+function NotificationBar({ notifications, onRead }) {
   if (!notifications || notifications.length === 0) {
     return null; // Ha nincs értesítés, nem jelenítünk meg semmit
   }
 
+  const handleDismiss = (event, notif) => {
+    // A gomb a linken belül van: ne navigáljon
+    event.preventDefault();
+    event.stopPropagation();
+    onRead?.(notif);
+  };
+
   return (
     <div className="notification-container">
-      {notifications.map((notif, index) => (
-        <Link to={notif.link} key={index} className="notification-bar">
+      {notifications.map((notif) => (
+        <Link to={notif.link || '#'} key={notif.id} className="notification-bar" onClick={() => onRead?.(notif)}>
           <div className="notification-icon">
             <AlertCircle size={20} />
           </div>
           <p className="notification-message">{notif.message}</p>
+          <button
+            type="button"
+            className="notification-dismiss"
+            aria-label="Értesítés elvetése"
+            onClick={(event) => handleDismiss(event, notif)}
+          >
+            <X size={18} />
+          </button>
           <div className="notification-action">
             <ChevronRight size={20} />
           </div>
@@ -24,4 +40,4 @@ function NotificationBar({ notifications }) {
   );
 }
 
-export default NotificationBar;
\ No newline at end of file
+export default NotificationBar;
@@ -110,7 +110,7 @@ function WishCard({ wish, currentUser, onSubmit, onApproveClick, onHistoryClick,
       {/* Média (VÁLTOZATLAN) */}
       {wish.images && wish.images.length > 0 && (
         <div className="wish-media">
-          <img src={wish.images[0].image_url} alt={wish.name} className="wish-image" />
+          <img src={wish.images[0].thumbnail_url || wish.images[0].image_url} alt={wish.name} className="wish-image" />
         </div>
       )}
       
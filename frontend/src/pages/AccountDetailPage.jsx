@@ -167,7 +167,7 @@ function AccountDetailPage() {
         setIsLoading(true);
         try {
             const [accRes, transRes, catRes] = await Promise.all([
-                fetch(`${apiUrl}/api/accounts/${accountId}`, { headers: { 'Authorization': `Bearer ${token}` } }),
+                fetch(`${apiUrl}/api/accounts/${accountId}?expand=history`, { headers: { 'Authorization': `Bearer ${token}` } }),
                 fetch(`${apiUrl}/api/transactions?account_id=${accountId}`, { headers: { 'Authorization': `Bearer ${token}` } }),
                 fetch(`${apiUrl}/api/categories`, { headers: { 'Authorization': `Bearer ${token}` } })
             ]);
@@ -493,6 +493,20 @@ const DashboardPage = () => {
       }
     }, [apiUrl, token]);
   
+    const markNotificationRead = async (notification) => {
+      // Azonnal eltűnik a sávból; a szerver oldali jelölés a háttérben megy
+      setNotifications(current => current.filter(item => item.id !== notification.id));
+      try {
+        await fetch(`${apiUrl}/api/notifications/read`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' },
+          body: JSON.stringify({ ids: [notification.id] })
+        });
+      } catch (err) {
+        console.error('Értesítés olvasottnak jelölése sikertelen:', err);
+      }
+    };
+
     const handleOpenTransactionModal = (type, accountId, accountName) => {
         setModalConfig({ type, accountId, accountName });
         setTransactionModalOpen(true);
@@ -566,7 +580,7 @@ const DashboardPage = () => {
   
     return (
         <div className="dashboard-container">
-            <NotificationBar notifications={notifications} />
+            <NotificationBar notifications={notifications} onRead={markNotificationRead} />
 
             <section className="dashboard-section">
               <h2 className="section-title">Pénzügyi Áttekintés</h2>